@@ -0,0 +1,280 @@
+"""Streaming analyzer of router logs
+
+Reads the logs written by io.print_log, one file per router, such as the
+logs/dv, logs/ls and logs/ls-centralize directories, in a single pass:
+the files are merged by timestamp with heapq.merge and only a few
+counters and the current routing table of each router are kept, so the
+memory doesn't grow with the size of the logs.
+
+    $ python3 analyzeMain.py ../logs/ls
+    $ python3 analyzeMain.py ../logs/dv/*.log --session-gap 300
+
+Lines look like `[A] [21:08:53] [Neighbors] [INFO] ...`, the file name
+stands for the hostname when a line has none. Lines carry no date, so a
+file going back in time is taken to have crossed midnight, and files
+starting on both sides of midnight are aligned on the largest gap between
+their start times. The merged timeline is cut into sessions where nothing
+is logged for `--session-gap` seconds.
+"""
+import argparse
+import ast
+import gzip
+import heapq
+import json
+import os
+import re
+
+DAY = 24 * 3600
+
+# the hostname is only there when the router had a gui view
+LINE = re.compile(r'^(?:\[([^\]]+)\] )?\[(\d\d:\d\d:\d\d)\] \[(\w+)\] (.*)$')
+FRAME_TYPE = re.compile(r"'type': '(\w+)'")
+# LS, the centralized member and the controller recompute their shortest
+# paths before logging this, DV logs its new vector as 'routing table'
+SPF_TABLE = 'update routing table: '
+DV_TABLE = 'routing table: '
+
+
+def open_log(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', errors='replace')
+    return open(path, errors='replace')
+
+
+def first_time(path):
+    """
+    Returns:
+        int: seconds since midnight of the first line of `path`, None if no
+             line parses
+    """
+    with open_log(path) as f:
+        for line in f:
+            match = LINE.match(line)
+            if match is not None:
+                return seconds(match.group(2))
+    return None
+
+
+def seconds(text, _cache={}):
+    """
+    Args:
+        text: 'HH:MM:SS'
+    """
+    t = _cache.get(text)
+    if t is None:
+        t = _cache[text] = int(text[0:2]) * 3600 + int(text[3:5]) * 60 + \
+            int(text[6:8])
+    return t
+
+
+def start_days(paths):
+    """
+    Returns:
+        dict[str, int]: day each file starts on, 0 or 1, the timeline
+                        starting after the largest gap between start times
+    """
+    starts = {path: first_time(path) for path in paths}
+    times = sorted(t for t in starts.values() if t is not None)
+    if len(times) == 0:
+        return {path: 0 for path in paths}
+    gaps = [(times[i] - times[i - 1]) % DAY for i in range(len(times))]
+    origin = times[gaps.index(max(gaps))] if len(times) > 1 else times[0]
+    return {path: 1 if t is not None and t < origin else 0
+            for path, t in starts.items()}
+
+
+def events(path, day):
+    """
+    Yields:
+        (time, hostname, module, message), time in seconds from the
+        midnight before the first line of the earliest file
+    """
+    last = None
+    default = os.path.basename(path).split('.')[0]
+    with open_log(path) as f:
+        for line in f:
+            match = LINE.match(line.rstrip('\n'))
+            if match is None:
+                continue
+            hostname, text, module, message = match.groups()
+            t = seconds(text)
+            if last is not None and t < last - DAY / 2:
+                day += 1
+            last = t
+            yield day * DAY + t, hostname or default, module, message
+
+
+def table_of(text):
+    """
+    Returns:
+        dict: {destination: (next, cost)}, None if `text` doesn't parse
+    """
+    try:
+        table = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return None
+    return {destination: (entry['next'], entry['cost'])
+            for destination, entry in table.items()}
+
+
+def clock(t):
+    t = int(t) % DAY
+    return '{:02d}:{:02d}:{:02d}'.format(t // 3600, t // 60 % 60, t % 60)
+
+
+class Session:
+    """
+    counters of a stretch of the merged timeline
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.lines = 0
+        self.modules = {}
+        self.frames_sent = {}
+        self.frames_received = {}
+        self.last_change = None
+        # self.routers = {hostname: counters}, see _router
+        self.routers = {}
+
+    def _router(self, hostname):
+        router = self.routers.get(hostname)
+        if router is None:
+            router = self.routers[hostname] = {
+                'lines': 0,
+                'spf': 0,
+                'dv': 0,
+                'table_changes': 0,
+                'text': None,
+                'table': None,
+                'since': None
+            }
+        return router
+
+    def add(self, t, hostname, module, message):
+        self.end = t
+        self.lines += 1
+        self.modules[module] = self.modules.get(module, 0) + 1
+        router = self._router(hostname)
+        router['lines'] += 1
+
+        if module == 'Transport':
+            frame_type = FRAME_TYPE.search(message)
+            if frame_type is not None:
+                if message.startswith('[INFO] Sending'):
+                    counts = self.frames_sent
+                elif message.startswith('[INFO] Receive data'):
+                    counts = self.frames_received
+                else:
+                    return
+                counts[frame_type.group(1)] = \
+                    counts.get(frame_type.group(1), 0) + 1
+        elif module == 'NeighborTable':
+            if message.startswith('[INFO] set host') or \
+                    message.endswith('deleted from local table'):
+                self.last_change = t
+        elif module == 'Algorithm':
+            if message.startswith(SPF_TABLE):
+                router['spf'] += 1
+                self._table(router, t, message[len(SPF_TABLE):])
+            elif message.startswith(DV_TABLE):
+                router['dv'] += 1
+                self._table(router, t, message[len(DV_TABLE):])
+
+    def _table(self, router, t, text):
+        # most recomputations log the same table again, skip parsing those
+        if text == router['text']:
+            return
+        router['text'] = text
+        table = table_of(text)
+        if table is None or table == router['table']:
+            return
+        router['table'] = table
+        router['since'] = t
+        router['table_changes'] += 1
+
+    def report(self):
+        reached = [router['since'] for router in self.routers.values()
+                   if router['since'] is not None]
+        converged = max(reached) if len(reached) != 0 else None
+        return {
+            'start': clock(self.start),
+            'end': clock(self.end),
+            'duration': self.end - self.start,
+            'lines': self.lines,
+            'lines_per_module': self.modules,
+            'frames_sent': self.frames_sent,
+            'frames_received': self.frames_received,
+            'last_topology_change': clock(self.last_change)
+            if self.last_change is not None else None,
+            'converged_at': clock(converged) if converged is not None
+            else None,
+            'convergence_time': converged - self.start
+            if converged is not None else None,
+            'convergence_after_last_change':
+                max(0, converged - self.last_change)
+                if converged is not None and self.last_change is not None
+                else None,
+            'routers': {
+                hostname: {
+                    'lines': router['lines'],
+                    'spf_runs': router['spf'],
+                    'dv_runs': router['dv'],
+                    'table_changes': router['table_changes'],
+                    'final_table_at': clock(router['since'])
+                    if router['since'] is not None else None,
+                    'final_table_size': len(router['table'])
+                    if router['table'] is not None else None
+                }
+                for hostname, router in sorted(self.routers.items())
+            }
+        }
+
+
+def analyze(paths, session_gap=600):
+    """
+    Returns:
+        list<dict>: report of each session, in time order
+    """
+    days = start_days(paths)
+    merged = heapq.merge(*[events(path, days[path]) for path in paths],
+                         key=lambda event: event[0])
+    sessions = []
+    session = None
+    for t, hostname, module, message in merged:
+        if session is None or t - session.end > session_gap:
+            session = Session(t)
+            sessions.append(session)
+        session.add(t, hostname, module, message)
+    return [session.report() for session in sessions]
+
+
+def log_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name)
+                            for name in os.listdir(path)
+                            if name.endswith('.log') or name.endswith('.log.gz'))
+        else:
+            files.append(path)
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Analyze router logs in one streaming pass')
+    parser.add_argument('paths', nargs='+',
+                        help='log files, or directories of .log files')
+    parser.add_argument('--session-gap', type=float, default=600,
+                        help='seconds without any line that start a new '
+                             'session')
+    args = parser.parse_args()
+
+    print(json.dumps(analyze(log_files(args.paths), args.session_gap),
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Bulk transfer throughput
+
+A payload is sent with Message's bulk mode along a chain of routers
+running in the in-process harness, and the benchmark reports the
+throughput, the retransmissions and the final round-trip estimate.
+
+    $ cd src
+    $ python3 -m benchmark.bulk --size 100 --hops 4 --virtual
+    $ python3 -m benchmark.bulk --size 10 --hops 3 --loss 0.02 --virtual
+
+With --virtual the throughput is in protocol time, set by the window, the
+link delays and the impairments, the wall time then shows what the
+python side costs.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from routing import bulk, io, topology
+from routing.clock import VirtualClock
+from routing.harness import Harness
+from routing.impairment import Impairment
+
+
+def chain(hops, update_interval=5, dead_timeout=120):
+    """
+    Returns:
+        Topology: routers r0 ... r<hops> linked in a line
+    """
+    names = ['r{}'.format(i) for i in range(hops + 1)]
+    return topology.Topology({
+        'algorithm': 'LS',
+        'update_interval': update_interval,
+        'dead_timeout': dead_timeout,
+        'routers': names,
+        'links': [[names[i], names[i + 1], 1] for i in range(hops)]
+    })
+
+
+def run(size, hops, virtual=True, window=bulk.WINDOW, impairment=None,
+        receive_dir=None, timeout=3600):
+    """
+    Args:
+        size: bytes to transfer
+        impairment(Impairment): applied to every link, None for clean links
+        receive_dir: directory the payload is written to, memory if None
+    Returns:
+        dict: stats of the transfer, see Bulk.send
+    """
+    topo = chain(hops)
+    if impairment is not None:
+        topo.impairments = {(a, b): impairment.to_dict()
+                            for a, b, _ in topo.links()}
+    harness = Harness(topo, clock=VirtualClock() if virtual else None)
+    harness.build()
+    src, dest = harness.routers['r0'], harness.routers['r{}'.format(hops)]
+    src.message.bulk._window = window
+    dest.message.bulk.receive_dir = receive_dir
+    harness.start()
+    if harness.wait_converged(600) is None:
+        return {'error': 'not converged'}
+
+    received = []
+    dest.message.bulk.on_receive(
+        lambda _, __, payload: received.append(payload))
+    result = {}
+    payload = os.urandom(size)
+    wall = time.time()
+    cpu = time.process_time()
+    src.send_bulk(dest.hostname, payload,
+                  on_done=lambda _, ok, stats: result.update(stats, ok=ok))
+    start = harness.clock.time()
+    while len(result) == 0 and harness.clock.time() - start < timeout:
+        harness.wait(0.5)
+    result.update({
+        'hops': hops,
+        'window': window,
+        'wall_time': time.time() - wall,
+        'cpu_time': time.process_time() - cpu,
+        'impairment': impairment.to_dict() if impairment is not None
+        else None
+    })
+    if len(received) != 0:
+        data = received[0]
+        if isinstance(data, str):
+            with open(data, 'rb') as f:
+                data = f.read()
+        result['intact'] = data == payload
+    harness.stop()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk transfer benchmark')
+    parser.add_argument('--size', type=float, default=100,
+                        help='megabytes to transfer')
+    parser.add_argument('--hops', type=int, default=4)
+    parser.add_argument('--window', type=int, default=bulk.WINDOW,
+                        help='chunks in flight')
+    parser.add_argument('--virtual', action='store_true',
+                        help='run on a virtual clock')
+    parser.add_argument('--to-file', action='store_true',
+                        help='stream the payload to a temporary file '
+                             'instead of memory')
+    parser.add_argument('--loss', type=float, default=0)
+    parser.add_argument('--delay', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--reorder', type=float, default=0)
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='bytes per second of every link')
+    args = parser.parse_args()
+
+    io.set_quiet(True)
+    impairment = Impairment(args.loss, args.delay, args.jitter, args.reorder,
+                            bandwidth=args.bandwidth)
+    if impairment.to_dict() == Impairment().to_dict():
+        impairment = None
+    with tempfile.TemporaryDirectory() as receive_dir:
+        result = run(int(args.size * 1024 * 1024), args.hops, args.virtual,
+                     args.window, impairment,
+                     receive_dir if args.to_file else None)
+    print(json.dumps(result, indent=2))
+    # timers of the algorithms keep rescheduling themselves
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""Convergence and overhead benchmark across algorithms and topologies
+
+Every run builds a generated topology in the in-process harness on a
+virtual clock, plays one scenario and reports, as json, how long the
+routing tables took to converge in protocol seconds, how many control
+datagrams and bytes were sent, and how much cpu each router used.
+
+    $ cd src
+    $ python3 -m benchmark.convergence --shapes ring grid --sizes 16 36 \\
+          --algorithms LS DV LS_CENTRALIZE --scenarios cold-start link-failure
+
+Scenarios other than cold-start first wait for the cold start to converge,
+then measure only what follows the event. The link failed or re-costed is
+on a shortest path, and a run whose event leaves every routing table
+right reports an error instead of a convergence time of 0. Runs are
+deterministic for a given seed.
+
+Every link can be impaired the same way, to see how the algorithms and
+the neighbor handshakes cope with bad links:
+
+    $ python3 -m benchmark.convergence --loss 0.1 --delay 0.05 --jitter 0.02
+"""
+import argparse
+import json
+import random
+import time
+from routing import io, topology
+from routing.clock import VirtualClock
+from routing.harness import Harness
+from routing.impairment import Impairment
+from routing.router import Router
+
+
+class Meter:
+    """
+    cpu time, datagrams and bytes per router
+    """
+
+    def __init__(self):
+        self.cpu = {}
+        self.datagrams = {}
+        self.bytes = {}
+
+    def reset(self):
+        self.cpu = {hostname: 0.0 for hostname in self.cpu}
+        self.datagrams = {hostname: 0 for hostname in self.datagrams}
+        self.bytes = {hostname: 0 for hostname in self.bytes}
+
+    def add(self, hostname):
+        self.cpu[hostname] = 0.0
+        self.datagrams[hostname] = 0
+        self.bytes[hostname] = 0
+
+    def run(self, hostname, callback, *args):
+        start = time.process_time()
+        try:
+            return callback(*args)
+        finally:
+            self.cpu[hostname] += time.process_time() - start
+
+    def sent(self, hostname, payload):
+        self.datagrams[hostname] += 1
+        self.bytes[hostname] += len(payload)
+
+
+class _MeteredClock:
+    """
+    a router's view of the shared clock, charging its callbacks to it
+    """
+
+    def __init__(self, clock, meter, hostname):
+        self._clock = clock
+        self._meter = meter
+        self._hostname = hostname
+        self.virtual = clock.virtual
+
+    def time(self):
+        return self._clock.time()
+
+    def call_later(self, delay, callback, *args):
+        return self._clock.call_later(
+            delay, self._meter.run, self._hostname, callback, *args)
+
+
+class _MeteredBackend:
+    """
+    a router's view of the shared network, charging deliveries and sends
+    to it
+    """
+
+    def __init__(self, backend, meter, hostname):
+        self._backend = backend
+        self._meter = meter
+        self._hostname = hostname
+        self.scheduled = backend.scheduled
+
+    def listen(self, address, callback=None):
+        def deliver(payload, src):
+            self._meter.run(self._hostname, callback, payload, src)
+        return self._backend.listen(address, deliver)
+
+    def socket(self):
+        return _MeteredEndpoint(self._backend.socket(), self._meter,
+                                self._hostname)
+
+
+class _MeteredEndpoint:
+    def __init__(self, endpoint, meter, hostname):
+        self._endpoint = endpoint
+        self._meter = meter
+        self._hostname = hostname
+
+    def sendto(self, payload, address):
+        self._meter.sent(self._hostname, payload)
+        return self._endpoint.sendto(payload, address)
+
+    def close(self):
+        self._endpoint.close()
+
+
+class MeteredHarness(Harness):
+    def __init__(self, topology):
+        super(MeteredHarness, self).__init__(topology, clock=VirtualClock())
+        self.meter = Meter()
+
+    def make_router(self, hostname):
+        self.meter.add(hostname)
+        return Router(
+            self.topology.config(hostname),
+            _MeteredBackend(self.network.backend(), self.meter, hostname),
+            _MeteredClock(self.clock, self.meter, hostname))
+
+
+def _links(topo):
+    # links between members, a controller link isn't a routing link
+    return [link for link in topo.links()
+            if topo.controller not in (link[0], link[1])]
+
+
+def _on_shortest_path(topo, link):
+    # a link as cheap as the shortest path between its ends is on it, any
+    # route through it is affected when it fails or changes cost
+    a, b, cost = link
+    return topo.expected_costs(a).get(b) == cost
+
+
+def link_failure(harness, rand):
+    candidates = [link for link in _links(harness.topology)
+                  if harness.topology.is_connected(without=(link[0], link[1]))
+                  and _on_shortest_path(harness.topology, link)]
+    if len(candidates) == 0:
+        return None
+    a, b, _ = rand.choice(candidates)
+    harness.fail_link(a, b)
+    return {'link': [a, b]}
+
+
+def cost_change(harness, rand):
+    links = [link for link in _links(harness.topology)
+             if _on_shortest_path(harness.topology, link)]
+    if len(links) == 0:
+        return None
+    a, b, cost = rand.choice(links)
+    new_cost = rand.choice([c for c in range(1, 11) if c != cost])
+    harness.set_cost(a, b, new_cost)
+    return {'link': [a, b], 'cost': [cost, new_cost]}
+
+
+def node_crash(harness, rand):
+    candidates = []
+    for hostname in sorted(harness.routers):
+        if hostname == harness.topology.controller:
+            continue
+        rest = topology.Topology(harness.topology.to_dict())
+        rest.remove_router(hostname)
+        if rest.is_connected():
+            candidates.append(hostname)
+    if len(candidates) == 0:
+        return None
+    hostname = rand.choice(candidates)
+    harness.crash(hostname)
+    return {'router': hostname}
+
+
+SCENARIOS = {
+    'cold-start': None,
+    'link-failure': link_failure,
+    'cost-change': cost_change,
+    'node-crash': node_crash
+}
+
+
+def _summary(values):
+    values = list(values)
+    if len(values) == 0:
+        return {'total': 0, 'mean': 0, 'max': 0}
+    return {'total': sum(values), 'mean': sum(values) / len(values),
+            'max': max(values)}
+
+
+def _impaired(harness):
+    """
+    Returns:
+        dict: counters of every impaired link summed, since the start
+    """
+    total = {}
+    for router in harness.routers.values():
+        for stats in router.transport.impairment_stats().values():
+            for key, value in stats.items():
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+def run(shape, size, algorithm, scenario, seed=0, timeout=600, poll=0.1,
+        update_interval=5, dead_timeout=120, impairment=None):
+    """
+    Args:
+        impairment(Impairment): applied to every link, None for clean links
+    Returns:
+        dict: the result of one run, convergence_time is None when the
+              tables didn't converge within `timeout` protocol seconds
+    """
+    topo = topology.generate(shape, size, algorithm, seed,
+                             update_interval=update_interval,
+                             dead_timeout=dead_timeout)
+    if impairment is not None:
+        topo.impairments = {(a, b): impairment.to_dict()
+                            for a, b, _ in topo.links()}
+    harness = MeteredHarness(topo)
+    result = {
+        'shape': shape,
+        'size': size,
+        'algorithm': algorithm,
+        'scenario': scenario,
+        'seed': seed,
+        'links': len(_links(topo)),
+        'impairment': impairment.to_dict() if impairment is not None
+        else None
+    }
+
+    wall = time.time()
+    harness.build()
+    harness.start()
+    converged = harness.wait_converged(timeout, poll)
+
+    event = SCENARIOS[scenario]
+    if event is not None:
+        if converged is None:
+            result['error'] = 'cold start did not converge'
+            return result
+        harness.meter.reset()
+        datagrams = harness.network.stats['datagrams']
+        bytes_ = harness.network.stats['bytes']
+        result['event'] = event(harness, random.Random(seed))
+        if result['event'] is None:
+            result['error'] = 'no event possible in this topology'
+            return result
+        if len(harness.unconverged()) == 0:
+            # nothing to measure, and nothing to count in the totals
+            result['error'] = 'event changed no route'
+            return result
+        converged = harness.wait_converged(timeout, poll)
+    else:
+        datagrams = bytes_ = 0
+
+    meter = harness.meter
+    routers = sorted(harness.routers)
+    result.update({
+        'converged': converged is not None,
+        'convergence_time': round(converged, 3) if converged is not None
+        else None,
+        'unconverged': len(harness.unconverged()),
+        'control_datagrams': harness.network.stats['datagrams'] - datagrams,
+        'control_bytes': harness.network.stats['bytes'] - bytes_,
+        'datagrams_per_router': _summary(
+            meter.datagrams[hostname] for hostname in routers),
+        'bytes_per_router': _summary(
+            meter.bytes[hostname] for hostname in routers),
+        'cpu_per_router': _summary(
+            meter.cpu[hostname] for hostname in routers),
+        'impaired': _impaired(harness),
+        'events': harness.clock.processed,
+        'wall_time': time.time() - wall
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convergence and overhead benchmark')
+    parser.add_argument('--shapes', nargs='+', default=['ring', 'grid'],
+                        choices=sorted(topology.SHAPES))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[16])
+    parser.add_argument('--algorithms', nargs='+',
+                        default=['LS', 'DV', 'LS_CENTRALIZE'],
+                        choices=['LS', 'DV', 'LS_CENTRALIZE'])
+    parser.add_argument('--scenarios', nargs='+', default=sorted(SCENARIOS),
+                        choices=sorted(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='protocol seconds to wait for convergence')
+    parser.add_argument('--update-interval', type=int, default=5)
+    parser.add_argument('--dead-timeout', type=int, default=120,
+                        help='DV hears of a host one update interval per '
+                             'hop, keep it above diameter * interval')
+    parser.add_argument('--loss', type=float, default=0,
+                        help='probability a datagram is lost on a link')
+    parser.add_argument('--delay', type=float, default=0,
+                        help='seconds added on every link')
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--reorder', type=float, default=0,
+                        help='probability a datagram overtakes the others')
+    parser.add_argument('--duplicate', type=float, default=0)
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='bytes per second of every link')
+    parser.add_argument('--output', type=str, default=None,
+                        help='write the results to a file instead of stdout')
+    args = parser.parse_args()
+
+    io.set_quiet(True)
+    impairment = Impairment(args.loss, args.delay, args.jitter, args.reorder,
+                            args.duplicate, args.bandwidth)
+    if impairment.to_dict() == Impairment().to_dict():
+        impairment = None
+    results = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            for algorithm in args.algorithms:
+                for scenario in args.scenarios:
+                    results.append(run(
+                        shape, size, algorithm, scenario, args.seed,
+                        args.timeout, update_interval=args.update_interval,
+                        dead_timeout=args.dead_timeout,
+                        impairment=impairment))
+
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Transit forwarding rate against forwarding workers
+
+One hub router sits between `--flows` senders and as many receivers. The
+senders and receivers are bare addresses on an in-memory network, so the
+only router doing work is the hub. Frames from every sender to every
+receiver are pushed into the hub as fast as the network takes them. The
+benchmark reports, as json, how many frames per second the hub forwards
+for each number of forwarding workers.
+
+    $ cd src
+    $ python3 -m benchmark.forwarding --workers 0 1 2 4 8 --frames 50000
+
+Workers are threads of one interpreter, they keep each flow in order and
+take forwarding off the listening thread, but routing and encoding a
+frame is python code holding the GIL, so the rate doesn't grow with the
+cores.
+"""
+import argparse
+import json
+import os
+import time
+from routing import io, topology
+from routing.backend import MemoryNetwork
+from routing.router import Router
+
+
+def dumbbell(flows):
+    """
+    Returns:
+        Topology: a hub linked to senders s0... and receivers d0...
+    """
+    senders = ['s{}'.format(i) for i in range(flows)]
+    receivers = ['d{}'.format(i) for i in range(flows)]
+    return topology.Topology({
+        'algorithm': 'LS',
+        'routers': ['hub'] + senders + receivers,
+        'links': [['hub', name, 1] for name in senders + receivers]
+    })
+
+
+def frames_of(flows, count, padding):
+    """
+    Returns:
+        list<bytes>: `count` frames to the hub, cycling through every
+                     (sender, receiver) pair
+    """
+    pairs = [('s{}'.format(i), 'd{}'.format(j))
+             for i in range(flows) for j in range(flows)]
+    frames = []
+    for n in range(count):
+        src, dest = pairs[n % len(pairs)]
+        frames.append(json.dumps({
+            'next_name': 'hub',
+            'last_name': src,
+            'broadcasting': False,
+            'visited': [],
+            'datagram': {
+                'src': src,
+                'dest': dest,
+                'passed_by': [src],
+                'data': {'type': 'Forwarding', 'data': {
+                    'seq': n, 'pad': 'x' * padding}}
+            }
+        }).encode())
+    return frames
+
+
+def run(workers, flows=8, count=50000, padding=64, timeout=120):
+    """
+    Returns:
+        dict: frames forwarded, seconds, frames per second and drops
+    """
+    topo = dumbbell(flows)
+    network = MemoryNetwork()
+    hub = Router(topo.config('hub'), network.backend(),
+                 forward_workers=workers)
+    mapping = dict(topo.routers)
+    mapping['hns'] = topo.hns
+    hub.transport.update_mapping(mapping)
+    hub.routing_table.update({
+        hostname: {'next': hostname, 'cost': 1}
+        for hostname in topo.routers})
+    sinks = [network.bind(topo.routers['d{}'.format(i)])
+             for i in range(flows)]
+    frames = frames_of(flows, count, padding)
+    source = topo.routers['s0']
+    hub.dispatcher.run()
+    hub.transport.run()
+
+    start = time.perf_counter()
+    for frame in frames:
+        network.deliver(frame, source, topo.routers['hub'])
+    while sum(sink.qsize() for sink in sinks) + \
+            hub.transport.forward_drops < count and \
+            time.perf_counter() - start < timeout:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    forwarded = sum(sink.qsize() for sink in sinks)
+    hub.transport.stop()
+    hub.dispatcher.stop()
+    return {
+        'workers': workers,
+        'flows': flows * flows,
+        'forwarded': forwarded,
+        'dropped': hub.transport.forward_drops,
+        'seconds': elapsed,
+        'pps': forwarded / elapsed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Transit forwarding rate against forwarding workers')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[0, 1, 2, 4, 8])
+    parser.add_argument('--flows', type=int, default=8,
+                        help='senders, and receivers, of the dumbbell')
+    parser.add_argument('--frames', type=int, default=50000)
+    parser.add_argument('--padding', type=int, default=64,
+                        help='bytes of payload per frame')
+    args = parser.parse_args()
+
+    io.set_quiet(True)
+    results = [run(workers, args.flows, args.frames, args.padding)
+               for workers in args.workers]
+    print(json.dumps({'cpus': os.cpu_count(), 'results': results}, indent=2))
+    # the listening threads of the hubs block on their queues
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
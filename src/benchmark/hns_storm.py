@@ -0,0 +1,81 @@
+"""Startup storm benchmark for the hostname server
+
+N hosts register with the hns at the same moment, the benchmark reports
+how long it takes until every host can resolve every other host and how
+many datagrams the hns handled.
+
+    $ cd src
+    $ python3 -m benchmark.hns_storm --hosts 500 --mode batch
+"""
+import argparse
+import json
+import os
+import time
+from routing import hns, io
+from routing.dispatcher import DataDispatcher
+from routing.transport import Transport
+
+
+def make_hosts(n, ip, base_port, hns_ip, hns_port):
+    hosts = []
+    for i in range(n):
+        hosts.append(Transport('host{}'.format(i), ip, base_port + i,
+                               hns_ip, hns_port, None, DataDispatcher(), None))
+    return hosts
+
+
+def resolved(host, n):
+    # every host plus the hns itself
+    return len(host._mapping_table) >= n + 1
+
+
+def storm(n, mode, window, ip, hns_port, base_port, timeout):
+    server = hns.BatchingHNS(ip, hns_port, window) if mode == 'batch' \
+        else hns.HNS(ip, hns_port)
+    server.run()
+    time.sleep(0.2)
+
+    hosts = make_hosts(n, ip, base_port, ip, hns_port)
+    start = time.time()
+    for host in hosts:
+        host.run()
+
+    waiting = list(hosts)
+    while len(waiting) != 0 and time.time() - start < timeout:
+        waiting = [host for host in waiting if not resolved(host, n)]
+        time.sleep(0.01)
+    elapsed = time.time() - start
+
+    return {
+        'hosts': n,
+        'mode': mode,
+        'window': window if mode == 'batch' else None,
+        'resolved': n - len(waiting),
+        'time_to_full_resolution': elapsed if len(waiting) == 0 else None,
+        'hns_datagrams_received': server.stats['received'],
+        'hns_datagrams_sent': server.stats['sent'],
+        'total_datagrams': server.stats['received'] + server.stats['sent']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HNS startup storm benchmark')
+    parser.add_argument('--hosts', type=int, default=100)
+    parser.add_argument('--mode', choices=['thread', 'batch'], default='batch')
+    parser.add_argument('--window', type=float, default=hns.BATCH_WINDOW)
+    parser.add_argument('--ip', type=str, default='127.0.0.1')
+    parser.add_argument('--hns-port', type=int, default=18888)
+    parser.add_argument('--base-port', type=int, default=20000)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    io.set_quiet(True)
+    result = storm(args.hosts, args.mode, args.window, args.ip,
+                   args.hns_port, args.base_port, args.timeout)
+    print(json.dumps(result, indent=2))
+    # listening threads of hns and hosts never return
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Multicast against repeated unicast
+
+A group of routers of a generated topology joins a multicast group in the
+in-process harness, on a virtual clock; one router then sends messages to
+the group, once with multicast and once with one unicast message per
+member, and the benchmark reports, as json, the frames and bytes each way
+put on the links and the most copies a single link carried.
+
+    $ cd src
+    $ python3 -m benchmark.multicast --shape grid --size 64 --members 16
+    $ python3 -m benchmark.multicast --algorithm LS_CENTRALIZE --members 32
+
+With distance vector there is no link-state database to build trees from
+and multicast falls back to unicast, both columns then match.
+"""
+import argparse
+import json
+import random
+from routing import io, topology
+from routing.backend import MemoryNetwork
+from routing.clock import VirtualClock
+from routing.harness import Harness
+
+
+class CountingNetwork(MemoryNetwork):
+    """
+    a MemoryNetwork counting the frames of one kind of message per link
+    """
+
+    def __init__(self, clock):
+        super(CountingNetwork, self).__init__(clock)
+        self.counting = None
+        self.reset()
+
+    def reset(self, counting=None):
+        """
+        Args:
+            counting: type of the messages to count, nothing if None
+        """
+        self.counting = counting
+        self.frames = 0
+        self.bytes = 0
+        # self.links = {(from, to): frames}
+        self.links = {}
+
+    def deliver(self, payload, src, address):
+        if self.counting is not None:
+            frame = json.loads(payload.decode())
+            data = frame['datagram']['data']
+            if data['type'] == self.counting and \
+                    (not isinstance(data['data'], dict) or
+                     data['data'].get('op') == 'data'):
+                self.frames += 1
+                self.bytes += len(payload)
+                link = (frame['last_name'], frame['next_name'])
+                self.links[link] = self.links.get(link, 0) + 1
+        super(CountingNetwork, self).deliver(payload, src, address)
+
+
+def _measure(harness, network, counting, send, messages, members, received):
+    network.reset(counting)
+    received.clear()
+    for i in range(messages):
+        send('message {}'.format(i))
+    harness.wait(10)
+    network.counting = None
+    delivered = sum(1 for member in members
+                    if received.get(member, 0) == messages)
+    return {
+        'frames': network.frames,
+        'bytes': network.bytes,
+        'max_link_frames': max(network.links.values(), default=0),
+        'links_used': len(network.links),
+        'members_reached': delivered
+    }
+
+
+def run(shape, size, algorithm, members, messages=10, seed=0, timeout=600):
+    """
+    Args:
+        members: routers joining the group, the source excluded
+        messages: messages sent each way
+    Returns:
+        dict: frames and bytes sent by multicast and unicast
+    """
+    topo = topology.generate(shape, size, algorithm, seed,
+                             update_interval=5, dead_timeout=120)
+    clock = VirtualClock()
+    network = CountingNetwork(clock)
+    harness = Harness(topo, network, clock)
+    harness.build()
+    harness.start()
+    if harness.wait_converged(timeout) is None:
+        return {'error': 'not converged'}
+
+    rand = random.Random(seed)
+    names = sorted(name for name in topo.routers if name != topo.controller)
+    source = harness.routers[names[0]]
+    group = rand.sample(names[1:], min(members, len(names) - 1))
+    received = {}
+
+    def counter(hostname):
+        def count(*_):
+            received[hostname] = received.get(hostname, 0) + 1
+        return count
+    for hostname in group:
+        router = harness.routers[hostname]
+        router.message.multicast.on_receive(counter(hostname))
+        router.dispatcher.register('Message', _Counted(
+            router.message, counter(hostname)))
+        router.join('bench')
+    # let the memberships flood
+    harness.wait(5)
+    known = len(source.message.multicast.members('bench'))
+
+    multicast = _measure(harness, network, 'Multicast',
+                         lambda m: source.send_multicast('bench', m),
+                         messages, group, received)
+
+    def unicast_send(message):
+        for hostname in group:
+            source.send(hostname, message)
+    unicast = _measure(harness, network, 'Message', unicast_send,
+                       messages, group, received)
+    harness.stop()
+    return {
+        'shape': shape,
+        'size': size,
+        'algorithm': algorithm,
+        'members': len(group),
+        'members_known': known,
+        'messages': messages,
+        'multicast': multicast,
+        'unicast': unicast,
+        'saving': 1 - multicast['frames'] / unicast['frames']
+        if unicast['frames'] else None
+    }
+
+
+class _Counted:
+    """
+    a receiver counting what it receives before passing it on
+    """
+
+    def __init__(self, receiver, count):
+        self._receiver = receiver
+        self._count = count
+
+    def receive(self, src, data):
+        self._count(src, data)
+        self._receiver.receive(src, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Multicast against repeated unicast')
+    parser.add_argument('--shape', default='grid',
+                        choices=sorted(topology.SHAPES))
+    parser.add_argument('--size', type=int, default=64)
+    parser.add_argument('--algorithm', default='LS',
+                        choices=['LS', 'DV', 'LS_CENTRALIZE'])
+    parser.add_argument('--members', type=int, default=16)
+    parser.add_argument('--messages', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    io.set_quiet(True)
+    print(json.dumps(run(args.shape, args.size, args.algorithm, args.members,
+                         args.messages, args.seed), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Startup time of the headless daemon against the gui entry point
+
+Each entry point is started in a fresh interpreter, the benchmark reports
+the median time from interpreter start to a running router, or to the gui
+modules being imported, and whether wx got loaded.
+
+    $ cd src
+    $ python3 -m benchmark.startup --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPORT = '''
+import json, sys, time
+print(json.dumps({
+    'time': time.perf_counter() - START,
+    'wx': 'wx' in sys.modules
+}))
+sys.stdout.flush()
+import os
+os._exit(0)
+'''
+
+CASES = {
+    # a running router, as the daemon starts it
+    'daemon': '''
+import routerDaemon
+from routing import io
+io.set_quiet(True)
+routerDaemon.start(CONFIG)
+''',
+    # the gui entry point, frames are imported when first shown
+    'gui': '''
+import routerMain
+''',
+    # what importing the gui used to cost, with the frames imported eagerly
+    'gui-eager': '''
+import routerMain
+from routing import config_frame, content_frame
+'''
+}
+
+
+def measure(case, _config):
+    code = 'import time\nSTART = time.perf_counter()\n' + \
+        'CONFIG = {!r}\n'.format(_config) + CASES[case] + REPORT
+    result = subprocess.run([sys.executable, '-c', code], cwd=SRC,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        return {'error': result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup time benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--port', type=int, default=19889)
+    args = parser.parse_args()
+
+    _config = {
+        'hostname': 'A', 'ip': '127.0.0.1', 'port': args.port,
+        'hns_ip': '127.0.0.1', 'hns_port': 8888,
+        'algorithm': 'LS', 'dead_timeout': 180, 'update_interval': 30,
+        'controller_hostname': '', 'neighbors': []
+    }
+
+    results = {}
+    for case in CASES:
+        runs = [measure(case, _config) for _ in range(args.repeat)]
+        errors = [run['error'] for run in runs if 'error' in run]
+        if len(errors) != 0:
+            results[case] = {'error': errors[0]}
+            continue
+        results[case] = {
+            'median_time': statistics.median(run['time'] for run in runs),
+            'min_time': min(run['time'] for run in runs),
+            'wx': runs[0]['wx']
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""Data-plane load test
+
+Flows of timestamped frames are sent between pairs of routers of a
+topology running in the in-process harness, forwarded hop by hop through
+Transport._route, and the benchmark reports per path the throughput, the
+loss and the latency percentiles.
+
+    $ cd src
+    $ python3 -m benchmark.traffic test_config/topology/ls.json \\
+          --pairs 4 --rate 200 --pattern poisson --duration 10
+    $ python3 -m benchmark.traffic --shape grid --routers 25 --virtual
+
+Frames use a dedicated dispatcher type, so the routers' Message module
+isn't involved and nothing is printed per frame.
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import threading
+import time
+from routing import io, topology
+from routing.clock import VirtualClock
+from routing.harness import Harness
+
+PATTERNS = ('constant', 'poisson', 'burst')
+
+
+class Probe:
+    """
+    sends and receives the frames of the load test on one router
+    """
+    TYPE = 'Traffic'
+
+    def __init__(self, router):
+        self._router = router
+        self._clock = router.clock
+        router.dispatcher.register(Probe.TYPE, self)
+        # self.received = {
+        #   (src, flow): {seq: latency}
+        # }
+        self.received = {}
+        self.duplicates = 0
+        self._lock = threading.Lock()
+
+    def send(self, destination, flow, seq, padding):
+        self._router.transport.send(destination, {
+            'type': Probe.TYPE,
+            'data': {
+                'flow': flow,
+                'seq': seq,
+                'sent': self._clock.time(),
+                'pad': padding
+            }
+        })
+
+    def receive(self, src, data):
+        latency = self._clock.time() - data['sent']
+        with self._lock:
+            received = self.received.setdefault((src, data['flow']), {})
+            if data['seq'] in received:
+                self.duplicates += 1
+                return
+            received[data['seq']] = latency
+
+
+def schedule(pattern, rate, duration, rand, burst=10):
+    """
+    Returns:
+        list<float>: offsets in seconds from the start of a flow at which a
+                     frame is sent, `rate` frames per second on average
+    """
+    times = []
+    if pattern == 'constant':
+        times = [i / rate for i in range(int(duration * rate))]
+    elif pattern == 'poisson':
+        t = rand.expovariate(rate)
+        while t < duration:
+            times.append(t)
+            t += rand.expovariate(rate)
+    elif pattern == 'burst':
+        # `burst` frames back to back, the bursts spaced to keep the rate
+        period = burst / rate
+        for i in range(int(duration / period)):
+            times += [i * period] * burst
+    return times
+
+
+def percentile(values, q):
+    """
+    Args:
+        values: sorted
+    """
+    if len(values) == 0:
+        return None
+    return values[min(len(values) - 1, max(0, int(math.ceil(q * len(values))) - 1))]
+
+
+def hops(harness, src, dest):
+    """
+    Returns:
+        int: routers a frame crosses from `src` to `dest` on the current
+             routing tables, None if it can't get there
+    """
+    count, hostname = 0, src
+    while hostname != dest:
+        table = harness.routers[hostname].get_routing_table()
+        if dest not in table or count > len(harness.routers):
+            return None
+        hostname = table[dest]['next']
+        count += 1
+    return count
+
+
+class LoadTest:
+    def __init__(self, harness, pairs, pattern, rate, size, burst=10, seed=0):
+        """
+        Args:
+            harness(Harness): converged network to load
+            pairs: list of (src, dest), one flow each
+            rate: frames per second of each flow
+            size: bytes of padding in each frame
+        """
+        self.harness = harness
+        self.pairs = pairs
+        self.pattern = pattern
+        self.rate = rate
+        self.size = size
+        self.burst = burst
+        self.rand = random.Random(seed)
+        self.probes = {hostname: Probe(router)
+                       for hostname, router in harness.routers.items()}
+        self.sent = {flow: 0 for flow in range(len(pairs))}
+
+    def _send(self, flow):
+        src, dest = self.pairs[flow]
+        self.probes[src].send(dest, flow, self.sent[flow], 'x' * self.size)
+        self.sent[flow] += 1
+
+    def run(self, duration, drain=1.0):
+        """
+        send every flow for `duration` seconds, then wait `drain` seconds
+        for the frames in flight
+        Returns:
+            float: seconds the sending actually took
+        """
+        # heap of (due offset, flow)
+        sends = []
+        for flow in range(len(self.pairs)):
+            sends += [(t, flow) for t in schedule(
+                self.pattern, self.rate, duration, self.rand, self.burst)]
+        heapq.heapify(sends)
+
+        clock = self.harness.clock
+        start = clock.time()
+        if clock.virtual:
+            for due, flow in sends:
+                clock.call_later(due, self._send, flow)
+            self.harness.wait(duration + drain)
+            return duration
+
+        while len(sends) != 0:
+            due, flow = heapq.heappop(sends)
+            delay = start + due - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._send(flow)
+        elapsed = time.time() - start
+        time.sleep(drain)
+        return elapsed
+
+    def report(self, elapsed):
+        paths = []
+        for flow, (src, dest) in enumerate(self.pairs):
+            received = self.probes[dest].received.get((src, flow), {})
+            latencies = sorted(received.values())
+            sent = self.sent[flow]
+            paths.append({
+                'src': src,
+                'dest': dest,
+                'hops': hops(self.harness, src, dest),
+                'sent': sent,
+                'received': len(received),
+                'loss': 1 - len(received) / sent if sent != 0 else None,
+                'throughput': len(received) / elapsed,
+                'throughput_bytes': len(received) * self.size / elapsed,
+                'latency_p50': percentile(latencies, 0.5),
+                'latency_p99': percentile(latencies, 0.99),
+                'latency_p999': percentile(latencies, 0.999),
+                'latency_max': latencies[-1] if len(latencies) != 0 else None
+            })
+        received = sum(path['received'] for path in paths)
+        return {
+            'pattern': self.pattern,
+            'rate_per_flow': self.rate,
+            'size': self.size,
+            'flows': len(paths),
+            'send_time': elapsed,
+            'throughput': received / elapsed,
+            'duplicates': sum(probe.duplicates
+                              for probe in self.probes.values()),
+            'paths': paths
+        }
+
+
+def pick_pairs(topo, n, rand):
+    """
+    Returns:
+        list: `n` pairs of distinct routers, members only, the first one
+              from the first router to the router farthest from it, so a
+              long path is always measured
+    """
+    names = sorted(name for name in topo.routers if name != topo.controller)
+    if len(names) < 2:
+        return []
+    farthest = max(((src, dest, cost) for src in names[:1]
+                    for dest, cost in topo.expected_costs(src).items()
+                    if dest in names and dest != src),
+                   key=lambda pair: pair[2])
+    pairs = [(farthest[0], farthest[1])]
+    while len(pairs) < n:
+        pairs.append(tuple(rand.sample(names, 2)))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Data-plane load test')
+    parser.add_argument('topology', type=str, nargs='?', default=None,
+                        help='json topology file, or see --shape')
+    parser.add_argument('--shape', choices=sorted(topology.SHAPES),
+                        default='grid',
+                        help='generated topology used without a file')
+    parser.add_argument('--routers', type=int, default=16)
+    parser.add_argument('--algorithm', type=str, default='LS')
+    parser.add_argument('--pairs', type=int, default=4,
+                        help='number of flows, between random router pairs')
+    parser.add_argument('--pair', nargs=2, action='append', default=None,
+                        metavar=('SRC', 'DEST'),
+                        help='explicit flow, may be repeated, overrides '
+                             '--pairs')
+    parser.add_argument('--pattern', choices=PATTERNS, default='constant')
+    parser.add_argument('--rate', type=float, default=100,
+                        help='frames per second of each flow')
+    parser.add_argument('--burst', type=int, default=10,
+                        help='frames per burst with the burst pattern')
+    parser.add_argument('--size', type=int, default=64,
+                        help='bytes of padding per frame')
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='seconds to wait for convergence first')
+    parser.add_argument('--virtual', action='store_true',
+                        help='run on a virtual clock, latencies are then '
+                             'the modelled link delays')
+    args = parser.parse_args()
+
+    io.set_quiet(True)
+    rand = random.Random(args.seed)
+    topo = topology.load(args.topology) if args.topology is not None \
+        else topology.generate(args.shape, args.routers, args.algorithm,
+                               args.seed, update_interval=3,
+                               dead_timeout=120)
+    harness = Harness(topo, clock=VirtualClock() if args.virtual else None)
+    harness.build()
+    harness.start()
+    if harness.wait_converged(args.timeout) is None:
+        print(json.dumps({'error': 'not converged',
+                          'unconverged': harness.unconverged()}))
+        harness.stop()
+        os._exit(1)
+
+    pairs = [tuple(pair) for pair in args.pair] if args.pair is not None \
+        else pick_pairs(topo, args.pairs, rand)
+    test = LoadTest(harness, pairs, args.pattern, args.rate, args.size,
+                    args.burst, args.seed)
+    elapsed = test.run(args.duration)
+    print(json.dumps(test.report(elapsed), indent=2))
+    harness.stop()
+    # timers of the algorithms keep rescheduling themselves
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 import argparse
 import json
+import multiprocessing
+import os
 from routing import hns
 
 
@@ -9,14 +11,52 @@ def load(file):
         return data
 
 
+def make_server(args, ip, port, cluster=None, member='hns'):
+    store = args.store
+    if store is not None and cluster is not None:
+        store = os.path.join(store, member)
+    if args.mode == 'batch':
+        return hns.BatchingHNS(ip, port, args.window, store, cluster, member)
+    return hns.HNS(ip, port, store, cluster, member)
+
+
+def run_member(args, cluster, member):
+    ip, port = cluster[member]
+    make_server(args, ip, port, cluster, member).run()
+
+
 def main():
     parser = argparse.ArgumentParser(description='Run Hostname Domain Server')
     parser.add_argument('--ip', type=str, default="127.0.0.1")
     parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--mode', choices=['thread', 'batch'], default='thread',
+                        help='thread per request, or a single event loop '
+                             'merging registrations in batches')
+    parser.add_argument('--window', type=float, default=hns.BATCH_WINDOW,
+                        help='batch window in seconds for batch mode')
+    parser.add_argument('--store', type=str, default=None,
+                        help='directory persisting the mapping table, '
+                             'restored on restart')
+    parser.add_argument('--cluster', type=str, default=None,
+                        help='json file listing the members of a sharded '
+                             'hns cluster, {"members": {name: [ip, port]}}')
+    parser.add_argument('--member', type=str, default=None,
+                        help='member of the cluster to run, every member '
+                             'is started as a local process if omitted')
     args = parser.parse_args()
     try:
-        h = hns.HNS(args.ip, args.port)
-        h.run()
+        if args.cluster is None:
+            make_server(args, args.ip, args.port).run()
+            return
+
+        cluster = load(args.cluster)['members']
+        if args.member is not None:
+            run_member(args, cluster, args.member)
+            return
+
+        for member in cluster:
+            multiprocessing.Process(target=run_member,
+                                    args=(args, cluster, member)).start()
     except Exception as err:
         print(err)
         return 1
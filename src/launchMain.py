@@ -0,0 +1,188 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from routing import hns, io, topology
+from routing.harness import converged
+from routing.router import Router
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_hns(topo, mode):
+    io.set_quiet(True)
+    ip, port = topo.hns
+    server = hns.BatchingHNS(ip, port) if mode == 'batch' \
+        else hns.HNS(ip, port)
+    server.run()
+
+
+def run_routers(description, hostnames, reports, provision, stop, poll):
+    """
+    worker of the pool, runs a share of the routers over udp and reports
+    when each one started, got registered by the hns and converged
+
+    Args:
+        reports: queue receiving (hostname, event, time), event is one of
+                 'started', 'registered' or 'converged'
+        provision: event set by the launcher once every router is
+                   registered, links are only provisioned then so the first
+                   handshakes find their peer's address
+        stop: event set by the launcher to stop the routers
+    """
+    io.set_quiet(True)
+    topo = topology.Topology(description)
+    routers = {}
+    for hostname in hostnames:
+        routers[hostname] = Router(topo.config(hostname))
+        routers[hostname].run()
+        reports.put((hostname, 'started', time.time()))
+
+    unregistered = set(hostnames)
+    while not provision.wait(poll / 10):
+        for hostname in sorted(unregistered):
+            if routers[hostname].transport.is_registered():
+                unregistered.discard(hostname)
+                reports.put((hostname, 'registered', time.time()))
+        if stop.is_set():
+            break
+
+    # each link is provisioned from its end with the smaller hostname
+    for hostname, router in routers.items():
+        router.update_neighbors({
+            neighbor: cost
+            for neighbor, cost in topo.neighbors(hostname).items()
+            if hostname < neighbor})
+
+    expected = {hostname: topo.expected_routes(hostname)
+                for hostname in hostnames}
+    waiting = set(hostnames)
+    while not stop.wait(poll):
+        for hostname in sorted(waiting):
+            if converged(expected[hostname],
+                         routers[hostname].get_routing_table()):
+                waiting.discard(hostname)
+                reports.put((hostname, 'converged', time.time()))
+
+    for router in routers.values():
+        router.stop()
+    # timers of the algorithms keep rescheduling themselves
+    os._exit(0)
+
+
+def launch(topo, processes, timeout, hns_mode, poll=0.5):
+    """
+    start the hns and every router of `topo` in a pool of processes, then
+    wait until every router converged
+    Returns:
+        (dict, stop event, processes): the startup report, and what
+        `shutdown` needs
+    """
+    reports = multiprocessing.Queue()
+    provision = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    start = time.time()
+
+    server = multiprocessing.Process(target=run_hns, args=(topo, hns_mode))
+    server.start()
+    # let the hns bind before the registration storm
+    time.sleep(0.2)
+
+    hostnames = sorted(topo.routers)
+    shares = [hostnames[i::processes] for i in range(processes)]
+    workers = [multiprocessing.Process(
+        target=run_routers,
+        args=(topo.to_dict(), share, reports, provision, stop, poll))
+        for share in shares if len(share) != 0]
+    for worker in workers:
+        worker.start()
+
+    events = {'started': {}, 'registered': {}, 'converged': {}}
+    provisioned = None
+    while len(events['converged']) < len(hostnames) and \
+            time.time() - start < timeout:
+        try:
+            hostname, event, when = reports.get(timeout=poll / 10)
+            events[event][hostname] = when - start
+        except queue.Empty:
+            pass
+        if provisioned is None and \
+                len(events['registered']) == len(hostnames):
+            provisioned = time.time() - start
+            provision.set()
+    # provision what is registered, the rest is resolved on demand
+    provision.set()
+    started, converged_at = events['started'], events['converged']
+
+    unconverged = [hostname for hostname in hostnames
+                   if hostname not in converged_at]
+    report = {
+        'routers': len(hostnames),
+        'algorithm': topo.algorithm,
+        'processes': len(workers),
+        'hns_mode': hns_mode,
+        'all_started': max(started.values()) if len(started) != 0 else None,
+        'started_p50': percentile(started.values(), 0.5),
+        'all_registered': provisioned,
+        'converged_p50': percentile(converged_at.values(), 0.5),
+        'converged_p90': percentile(converged_at.values(), 0.9),
+        'all_converged': max(converged_at.values())
+        if len(unconverged) == 0 else None,
+        'unconverged': len(unconverged),
+        'unconverged_routers': unconverged[:20]
+    }
+    return report, stop, [server] + workers
+
+
+def shutdown(stop, processes):
+    stop.set()
+    server, workers = processes[0], processes[1:]
+    for worker in workers:
+        worker.join(10)
+    server.terminate()
+    server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Start every router of a topology file and the hns')
+    parser.add_argument('topology', type=str,
+                        help='json file describing routers and links, '
+                             'see routing/topology.py')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='size of the pool the routers are spread on')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='seconds to wait for convergence')
+    parser.add_argument('--hns-mode', choices=['thread', 'batch'],
+                        default='batch')
+    parser.add_argument('--keep-running', action='store_true',
+                        help='keep the testbed up after the report, until '
+                             'interrupted')
+    args = parser.parse_args()
+
+    report, stop, processes = launch(topology.load(args.topology),
+                                     args.processes, args.timeout,
+                                     args.hns_mode)
+    print(json.dumps(report, indent=2))
+
+    if args.keep_running:
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        try:
+            while not stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+    shutdown(stop, processes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Replay of a frame trace
+
+Reads a trace dumped by routing.trace and feeds the frames the router
+received into Transport._process of the same router, built in the
+virtual-clock harness from a topology file, so a post-mortem can be
+stepped through, or profiled, away from the network it was recorded on.
+
+    $ python3 replayMain.py A.trace --list
+    $ python3 replayMain.py A.trace test_config/topology/ls.json --profile out.prof
+
+Frames larger than the snap length were truncated in the trace, they are
+replayed as frames of the unregistered 'Trace' type carrying the recorded
+header fields, which still exercises the forwarding path.
+"""
+import argparse
+import cProfile
+import json
+import os
+import time
+from routing import io, parse, topology, trace
+from routing.clock import VirtualClock
+from routing.harness import Harness
+
+
+def frame_of(record):
+    """
+    Returns:
+        dict: the frame of `record`, rebuilt from its header fields if its
+              payload was truncated
+    """
+    if not record.truncated:
+        return parse.parse(record.payload)
+    return {
+        'next_name': record.next_name,
+        'last_name': record.last_name,
+        'broadcasting': False,
+        'visited': [],
+        'datagram': {
+            'src': record.src,
+            'dest': record.dest,
+            'passed_by': [record.last_name],
+            'data': {'type': 'Trace', 'data': None}
+        }
+    }
+
+
+def describe(record):
+    return {
+        'time': record.time,
+        'direction': record.direction,
+        'type': record.type,
+        'length': record.length,
+        'src': record.src,
+        'dest': record.dest,
+        'last_name': record.last_name,
+        'next_name': record.next_name,
+        'broadcasting': record.broadcasting,
+        'truncated': record.truncated
+    }
+
+
+def replay(records, router, clock, recorded_timing=False, drain=1.0):
+    """
+    feed the received frames of `records` into `router`
+    Args:
+        recorded_timing: keep the gaps between the frames, on the virtual
+                         clock, instead of feeding them back to back
+        drain: virtual seconds run afterwards for what the frames triggered
+    Returns:
+        dict: frames replayed and the cpu time `_process` took
+    """
+    received = [record for record in records
+                if record.direction == 'received']
+    frames = [frame_of(record) for record in received]
+    process = router.transport._process
+
+    start = time.process_time()
+    if recorded_timing and len(received) != 0:
+        origin = received[0].time
+        for record, frame in zip(received, frames):
+            clock.call_later(record.time - origin, process, frame)
+        clock.run_for(received[-1].time - origin + drain)
+    else:
+        for frame in frames:
+            process(frame)
+        clock.run_for(drain)
+    cpu = time.process_time() - start
+
+    return {
+        'records': len(records),
+        'replayed': len(frames),
+        'truncated': sum(1 for record in received if record.truncated),
+        'cpu_time': cpu,
+        'frames_per_second': len(frames) / cpu if cpu > 0 else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a frame trace')
+    parser.add_argument('trace', type=str, help='file dumped by a router')
+    parser.add_argument('topology', type=str, nargs='?', default=None,
+                        help='json topology file the router is built from')
+    parser.add_argument('--router', type=str, default=None,
+                        help='router fed with the frames, the one the trace '
+                             'was recorded on by default')
+    parser.add_argument('--list', action='store_true',
+                        help='print the records instead of replaying them')
+    parser.add_argument('--recorded-timing', action='store_true',
+                        help='keep the recorded gaps between the frames')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='virtual seconds to wait for convergence first')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='write a cProfile dump of the replay here')
+    args = parser.parse_args()
+
+    hostname, records = trace.load(args.trace)
+    if args.list or args.topology is None:
+        for record in records:
+            print(json.dumps(describe(record)))
+        return
+
+    io.set_quiet(True)
+    harness = Harness(topology.load(args.topology), clock=VirtualClock())
+    hostname = args.router if args.router is not None else hostname
+    if hostname not in harness.topology.routers:
+        parser.error('{} is not in the topology'.format(hostname))
+    harness.build()
+    harness.start()
+    if harness.wait_converged(args.timeout) is None:
+        print(json.dumps({'error': 'not converged',
+                          'unconverged': harness.unconverged()}))
+        os._exit(1)
+
+    router = harness.routers[hostname]
+    if args.profile is not None:
+        profile = cProfile.Profile()
+        result = profile.runcall(replay, records, router, harness.clock,
+                                 args.recorded_timing)
+        profile.dump_stats(args.profile)
+    else:
+        result = replay(records, router, harness.clock, args.recorded_timing)
+    result['router'] = hostname
+    print(json.dumps(result, indent=2))
+    harness.stop()
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import time
+
+# taken before any other import, so the startup time includes them
+START = time.time()
+
+import argparse
+import json
+import os
+import signal
+import threading
+from routing import config, io, trace
+from routing.router import Router
+
+
+def start(_config, forward_workers=0):
+    """
+    build and run a router from a configuration file's content, the same
+    the gui reads
+    Returns:
+        Router
+    """
+    c, neighbors = config.from_dict(_config)
+    router = Router(c, forward_workers=forward_workers)
+    router.run()
+    router.update_neighbors(neighbors)
+    return router
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a router headless, without wx')
+    parser.add_argument('config', type=str,
+                        help='json file, same format as the gui reads')
+    parser.add_argument('--quiet', action='store_true',
+                        help="don't print the logs")
+    parser.add_argument('--trace-dir', type=str, default='.',
+                        help='directory the frame trace is dumped to, on '
+                             'SIGUSR1 or when an exception goes unhandled')
+    parser.add_argument('--forward-workers', type=int, default=0,
+                        help='threads forwarding received frames, sharded '
+                             'by (source, destination)')
+    args = parser.parse_args()
+
+    io.set_quiet(args.quiet)
+    with open(args.config) as f:
+        _config = json.load(f)
+
+    router = start(_config, args.forward_workers)
+    trace_path = os.path.join(args.trace_dir,
+                              '{}.trace'.format(router.hostname))
+    trace.dump_on_crash(lambda: [router.transport.trace],
+                        lambda _: trace_path)
+    signal.signal(signal.SIGUSR1, lambda *_: router.dump_trace(trace_path))
+    print(json.dumps({
+        'hostname': router.hostname,
+        'startup_time': time.time() - START
+    }))
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    while not stopped.wait(1):
+        pass
+
+    router.stop()
+    # timers of the algorithm keep rescheduling themselves
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
-import threading
 import copy
-import time
 from .io import print_log
+from .clock import RealClock
+from .dispatcher import ROUTING, COALESCE
+from .locks import TimedLock
 
 ALGORITHM_TYPE = "algorithm"
 
@@ -20,8 +21,9 @@ def error(message):
 
 class Algorithm(object):
     def __init__(self, hostname, transport, routing_table, neighbor,
-                 dispatcher, update_interval=30, timeout=180):
+                 dispatcher, update_interval=30, timeout=180, clock=None):
         self._hostname = hostname
+        self._clock = clock if clock is not None else RealClock()
         self._interval = update_interval
         self._timeout = timeout
 
@@ -47,7 +49,7 @@ class Algorithm(object):
                 'cost': 0
             }
         }
-        self._routing_table_lock = threading.Lock()
+        self._routing_table_lock = TimedLock('routing_table')
 
         # Link-State
         #
@@ -60,8 +62,13 @@ class Algorithm(object):
         #   ...
         # }
         #
+        # the database and the routing table are replaced as a whole, never
+        # changed once published, so their locks are only held to swap or
+        # read them; the recomputation itself runs on a private copy under
+        # the spf lock, which only writers take
         self._link_state = {}
-        self._link_state_lock = threading.Lock()
+        self._link_state_lock = TimedLock('link_state')
+        self._spf_lock = TimedLock('spf')
 
         # Alive-state
         #
@@ -70,15 +77,26 @@ class Algorithm(object):
         #   ...
         # }
         self._alive_table = {}
-        self._alive_table_lock = threading.Lock()
+        self._alive_table_lock = TimedLock('alive_table')
 
-        dispatcher.register(ALGORITHM_TYPE, self)
+        # a full queue loses the oldest update of the same source, the newer
+        # one supersedes it, other routers' updates are kept
+        dispatcher.register(ALGORITHM_TYPE, self, ROUTING, policy=COALESCE)
         self._neighbor.on_update(self._neighbor_update)
         self._check_timeout()
 
     def receive(self, src, data):
         pass
 
+    def receive_batch(self, items):
+        """
+        receive several updates queued at once, see DataDispatcher
+        Args:
+            items: list of (src, data), in the order they arrived
+        """
+        for src, data in items:
+            self.receive(src, data)
+
     def run(self):
         pass
 
@@ -91,23 +109,44 @@ class Algorithm(object):
             self._check_alive_thread.cancel()
             self._check_alive_thread = None
 
+    def get_link_state(self):
+        """
+        Returns:
+            dict: copy of the link-state database, {hostname: {neighbor:
+                  cost}}, empty for distance vector which keeps none
+        """
+        with self._link_state_lock:
+            link_state = self._link_state
+        return copy.deepcopy(link_state)
+
+    def lock_stats(self):
+        """
+        Returns:
+            dict: {lock name: stats}, see routing.locks.TimedLock.stats
+        """
+        return {lock.name: lock.stats() for lock in vars(self).values()
+                if isinstance(lock, TimedLock)}
+
     def _push_to_routing_model(self, lock=True):
+        # the model gets a copy, readers would race with the next update
         if lock is True:
             with self._routing_table_lock:
-                self._routing.update(self._routing_table)
+                self._routing.update(copy.deepcopy(self._routing_table))
         else:
-            self._routing.update(self._routing_table)
+            self._routing.update(copy.deepcopy(self._routing_table))
 
     def _neighbor_update(self, neighbor_table):
         log('new neighbor table: {}'.format(neighbor_table))
         with self._routing_table_lock:
+            routing_table = dict(self._routing_table)
             for hostname in neighbor_table:
                 if neighbor_table[hostname] != -1:
-                    self._routing_table[hostname] = {
+                    routing_table[hostname] = {
                         'next': hostname,
                         'cost': neighbor_table[hostname]
                     }
                     self._routing.update_one(hostname, hostname, neighbor_table[hostname])
+            self._routing_table = routing_table
 
     def _neighbor_timeout(self, dead_hostnames):
         for hostname in dead_hostnames:
@@ -118,29 +157,43 @@ class Algorithm(object):
 
 class DV(Algorithm):
     def __init__(self, hostname, transport, routing_table, neighbor,
-                 dispatcher, update_interval=30, timeout=180):
+                 dispatcher, update_interval=30, timeout=180, clock=None):
         super(DV, self).__init__(hostname,
                                  transport,
                                  routing_table,
                                  neighbor,
                                  dispatcher,
                                  update_interval,
-                                 timeout)
+                                 timeout,
+                                 clock)
         self._neighbor_routing = {}
-        self._neighbor_routing_lock = threading.Lock()
+        self._neighbor_routing_lock = TimedLock('neighbor_routing')
 
     def receive(self, src, data):
-        if self._have_timeout(data) is True:
-            info('Discard data for timeout hostname in routing table')
-            return
+        self.receive_batch([(src, data)])
 
-        log('receive routing data from {}: {}'.format(src,
-                                                      data['routing']))
-        dead_hostnames = self._update_alive_get_dead(data['alive'])
+    def receive_batch(self, items):
+        """
+        take in the vectors of several neighbors, then recompute once
+        """
+        fresh = []
+        for src, data in items:
+            if self._have_timeout(data) is True:
+                info('Discard data for timeout hostname in routing table')
+                continue
+
+            log('receive routing data from {}: {}'.format(src,
+                                                          data['routing']))
+            self._update_alive_get_dead(data['alive'])
+            fresh.append((src, data))
+        if len(fresh) == 0:
+            return
 
         with self._routing_table_lock:
             with self._neighbor_routing_lock:
-                self._update_neighbor_routing(src, data['routing'])
+                # a later vector of the same neighbor replaces an earlier one
+                for src, data in fresh:
+                    self._update_neighbor_routing(src, data['routing'])
                 destinations = self._get_destinations()
 
                 # info('neighbor routing: {}'.format(self._neighbor_routing))
@@ -169,14 +222,13 @@ class DV(Algorithm):
     def run(self):
         self._notice_neighbor()
 
-        self._timer_thread = threading.Timer(self._interval, DV.run, args=(self,))
-        self._timer_thread.start()
+        self._timer_thread = self._clock.call_later(self._interval, DV.run, self)
 
     def _neighbor_update(self, neighbor_table):
         log('new neighbor table: {}'.format(neighbor_table))
 
     def _have_timeout(self, data):
-        current_time = time.time()
+        current_time = self._clock.time()
         dead_hostnames = []
 
         for hostname in data['alive']:
@@ -191,7 +243,7 @@ class DV(Algorithm):
 
     def _update_alive_get_dead(self, alive_table):
         dead_hostnames = []
-        current_time = time.time()
+        current_time = self._clock.time()
 
         with self._alive_table_lock:
             self._alive_table[self._hostname] = current_time
@@ -215,7 +267,8 @@ class DV(Algorithm):
             for hostname in self._neighbor_routing[neighbor]:
                 destinations.add(hostname)
 
-        return list(destinations)
+        # sorted for a deterministic tie break between equal costs
+        return sorted(destinations)
 
     def _update_neighbor_routing(self, src, neighbor_routing):
         self._neighbor_routing[src] = neighbor_routing
@@ -234,8 +287,13 @@ class DV(Algorithm):
                 'cost': neighbor_table[hostname]
             }
 
+        # a removed neighbor's vector is no path anymore
+        for hostname in list(self._neighbor_routing):
+            if hostname != self._hostname and hostname not in neighbor_table:
+                self._neighbor_routing.pop(hostname)
+
     def _notice_neighbor(self):
-        current_time = time.time()
+        current_time = self._clock.time()
         dead_hostnames = []
         neighbor_table = self._neighbor.get()
 
@@ -245,7 +303,7 @@ class DV(Algorithm):
         }
 
         with self._alive_table_lock:
-            self._alive_table[self._hostname] = time.time()
+            self._alive_table[self._hostname] = self._clock.time()
 
             for hostname in self._alive_table:
                 if current_time - self._alive_table[hostname] > self._timeout:
@@ -300,18 +358,26 @@ class DV(Algorithm):
 
 class LS(Algorithm):
     def receive(self, src, data):
+        self.receive_batch([(src, data)])
+
+    def receive_batch(self, items):
+        """
+        fold several advertisements into the database, then run dijkstra
+        once
+        """
         dead_hostnames = []
         neighbor_table = self._neighbor.get()
 
         with self._alive_table_lock:
-            current_time = time.time()
+            current_time = self._clock.time()
             self._alive_table[self._hostname] = current_time
             # update alive table
-            for hostname in data['alive']:
-                if hostname not in self._alive_table:
-                    self._alive_table[hostname] = data['alive'][hostname]
-                elif data['alive'][hostname] > self._alive_table[hostname]:
-                    self._alive_table[hostname] = data['alive'][hostname]
+            for _, data in items:
+                for hostname in data['alive']:
+                    if hostname not in self._alive_table:
+                        self._alive_table[hostname] = data['alive'][hostname]
+                    elif data['alive'][hostname] > self._alive_table[hostname]:
+                        self._alive_table[hostname] = data['alive'][hostname]
 
             # collect dead hostnames
             for hostname in self._alive_table:
@@ -325,41 +391,19 @@ class LS(Algorithm):
             log('dead hostnames: {}'.format(dead_hostnames))
             self._neighbor_timeout(dead_hostnames)
 
-        self._routing_table_lock.acquire()
-        self._link_state_lock.acquire()
-        try:
-            self._link_state[self._hostname] = neighbor_table
-            for hostname in neighbor_table:
-                if hostname not in self._link_state:
-                    self._link_state[hostname] = {}
+        with self._spf_lock:
+            link_state = self._private_link_state(neighbor_table)
+            for _, data in items:
+                link_state[data['source']] = data['neighbor']
+                for hostname in data['neighbor']:
+                    if hostname not in link_state:
+                        link_state[hostname] = {}
+            self._remove_dead(link_state, dead_hostnames)
 
-            self._link_state[data['source']] = data['neighbor']
-            for hostname in data['neighbor']:
-                if hostname not in self._link_state:
-                    self._link_state[hostname] = {}
-
-            for hostname in dead_hostnames:
-                if hostname in self._link_state:
-                    self._link_state.pop(hostname)
-
-            for hostname in self._link_state:
-                self._link_state[hostname] = {
-                    k: v for k, v in self._link_state[hostname].items()
-                    if k not in dead_hostnames
-                }
-
-            prev_table = self._dijkstra()
-            self._update_routing(prev_table)
-            self._routing.update(copy.deepcopy(self._routing_table))
-
-            log('receive routing data from {}: {}'.format(data['source'],
-                                                          data['neighbor']))
-            log('update routing table: {}'.format(self._routing_table))
-        finally:
-            self._link_state_lock.release()
-            self._routing_table_lock.release()
-
-        self._push_to_routing_model()
+            for _, data in items:
+                log('receive routing data from {}: {}'.format(
+                    data['source'], data['neighbor']))
+            self._publish(link_state)
 
     def run(self):
         neighbor_table = self._neighbor.get()
@@ -377,15 +421,13 @@ class LS(Algorithm):
         self._transport.broadcasting(send_data)
         log('send neighbor information: {}'.format(send_data['data']['neighbor']))
 
-        self._timer_thread = threading.Timer(self._interval, LS.run, args=(self,))
-        self._timer_thread.start()
+        self._timer_thread = self._clock.call_later(self._interval, LS.run, self)
 
-    def _dijkstra(self):
+    def _dijkstra(self, link_state):
         """Dijkstra algorithm
 
-        update routing table
-
-        must be wrapped with the link state lock
+        Args:
+            link_state: the database to compute on
 
         Returns:
             prev_table: shortest path table
@@ -399,13 +441,13 @@ class LS(Algorithm):
             }
         }
 
-        for hostname in self._link_state[self._hostname]:
+        for hostname in link_state[self._hostname]:
             prev_table[hostname] = {
                 'prev': self._hostname,
-                'cost': self._link_state[self._hostname][hostname]
+                'cost': link_state[self._hostname][hostname]
             }
 
-        for hostname in self._link_state:
+        for hostname in link_state:
             if hostname not in prev_table:
                 prev_table[hostname] = {
                     'prev': None,
@@ -429,32 +471,34 @@ class LS(Algorithm):
                 break
 
             visited.append(nearest_hostname)
-            for hostname in self._link_state[nearest_hostname]:
+            for hostname in link_state[nearest_hostname]:
                 if hostname not in prev_table or \
                         (hostname not in visited and \
                                  (prev_table[hostname]['cost'] == -1 or
                                           prev_table[hostname]['cost'] > nearest_cost + \
-                                              self._link_state[nearest_hostname][hostname])):
+                                              link_state[nearest_hostname][hostname])):
                     prev_table[hostname] = {
                         'prev': nearest_hostname,
-                        'cost': nearest_cost + self._link_state[nearest_hostname][hostname]
+                        'cost': nearest_cost + link_state[nearest_hostname][hostname]
                     }
 
         return prev_table
 
-    def _update_routing(self, prev_table):
-        """update routing table
-
-        must be wrapped with the routing table lock
+    def _routing_of(self, prev_table):
+        """routing table of a shortest path table
 
         Args:
             prev_table: calculated by _dijkstra
+
+        Returns:
+            routing_table: a new one, see Algorithm._routing_table
         """
 
-        self._routing_table.clear()
-        self._routing_table[self._hostname] = {
-            'next': self._hostname,
-            'cost': 0
+        routing_table = {
+            self._hostname: {
+                'next': self._hostname,
+                'cost': 0
+            }
         }
 
         for destination in prev_table:
@@ -465,17 +509,83 @@ class LS(Algorithm):
             while prev_table[last_hop]['prev'] != self._hostname:
                 last_hop = prev_table[last_hop]['prev']
 
-            self._routing_table[destination] = {
+            routing_table[destination] = {
                 'next': last_hop,
                 'cost': prev_table[destination]['cost']
             }
 
+        return routing_table
+
+    def _private_link_state(self, neighbor_table):
+        """
+        a copy of the database to change, with this router's neighbors
+
+        inner dicts are shared with the published database, they are
+        replaced, never changed in place
+
+        must be wrapped with the spf lock
+        """
+        with self._link_state_lock:
+            link_state = dict(self._link_state)
+
+        link_state[self._hostname] = neighbor_table
+        for hostname in neighbor_table:
+            if hostname not in link_state:
+                link_state[hostname] = {}
+        return link_state
+
+    def _remove_dead(self, link_state, dead_hostnames):
+        if len(dead_hostnames) == 0:
+            return
+        for hostname in dead_hostnames:
+            if hostname in link_state:
+                link_state.pop(hostname)
+
+        for hostname in link_state:
+            link_state[hostname] = {
+                k: v for k, v in link_state[hostname].items()
+                if k not in dead_hostnames
+            }
+
+    def _publish(self, link_state, routes=None):
+        """
+        run dijkstra on `link_state`, then swap it and its routing table in
+
+        must be wrapped with the spf lock, readers and the neighbor updates
+        only wait for the swap
+
+        Args:
+            routes: entries put in the routing table over the computed ones
+        """
+        routing_table = self._routing_of(self._dijkstra(link_state))
+        if routes is not None:
+            routing_table.update(routes)
+
+        with self._link_state_lock:
+            self._link_state = link_state
+        # a neighbor that came up, or whose cost changed, during the
+        # computation keeps the direct route it was given
+        computed = link_state.get(self._hostname, {})
+        for hostname, cost in self._neighbor.get().items():
+            if cost != -1 and (hostname not in routing_table or
+                               computed.get(hostname) != cost):
+                routing_table[hostname] = {
+                    'next': hostname,
+                    'cost': cost
+                }
+        model = copy.deepcopy(routing_table)
+        with self._routing_table_lock:
+            self._routing_table = routing_table
+            self._routing.update(model)
+
+        log('update routing table: {}'.format(routing_table))
+
     def _check_timeout(self):
         dead_hostnames = []
         neighbor_table = self._neighbor.get()
 
         with self._alive_table_lock:
-            current_time = time.time()
+            current_time = self._clock.time()
             self._alive_table[self._hostname] = current_time
 
             # collect dead hostnames
@@ -490,78 +600,54 @@ class LS(Algorithm):
             log('dead hostnames: {}'.format(dead_hostnames))
             self._neighbor_timeout(dead_hostnames)
 
-        self._routing_table_lock.acquire()
-        self._link_state_lock.acquire()
-        try:
-            self._link_state[self._hostname] = neighbor_table
-            for hostname in neighbor_table:
-                if hostname not in self._link_state:
-                    self._link_state[hostname] = {}
+        with self._spf_lock:
+            link_state = self._private_link_state(neighbor_table)
+            self._remove_dead(link_state, dead_hostnames)
+            self._publish(link_state)
 
-            for hostname in dead_hostnames:
-                if hostname in self._link_state:
-                    self._link_state.pop(hostname)
-
-            for hostname in self._link_state:
-                self._link_state[hostname] = {
-                    k: v for k, v in self._link_state[hostname].items()
-                    if k not in dead_hostnames
-                }
-
-            prev_table = self._dijkstra()
-            self._update_routing(prev_table)
-            self._routing.update(copy.deepcopy(self._routing_table))
-
-            log('update routing table: {}'.format(self._routing_table))
-        finally:
-            self._link_state_lock.release()
-            self._routing_table_lock.release()
-
-        self._push_to_routing_model()
-        self._check_alive_thread = threading.Timer(self._timeout, LS._check_timeout, args=(self,))
-        self._check_alive_thread.start()
+        self._check_alive_thread = self._clock.call_later(self._timeout, LS._check_timeout, self)
 
 class CentralizedMember(LS):
     def __init__(self, central_hostname, hostname, transport, routing_table,
-                 neighbor, dispather, update_interval=30, timeout=180):
+                 neighbor, dispather, update_interval=30, timeout=180,
+                 clock=None):
         super(CentralizedMember, self).__init__(hostname,
                                                 transport,
                                                 routing_table,
                                                 neighbor,
                                                 dispather,
                                                 update_interval,
-                                                timeout)
+                                                timeout,
+                                                clock)
 
         self._central_hostname = central_hostname
 
     def receive(self, src, data):
+        self.receive_batch([(src, data)])
+
+    def receive_batch(self, items):
+        """
+        every push of the controller carries the whole database, only the
+        last one queued is computed on
+        """
         neighbor_table = self._neighbor.get()
 
         central_cost = neighbor_table[self._central_hostname]
-        log('receive routing data from {}: {}'.format(src, data))
-
-        for hostname in data['dead']:
-            if hostname in neighbor_table:
-                self._neighbor.timeout(hostname)
-
-        self._routing_table_lock.acquire()
-        self._link_state_lock.acquire()
-        try:
-            self._link_state = data['link']
-
-            prev_table = self._dijkstra()
-            self._update_routing(prev_table)
-            self._routing_table[self._central_hostname] = {
-                'next': self._central_hostname,
-                'cost': central_cost
-            }
-
-            log('update routing table: {}'.format(self._routing_table))
-        finally:
-            self._link_state_lock.release()
-            self._routing_table_lock.release()
-
-        self._push_to_routing_model()
+        for src, data in items:
+            log('receive routing data from {}: {}'.format(src, data))
+
+            for hostname in data['dead']:
+                if hostname in neighbor_table:
+                    self._neighbor.timeout(hostname)
+        data = items[-1][1]
+
+        with self._spf_lock:
+            self._publish(data['link'], {
+                self._central_hostname: {
+                    'next': self._central_hostname,
+                    'cost': central_cost
+                }
+            })
 
     def run(self):
         send_data = {
@@ -574,20 +660,26 @@ class CentralizedMember(LS):
         self._transport.send(self._central_hostname, send_data)
         log('send neighbor information to {}: {}'.format(self._central_hostname, send_data['data']['neighbor']))
 
-        self._timer_thread = threading.Timer(self._interval, CentralizedMember.run, args=(self,))
-        self._timer_thread.start()
+        self._timer_thread = self._clock.call_later(self._interval, CentralizedMember.run, self)
 
     def _check_timeout(self):
         pass
 
 class CentralizedController(Algorithm):
     def receive(self, src, data):
+        self.receive_batch([(src, data)])
+
+    def receive_batch(self, items):
+        """
+        take in the neighbors of several members under one lock
+        """
         dead_hostnames = []
-        current_time = time.time()
+        current_time = self._clock.time()
 
-        log('receive routing data from {}: {}'.format(src, data))
         with self._alive_table_lock:
-            self._alive_table[src] = current_time
+            for src, data in items:
+                log('receive routing data from {}: {}'.format(src, data))
+                self._alive_table[src] = current_time
             dead_hostnames = [hostname
                               for hostname in self._alive_table
                               if current_time - self._alive_table[hostname] > self._timeout]
@@ -597,40 +689,48 @@ class CentralizedController(Algorithm):
             self._neighbor_timeout(dead_hostnames)
 
         dead_hostnames.append(self._hostname)
-        with self._link_state_lock:
-            self._link_state[src] = data['neighbor']
-            for hostname in data['neighbor']:
-                if hostname not in self._link_state:
-                    self._link_state[hostname] = {}
+        # the database is built anew and swapped in, readers may be copying
+        # the published one
+        with self._spf_lock:
+            with self._link_state_lock:
+                link_state = dict(self._link_state)
+            for src, data in items:
+                link_state[src] = data['neighbor']
+                for hostname in data['neighbor']:
+                    if hostname not in link_state:
+                        link_state[hostname] = {}
 
             for hostname in dead_hostnames:
-                if hostname in self._link_state:
-                    self._link_state.pop(hostname)
+                if hostname in link_state:
+                    link_state.pop(hostname)
 
-            for hostname in self._link_state:
-                self._link_state[hostname] = {
-                    k: v for k, v in self._link_state[hostname].items()
+            for hostname in link_state:
+                link_state[hostname] = {
+                    k: v for k, v in link_state[hostname].items()
                     if k not in dead_hostnames
                 }
+            with self._link_state_lock:
+                self._link_state = link_state
 
     def run(self):
-        current_time = time.time()
+        current_time = self._clock.time()
 
         with self._alive_table_lock:
             alive_hosts = [hostname
                            for hostname in self._alive_table
                            if current_time - self._alive_table[hostname] <= self._timeout]
             info('alive_hosts: {}'.format(alive_hosts))
-            dead_hosts = list(set(self._alive_table.keys()) - set(alive_hosts))
+            dead_hosts = sorted(set(self._alive_table.keys()) - set(alive_hosts))
 
         with self._link_state_lock:
-            send_data = {
-                'type': ALGORITHM_TYPE,
-                'data': {
-                    'link': copy.deepcopy(self._link_state),
-                    'dead': dead_hosts
-                }
+            link_state = self._link_state
+        send_data = {
+            'type': ALGORITHM_TYPE,
+            'data': {
+                'link': copy.deepcopy(link_state),
+                'dead': dead_hosts
             }
+        }
 
         self._neighbor_timeout(dead_hosts)
         for hostname in alive_hosts:
@@ -638,5 +738,4 @@ class CentralizedController(Algorithm):
 
         log('send routing data: {}'.format(send_data['data']['link']))
 
-        self._timer_thread = threading.Timer(self._interval, CentralizedController.run, args=(self,))
-        self._timer_thread.start()
+        self._timer_thread = self._clock.call_later(self._interval, CentralizedController.run, self)
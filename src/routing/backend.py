@@ -0,0 +1,120 @@
+import queue
+import socket
+import threading
+
+
+class UDPBackend:
+    """
+    default backend of Transport, real udp sockets
+    """
+    # whether the backend calls back on arrival instead of being read
+    scheduled = False
+
+    def listen(self, address):
+        """
+        Returns:
+            an endpoint bound to `address`, with `recvfrom` and `close`
+        """
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(address)
+        return s
+
+    def socket(self):
+        """
+        Returns:
+            an unbound endpoint for sending, with `sendto` and `close`
+        """
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+
+class MemoryNetwork:
+    """
+    queue based delivery between transports living in one process
+
+    every listening address owns a queue, sending to an address nobody
+    listens on silently drops the payload, just like udp
+
+    with a clock, payloads aren't queued but scheduled on the clock after
+    `latency` seconds, calling back the listener directly
+    """
+
+    def __init__(self, clock=None, latency=0.001):
+        self.clock = clock
+        self.latency = latency
+        self._queues = {}
+        self._lock = threading.Lock()
+        # payloads and bytes delivered, for benchmarking
+        self.stats = {'datagrams': 0, 'bytes': 0}
+
+    def backend(self):
+        return MemoryBackend(self)
+
+    def bind(self, address, callback=None):
+        """
+        Returns:
+            the queue of `address`, or `callback` itself with a clock
+        """
+        address = tuple(address)
+        with self._lock:
+            if address in self._queues:
+                raise OSError('address {} already in use'.format(address))
+            self._queues[address] = callback if self.clock is not None \
+                else queue.Queue()
+            return self._queues[address]
+
+    def unbind(self, address):
+        with self._lock:
+            self._queues.pop(tuple(address), None)
+
+    def deliver(self, payload, src, address):
+        with self._lock:
+            q = self._queues.get(tuple(address))
+            self.stats['datagrams'] += 1
+            self.stats['bytes'] += len(payload)
+        if q is None:
+            return
+        if self.clock is not None:
+            self.clock.call_later(self.latency, q, payload, src)
+        else:
+            q.put((payload, src))
+
+
+class MemoryBackend:
+    """
+    Transport backend delivering through a `MemoryNetwork`
+    """
+
+    def __init__(self, network):
+        self._network = network
+        self.scheduled = network.clock is not None
+
+    def listen(self, address, callback=None):
+        """
+        Args:
+            callback: callable(payload, src), required by a scheduled backend
+        """
+        return _MemoryEndpoint(self._network, address, callback)
+
+    def socket(self):
+        return _MemoryEndpoint(self._network, None)
+
+
+class _MemoryEndpoint:
+    def __init__(self, network, address, callback=None):
+        self._network = network
+        self._address = address
+        self._queue = network.bind(address, callback) \
+            if address is not None else None
+
+    def recvfrom(self, bufsize):
+        payload, src = self._queue.get()
+        return payload[:bufsize], src
+
+    def sendto(self, payload, address):
+        self._network.deliver(payload, self._address, address)
+        return len(payload)
+
+    def close(self):
+        if self._queue is not None:
+            self._network.unbind(self._address)
+            self._queue = None
@@ -0,0 +1,365 @@
+import base64
+import io as _io
+import os
+import threading
+from collections import deque
+from .io import print_log
+from .clock import RealClock
+
+# bytes of payload per chunk, a chunk frame stays under the 10240 bytes
+# transports read at once, with room for the path it records
+CHUNK_SIZE = 6144
+# chunks sent and not acknowledged yet
+WINDOW = 64
+# retransmission timeout, RFC 6298 style
+INITIAL_RTO = 1.0
+MIN_RTO = 0.2
+MAX_RTO = 30.0
+# a transfer fails when a chunk is sent this many times unacknowledged
+MAX_RETRIES = 8
+# an unfinished incoming transfer is dropped after this many silent seconds
+IDLE_TIMEOUT = 120
+# finished incoming transfers remembered, to acknowledge late duplicates
+FINISHED = 64
+
+
+def log(message):
+    print_log("[Bulk] {0}".format(message))
+
+
+def info(message):
+    log("[INFO] {0}".format(message))
+
+
+def error(message):
+    log("[ERROR] {0}".format(message))
+
+
+class _Outgoing:
+    def __init__(self, transfer_id, destination, reader, closer, size,
+                 on_done):
+        self.id = transfer_id
+        self.destination = destination
+        # reader(seq) returns the bytes of chunk `seq`, closer() releases
+        # what the reader holds, if anything
+        self.reader = reader
+        self.closer = closer
+        self.size = size
+        self.total = max(1, (size + CHUNK_SIZE - 1) // CHUNK_SIZE)
+        self.on_done = on_done
+        # lowest chunk not acknowledged, and next chunk never sent
+        self.base = 0
+        self.next = 0
+        self.acked = set()
+        # self.in_flight = {seq: [sent time, sends, deadline]}
+        self.in_flight = {}
+        self.srtt = None
+        self.rttvar = None
+        self.rto = INITIAL_RTO
+        self.timer = None
+        self.timer_due = None
+        self.started = None
+        self.sent = 0
+        self.retransmitted = 0
+        self.lock = threading.Lock()
+
+
+class _Incoming:
+    def __init__(self, total, size, sink, now):
+        self.total = total
+        self.size = size
+        self.sink = sink
+        # next chunk to write, and the ones received ahead of it
+        self.next = 0
+        self.ahead = {}
+        self.last_seen = now
+
+
+class Bulk:
+    """
+    reliable transfer of large payloads between two routers
+
+    payloads are cut into chunks sent with a selective-repeat sliding
+    window: every chunk is acknowledged on its own, along with how many
+    chunks arrived in order, and only the chunks whose timeout expires are
+    sent again, the timeout adapts to the round-trip time as in RFC 6298
+    with Karn's rule
+
+    the receiver writes chunks in order to memory or, with `receive_dir`,
+    to a file, keeping only the chunks that arrived ahead of a missing one
+    """
+    TYPE = 'Bulk'
+
+    def __init__(self, hostname, transport, dispatcher, clock=None,
+                 receive_dir=None, window=WINDOW):
+        """
+        Args:
+            receive_dir: directory incoming payloads are streamed to, kept
+                         in memory if None
+            window: chunks in flight per transfer
+        """
+        self._hostname = hostname
+        self._transport = transport
+        self._clock = clock if clock is not None else RealClock()
+        self.receive_dir = receive_dir
+        self._window = window
+        self._count = 0
+        # self._outgoing = {transfer id: _Outgoing}
+        self._outgoing = {}
+        # self._incoming = {(src, transfer id): _Incoming}
+        self._incoming = {}
+        self._finished = deque(maxlen=FINISHED)
+        self._lock = threading.Lock()
+        self.observers = list()
+        dispatcher.register(Bulk.TYPE, self)
+
+    def on_receive(self, observer):
+        """
+        Args:
+            observer: callable(src, transfer id, payload), payload is the
+                      bytes received, or the path of the file they were
+                      written to
+        """
+        self.observers.append(observer)
+
+    def send(self, destination, data=None, path=None, on_done=None):
+        """ Send `data`, or the file at `path`, to `destination`
+
+        Args:
+            on_done: callable(transfer id, ok, stats), called once the
+                     last chunk is acknowledged or the transfer failed
+        Returns:
+            str: id of the transfer
+        """
+        if path is not None:
+            size = os.path.getsize(path)
+            f = open(path, 'rb')
+
+            def reader(seq):
+                f.seek(seq * CHUNK_SIZE)
+                return f.read(CHUNK_SIZE)
+            closer = f.close
+        else:
+            view = memoryview(data)
+            size = len(view)
+
+            def reader(seq):
+                return view[seq * CHUNK_SIZE:(seq + 1) * CHUNK_SIZE]
+            closer = None
+
+        with self._lock:
+            self._count += 1
+            transfer_id = '{}-{}-{}'.format(
+                self._hostname, int(self._clock.time() * 1000), self._count)
+            transfer = _Outgoing(transfer_id, destination, reader, closer,
+                                 size, on_done)
+            self._outgoing[transfer_id] = transfer
+
+        info('sending {} bytes to {} in {} chunks, transfer {}'.format(
+            size, destination, transfer.total, transfer_id))
+        with transfer.lock:
+            transfer.started = self._clock.time()
+            self._fill(transfer)
+            self._arm(transfer)
+        return transfer_id
+
+    def receive(self, src, data):
+        if data['op'] == 'data':
+            self._receive_chunk(src, data)
+        elif data['op'] == 'ack':
+            self._receive_ack(data)
+
+    def _send_chunk(self, transfer, seq, now):
+        # called with the transfer lock held
+        chunk = transfer.reader(seq)
+        flight = transfer.in_flight.get(seq)
+        if flight is None:
+            transfer.in_flight[seq] = [now, 1, now + transfer.rto]
+        else:
+            flight[1] += 1
+            flight[2] = now + transfer.rto
+            transfer.retransmitted += 1
+        transfer.sent += 1
+        self._transport.send(transfer.destination, {
+            'type': Bulk.TYPE,
+            'data': {
+                'op': 'data',
+                'id': transfer.id,
+                'seq': seq,
+                'total': transfer.total,
+                'size': transfer.size,
+                'chunk': base64.b64encode(chunk).decode()
+            }
+        })
+
+    def _fill(self, transfer):
+        # called with the transfer lock held
+        now = self._clock.time()
+        while transfer.next < transfer.total and \
+                transfer.next < transfer.base + self._window:
+            self._send_chunk(transfer, transfer.next, now)
+            transfer.next += 1
+
+    def _arm(self, transfer):
+        """
+        keep one timer per transfer, due at the earliest chunk deadline
+        """
+        # called with the transfer lock held
+        if len(transfer.in_flight) == 0:
+            return
+        due = min(flight[2] for flight in transfer.in_flight.values())
+        if transfer.timer_due is not None and transfer.timer_due <= due:
+            return
+        if transfer.timer is not None:
+            transfer.timer.cancel()
+        transfer.timer_due = due
+        transfer.timer = self._clock.call_later(
+            due - self._clock.time(), self._timeout, transfer)
+
+    def _timeout(self, transfer):
+        with transfer.lock:
+            transfer.timer = transfer.timer_due = None
+            if transfer.id not in self._outgoing:
+                return
+            now = self._clock.time()
+            expired = sorted(seq for seq, flight in transfer.in_flight.items()
+                             if flight[2] <= now)
+            if len(expired) != 0:
+                if any(transfer.in_flight[seq][1] >= MAX_RETRIES
+                       for seq in expired):
+                    self._finish(transfer, False)
+                    return
+                # back off once per expiry, not once per chunk
+                transfer.rto = min(MAX_RTO, transfer.rto * 2)
+                for seq in expired:
+                    self._send_chunk(transfer, seq, now)
+            self._arm(transfer)
+
+    def _receive_ack(self, data):
+        transfer = self._outgoing.get(data['id'])
+        if transfer is None:
+            return
+        with transfer.lock:
+            now = self._clock.time()
+            for seq in [data['seq']] + list(range(transfer.base,
+                                                  data['cumulative'])):
+                flight = transfer.in_flight.pop(seq, None)
+                if flight is None:
+                    continue
+                transfer.acked.add(seq)
+                # Karn's rule, a retransmitted chunk's ack is ambiguous
+                if flight[1] == 1 and seq == data['seq']:
+                    self._sample(transfer, now - flight[0])
+            while transfer.base in transfer.acked:
+                transfer.acked.discard(transfer.base)
+                transfer.base += 1
+            if transfer.base >= transfer.total:
+                self._finish(transfer, True)
+                return
+            self._fill(transfer)
+            self._arm(transfer)
+
+    def _sample(self, transfer, rtt):
+        if transfer.srtt is None:
+            transfer.srtt = rtt
+            transfer.rttvar = rtt / 2
+        else:
+            transfer.rttvar = 0.75 * transfer.rttvar + \
+                0.25 * abs(transfer.srtt - rtt)
+            transfer.srtt = 0.875 * transfer.srtt + 0.125 * rtt
+        transfer.rto = min(MAX_RTO, max(MIN_RTO,
+                                        transfer.srtt + 4 * transfer.rttvar))
+
+    def _finish(self, transfer, ok):
+        # called with the transfer lock held
+        with self._lock:
+            self._outgoing.pop(transfer.id, None)
+        if transfer.timer is not None:
+            transfer.timer.cancel()
+            transfer.timer = transfer.timer_due = None
+        if transfer.closer is not None:
+            transfer.closer()
+        elapsed = self._clock.time() - transfer.started
+        stats = {
+            'size': transfer.size,
+            'chunks': transfer.total,
+            'sent': transfer.sent,
+            'retransmitted': transfer.retransmitted,
+            'time': elapsed,
+            'throughput': transfer.size / elapsed if elapsed > 0 else None,
+            'srtt': transfer.srtt,
+            'rto': transfer.rto
+        }
+        if ok:
+            info('transfer {} done: {}'.format(transfer.id, stats))
+        else:
+            error('transfer {} to {} failed'.format(
+                transfer.id, transfer.destination))
+        if transfer.on_done is not None:
+            transfer.on_done(transfer.id, ok, stats)
+
+    def _sink(self, src, transfer_id):
+        if self.receive_dir is None:
+            return _io.BytesIO()
+        return open(os.path.join(self.receive_dir, '{}-{}'.format(
+            src, transfer_id)), 'wb')
+
+    def _receive_chunk(self, src, data):
+        key = (src, data['id'])
+        seq = data['seq']
+        done = None
+        with self._lock:
+            now = self._clock.time()
+            incoming = self._incoming.get(key)
+            if incoming is None:
+                if key in self._finished:
+                    cumulative = data['total']
+                    incoming = None
+                else:
+                    self._expire(now)
+                    incoming = self._incoming[key] = _Incoming(
+                        data['total'], data['size'],
+                        self._sink(src, data['id']), now)
+            if incoming is not None:
+                incoming.last_seen = now
+                if seq >= incoming.next and seq not in incoming.ahead:
+                    incoming.ahead[seq] = base64.b64decode(data['chunk'])
+                    while incoming.next in incoming.ahead:
+                        incoming.sink.write(incoming.ahead.pop(incoming.next))
+                        incoming.next += 1
+                cumulative = incoming.next
+                if incoming.next == incoming.total:
+                    del self._incoming[key]
+                    self._finished.append(key)
+                    done = incoming
+
+        self._transport.send(src, {
+            'type': Bulk.TYPE,
+            'data': {
+                'op': 'ack',
+                'id': data['id'],
+                'seq': seq,
+                'cumulative': cumulative
+            }
+        })
+        if done is not None:
+            self._deliver(src, data['id'], done)
+
+    def _deliver(self, src, transfer_id, incoming):
+        if isinstance(incoming.sink, _io.BytesIO):
+            payload = incoming.sink.getvalue()
+        else:
+            incoming.sink.close()
+            payload = incoming.sink.name
+        info('received {} bytes from {}, transfer {}'.format(
+            incoming.size, src, transfer_id))
+        for observer in list(self.observers):
+            observer(src, transfer_id, payload)
+
+    def _expire(self, now):
+        # called with the lock held
+        for key, incoming in list(self._incoming.items()):
+            if now - incoming.last_seen > IDLE_TIMEOUT:
+                info('transfer {} from {} timed out'.format(key[1], key[0]))
+                incoming.sink.close()
+                del self._incoming[key]
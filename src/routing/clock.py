@@ -0,0 +1,92 @@
+import heapq
+import threading
+import time
+
+
+class RealClock:
+    """
+    wall clock time, work is scheduled on timer threads
+    """
+    virtual = False
+
+    def time(self):
+        return time.time()
+
+    def call_later(self, delay, callback, *args):
+        """
+        run `callback(*args)` after `delay` seconds
+        Returns:
+            a handle with `cancel()`
+        """
+        timer = threading.Timer(delay, callback, args=args)
+        timer.start()
+        return timer
+
+
+class _Event:
+    def __init__(self, when, seq, callback, args):
+        self.when = when
+        self.seq = seq
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.when, self.seq) < (other.when, other.seq)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """
+    discrete-event clock, time only advances when the event loop runs
+
+    every scheduled callback runs on the thread driving the loop, in order
+    of due time and then of scheduling, so a run is deterministic and hours
+    of protocol time replay as fast as the callbacks execute
+    """
+    virtual = True
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._seq = 0
+        self._events = []
+        # number of callbacks run so far
+        self.processed = 0
+
+    def time(self):
+        return self._now
+
+    def call_later(self, delay, callback, *args):
+        event = _Event(self._now + max(0, delay), self._seq, callback, args)
+        self._seq += 1
+        heapq.heappush(self._events, event)
+        return event
+
+    def step(self):
+        """
+        run the next due callback
+        Returns:
+            bool: False if nothing is scheduled
+        """
+        while len(self._events) != 0:
+            event = heapq.heappop(self._events)
+            if event.cancelled:
+                continue
+            self._now = event.when
+            self.processed += 1
+            event.callback(*event.args)
+            return True
+        return False
+
+    def run_until(self, when):
+        """
+        run every callback due up to `when`, then set the time to `when`
+        """
+        while len(self._events) != 0 and self._events[0].when <= when:
+            self.step()
+        self._now = max(self._now, when)
+
+    def run_for(self, duration):
+        self.run_until(self._now + duration)
@@ -0,0 +1,315 @@
+import base64
+import json
+import threading
+import time
+import zlib
+from .io import print_log
+from .clock import RealClock
+from .dispatcher import ROUTING, BLOCK
+
+# payloads whose json is shorter than this many bytes are sent as they are
+COMPRESS_THRESHOLD = 512
+LEVEL = 6
+# seconds before asking again a peer that never answered
+HELLO_INTERVAL = 30
+# seconds a dictionary is kept before one with the current hostnames is
+# built, and seconds before shipping a dictionary again to a silent peer
+DICTIONARY_INTERVAL = 60
+# dictionaries of each peer kept, a peer may still use the previous one
+DICTIONARIES = 2
+# bytes of json the hostnames of a dictionary take at most, so that shipping
+# it fits in the datagram a transport receives
+DICTIONARY_BYTES = 8192
+# never compressed, they set compression up
+NEGOTIATION_TYPES = ('Compression', 'Transport')
+
+
+def log(message):
+    print_log("[Compression] {0}".format(message))
+
+
+def info(message):
+    log("[INFO] {0}".format(message))
+
+
+def error(message):
+    log("[ERROR] {0}".format(message))
+
+
+def dictionary_of(hostnames):
+    """
+    Returns:
+        bytes: preset dictionary for payloads naming `hostnames`, the same
+               names always give the same dictionary
+    """
+    # zlib finds matches near the end of the dictionary cheaper, keep the
+    # keys every advertisement has there
+    words = ['"{}": '.format(hostname) for hostname in sorted(hostnames)]
+    words += ['"next": ', '"cost": ', '"routing": ', '"alive": ',
+              '"neighbor": ', '"link": ']
+    return ''.join(words).encode()
+
+
+def fitting(hostnames, limit=DICTIONARY_BYTES):
+    """
+    Returns:
+        list: the first of `hostnames` whose json takes at most `limit`
+              bytes
+    """
+    kept = []
+    size = len('[]')
+    for hostname in hostnames:
+        size += len(json.dumps(hostname)) + len(', ')
+        if size > limit:
+            break
+        kept.append(hostname)
+    return kept
+
+
+class _Peer:
+    def __init__(self):
+        # whether the peer said it decompresses, and when it was last asked
+        self.accepts = False
+        self.asked = None
+        # dictionary ids the peer acknowledged, and when one was shipped
+        self.dictionaries = set()
+        self.shipped = {}
+
+
+class Codec:
+    """
+    end-to-end compression of the payloads sent by a transport
+
+    a router compresses only for destinations that said they decompress:
+    the first payload to an unknown destination goes as it is, along with a
+    hello, and the destination answers with its own; payloads above the
+    threshold are then sent as zlib in base64, routers on the way forward
+    them untouched, and only the destination decompresses them
+
+    payloads are mostly hostnames, so a dictionary built from the hostnames
+    in the routing table is shipped to each peer, the peer acknowledges it
+    and from then on payloads to it are compressed with that dictionary; in
+    a large network only as many hostnames as fit in one datagram are used
+    """
+    TYPE = 'Compression'
+
+    def __init__(self, hostname, send, hostnames, dispatcher,
+                 threshold=COMPRESS_THRESHOLD, clock=None):
+        """
+        Args:
+            send: callable(destination, data, privileged_mode), sends a
+                  payload without compressing it
+            hostnames: callable returning the hostnames known, to build the
+                       dictionary from
+            threshold: bytes of json above which payloads are compressed,
+                       None never compresses
+        """
+        self._hostname = hostname
+        self._send = send
+        self._hostnames = hostnames
+        self.threshold = threshold
+        self._clock = clock if clock is not None else RealClock()
+        # self._peers = {hostname: _Peer}
+        self._peers = {}
+        # dictionary used for new payloads, (id, hostnames, bytes, built at)
+        self._dictionary = None
+        # self._received = {(src, id): bytes}, dictionaries of the peers
+        self._received = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'compressed': 0, 'skipped': 0, 'raw_bytes': 0,
+            'compressed_bytes': 0, 'compress_time': 0.0,
+            'decompressed': 0, 'decompress_time': 0.0, 'failed': 0
+        }
+        dispatcher.register(Codec.TYPE, self, ROUTING, policy=BLOCK)
+
+    def stats(self):
+        """
+        Returns:
+            dict: payloads compressed and skipped as not worth it, bytes of
+                  json before and after, the ratio, cpu seconds spent each
+                  way, and peers compressing with this router
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['peers'] = sum(1 for peer in self._peers.values()
+                                 if peer.accepts)
+        stats['ratio'] = stats['raw_bytes'] / stats['compressed_bytes'] \
+            if stats['compressed_bytes'] else None
+        return stats
+
+    def encode(self, destination, data, privileged_mode=False):
+        """
+        Args:
+            data: {'type': ..., 'data': ...}
+        Returns:
+            dict: `data`, or {'type': ..., 'zlib': str, 'dict': id or None},
+                  compressed without dictionary until `destination`
+                  acknowledged the current one
+        """
+        if self.threshold is None or data['type'] in NEGOTIATION_TYPES or \
+                destination == self._hostname:
+            return data
+        with self._lock:
+            peer = self._peers.setdefault(destination, _Peer())
+            accepts = peer.accepts
+            hello = not accepts and (
+                peer.asked is None or
+                self._clock.time() - peer.asked > HELLO_INTERVAL)
+            if hello:
+                peer.asked = self._clock.time()
+        if hello:
+            self._hello(destination, True, privileged_mode)
+        if not accepts:
+            return data
+
+        raw = json.dumps(data['data']).encode()
+        if len(raw) < self.threshold:
+            with self._lock:
+                self._stats['skipped'] += 1
+            return data
+        dictionary = self._dictionary_for(destination, peer, privileged_mode)
+
+        start = time.thread_time()
+        if dictionary is None:
+            packed = zlib.compress(raw, LEVEL)
+        else:
+            compressor = zlib.compressobj(LEVEL, zdict=dictionary[1])
+            packed = compressor.compress(raw) + compressor.flush()
+        packed = base64.b64encode(packed).decode()
+        elapsed = time.thread_time() - start
+
+        with self._lock:
+            self._stats['compress_time'] += elapsed
+            if len(packed) >= len(raw):
+                self._stats['skipped'] += 1
+                return data
+            self._stats['compressed'] += 1
+            self._stats['raw_bytes'] += len(raw)
+            self._stats['compressed_bytes'] += len(packed)
+        return {
+            'type': data['type'],
+            'zlib': packed,
+            'dict': dictionary[0] if dictionary is not None else None
+        }
+
+    def decode(self, src, data):
+        """
+        Returns:
+            dict: `data` as it was before `encode`, None if it can't be
+                  decompressed
+        """
+        if not isinstance(data, dict) or 'zlib' not in data:
+            return data
+        start = time.thread_time()
+        try:
+            if data['dict'] is None:
+                raw = zlib.decompress(base64.b64decode(data['zlib']))
+            else:
+                with self._lock:
+                    dictionary = self._received.get((src, data['dict']))
+                if dictionary is None:
+                    raise ValueError('unknown dictionary {}'.format(
+                        data['dict']))
+                decompressor = zlib.decompressobj(zdict=dictionary)
+                raw = decompressor.decompress(base64.b64decode(data['zlib']))
+            payload = json.loads(raw.decode())
+        except (ValueError, zlib.error) as err:
+            error('Drop payload from {}: {}'.format(src, err))
+            with self._lock:
+                self._stats['failed'] += 1
+            # most likely this router restarted, start over with src
+            self._hello(src, True)
+            return None
+        with self._lock:
+            self._stats['decompressed'] += 1
+            self._stats['decompress_time'] += time.thread_time() - start
+        return {'type': data['type'], 'data': payload}
+
+    def receive(self, src, data):
+        """
+          Args:
+            data: {
+              'op': 'hello',
+              'reply': bool, whether src waits for the hello of this router
+            } or {
+              'op': 'dict',
+              'id': int, adler32 of the dictionary
+              'hostnames': list, what the dictionary is built from
+            } or {
+              'op': 'dict_ack',
+              'id': int
+            }
+        """
+        if data['op'] == 'hello':
+            with self._lock:
+                # a hello after a restart, forget what src knew
+                peer = self._peers[src] = _Peer()
+                peer.accepts = True
+                peer.asked = self._clock.time()
+                for key in [key for key in self._received if key[0] == src]:
+                    del self._received[key]
+            info('{} decompresses payloads'.format(src))
+            if data['reply']:
+                self._hello(src, False)
+        elif data['op'] == 'dict':
+            dictionary = dictionary_of(data['hostnames'])
+            if zlib.adler32(dictionary) != data['id']:
+                error('dictionary of {} mismatch'.format(src))
+                return
+            with self._lock:
+                self._received[(src, data['id'])] = dictionary
+                kept = [key for key in self._received if key[0] == src]
+                for key in kept[:-DICTIONARIES]:
+                    del self._received[key]
+            self._send(src, {
+                'type': Codec.TYPE,
+                'data': {'op': 'dict_ack', 'id': data['id']}
+            }, False)
+        elif data['op'] == 'dict_ack':
+            with self._lock:
+                peer = self._peers.get(src)
+                if peer is not None:
+                    peer.dictionaries.add(data['id'])
+
+    def _hello(self, destination, reply, privileged_mode=False):
+        self._send(destination, {
+            'type': Codec.TYPE,
+            'data': {'op': 'hello', 'reply': reply}
+        }, privileged_mode)
+
+    def _dictionary_for(self, destination, peer, privileged_mode):
+        """
+        Returns:
+            (int, bytes): id and dictionary `destination` acknowledged, None
+                          while it hasn't
+        """
+        now = self._clock.time()
+        with self._lock:
+            current = self._dictionary
+            if current is None or now - current[3] > DICTIONARY_INTERVAL:
+                hostnames = fitting(sorted(
+                    set(self._hostnames()) | {self._hostname}))
+                if current is None or hostnames != current[1]:
+                    dictionary = dictionary_of(hostnames)
+                    current = (zlib.adler32(dictionary), hostnames,
+                               dictionary, now)
+                else:
+                    current = current[:3] + (now,)
+                self._dictionary = current
+            if current[0] in peer.dictionaries:
+                return current[0], current[2]
+            shipped = peer.shipped.get(current[0])
+            ship = shipped is None or now - shipped > DICTIONARY_INTERVAL
+            if ship:
+                peer.shipped = {current[0]: now}
+        if ship:
+            self._send(destination, {
+                'type': Codec.TYPE,
+                'data': {
+                    'op': 'dict',
+                    'id': current[0],
+                    'hostnames': current[1]
+                }
+            }, privileged_mode)
+        return None
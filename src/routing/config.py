@@ -29,3 +29,39 @@ class Config:
         self.dead_timeout = dead_timeout
         self.update_interval = update_interval
         self.controller = controller_hostname
+
+
+ALGORITHMS = {
+    "DV": Algorithm.DV,
+    "LS": Algorithm.LS,
+    "LS_CENTRALIZE": Algorithm.LS_CENTRALIZE,
+    "LS_CONTROL": Algorithm.LS_CONTROL
+}
+
+
+def from_dict(_config):
+    """
+    Args:
+        _config(dict): a router configuration file, as read by the gui
+            {
+              "hostname": str, "ip": str, "port": int,
+              "hns_ip": str, "hns_port": int,
+              "algorithm": "DV" | "LS" | "LS_CENTRALIZE" | "LS_CONTROL",
+              "dead_timeout": int, "update_interval": int,
+              "controller_hostname": str,
+              "neighbors": [{"hostname": str, "cost": int}, ...]
+            }
+    Returns:
+        (Config, dict[str, int]): the configuration and the initial costs
+                                  of the neighbors
+    """
+    c = Config(algorithm=ALGORITHMS[_config['algorithm']],
+               hostname=_config['hostname'],
+               self_addr=Address(_config['ip'], _config['port']),
+               hns_addr=Address(_config['hns_ip'], _config['hns_port']),
+               dead_timeout=_config['dead_timeout'],
+               update_interval=_config['update_interval'],
+               controller_hostname=_config['controller_hostname'])
+    neighbors = {each['hostname']: each['cost']
+                 for each in _config['neighbors']}
+    return c, neighbors
@@ -7,14 +7,6 @@ from routing import config
 from routing import manager
 
 
-alg = {
-    "DV": config.Algorithm.DV,
-    "LS": config.Algorithm.LS,
-    "LS_CENTRALIZE": config.Algorithm.LS_CENTRALIZE,
-    "LS_CONTROL": config.Algorithm.LS_CONTROL
-}
-
-
 class ConfigFrame(wx.Frame):
     def __init__(self, parent=None, id=-1, UpdateUI=None):
         wx.Frame.__init__(self, parent, id, title='Configure Router', size=(300, 120), pos=(500, 300))
@@ -63,19 +55,10 @@ class ConfigFrame(wx.Frame):
 
     def _validate_init(self, _config):
         try:
-            hns_addr = config.Address(_config['hns_ip'], _config['hns_port'])
-            self_addr = config.Address(_config['ip'], _config['port'])
-            print(alg[_config['algorithm']])
-            c = config.Config(algorithm=alg[_config['algorithm']],
-                              hostname=_config['hostname'],
-                              self_addr=self_addr,
-                              hns_addr=hns_addr,
-                              dead_timeout=_config['dead_timeout'],
-                              update_interval=_config['update_interval'],
-                              controller_hostname=_config['controller_hostname'])
+            c, neighbors = config.from_dict(_config)
+            print(c.algorithm)
             _router = router.Router(c)
-            for each in _config['neighbors']:
-                _router.update_neighbor(each['hostname'], each['cost'])
+            _router.update_neighbors(neighbors)
             manager.init_router(_router)
         except Exception as err:
             raise err
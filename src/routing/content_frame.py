@@ -1,13 +1,93 @@
-import matplotlib
-
-matplotlib.use('WXAgg')
-
-from matplotlib.backends.backend_wxagg import FigureCanvasWxAgg as FigureCanvas
-from matplotlib.figure import Figure
 import wx
 from routing import io, manager
+from routing.topology_frame import TopologyFrame
+from collections import deque
+import shutil
 import sys
 import os
+import tempfile
+import threading
+
+# times per second buffered lines are drawn
+FRAME_RATE = 10
+# lines waiting to be drawn, older ones are skipped when it's full
+PENDING_LINES = 5000
+# lines kept in a text box, the whole history is in the spill file
+VISIBLE_LINES = 2000
+
+
+class LineBuffer:
+    """
+    lines on their way to a read-only text box
+
+    lines are appended from any thread into a bounded ring and the gui
+    thread draws them in one batch per frame, only the last
+    `VISIBLE_LINES` stay in the box while every line is written to a
+    temporary spill file, which is what gets saved
+    """
+
+    def __init__(self, text, prefix):
+        """
+        Args:
+            text(wx.TextCtrl): the box lines are drawn in
+            prefix: of the spill file name
+        """
+        self._text = text
+        self._pending = deque(maxlen=PENDING_LINES)
+        # lines pushed out of `_pending` before being drawn
+        self._skipped = 0
+        self._spill = tempfile.TemporaryFile('w+', prefix=prefix,
+                                             suffix='.txt')
+        self._lock = threading.Lock()
+
+    def append(self, line):
+        with self._lock:
+            if len(self._pending) == PENDING_LINES:
+                self._skipped += 1
+            self._pending.append(line)
+            self._spill.write(line)
+
+    def flush(self):
+        """
+        draw the pending lines, called on the gui thread
+        """
+        with self._lock:
+            if len(self._pending) == 0:
+                return
+            lines = list(self._pending)
+            self._pending.clear()
+            skipped, self._skipped = self._skipped, 0
+        if skipped != 0:
+            lines.insert(0, '... {} lines skipped, save the log to see them\n'
+                         .format(skipped))
+        lines = lines[-VISIBLE_LINES:]
+
+        self._text.Freeze()
+        try:
+            self._text.AppendText(''.join(lines))
+            # lines and positions as the box counts them, a position isn't a
+            # python character where the box stores line ends as \r\n; the
+            # box ends with a line end, so its last line is empty
+            first = self._text.GetNumberOfLines() - 1 - VISIBLE_LINES
+            if first > 0:
+                end = self._text.XYToPosition(0, first)
+                if end > 0:
+                    self._text.Remove(0, end)
+        finally:
+            self._text.Thaw()
+
+    def save(self, path):
+        """
+        append the whole history to `path`
+        """
+        with self._lock:
+            self._spill.flush()
+            self._spill.seek(0)
+            try:
+                with open(path, 'a') as file:
+                    shutil.copyfileobj(self._spill, file)
+            finally:
+                self._spill.seek(0, os.SEEK_END)
 
 
 class ContentFrame(wx.Frame):
@@ -28,6 +108,8 @@ class ContentFrame(wx.Frame):
         self.data_text = None
         self.message_text = None
         self.log_text = None
+        self.messages = None
+        self.logs = None
 
         self.UpdateUI = UpdateUI
         self.init_UI()
@@ -36,6 +118,18 @@ class ContentFrame(wx.Frame):
     def init_UI(self):
         self.init_main()
         self.init_menu()
+        self.init_render()
+
+    def init_render(self):
+        """
+        Draw the buffered messages and logs at a fixed frame rate
+        """
+        prefix = 'router-{}-'.format(self.hostname)
+        self.messages = LineBuffer(self.message_text, prefix + 'message-')
+        self.logs = LineBuffer(self.log_text, prefix + 'log-')
+        self.render_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._render_handler, self.render_timer)
+        self.render_timer.Start(1000 // FRAME_RATE)
 
     def init_main(self):
         """
@@ -121,6 +215,10 @@ class ContentFrame(wx.Frame):
         self.Bind(wx.EVT_MENU, self._show_neigbor_table_handler, show_neighbor_table)
         display_menu.Append(show_neighbor_table)
 
+        show_topology = wx.MenuItem(display_menu, wx.ID_ANY, text="Show Topology", kind=wx.ITEM_NORMAL)
+        self.Bind(wx.EVT_MENU, self._show_topology_handler, show_topology)
+        display_menu.Append(show_topology)
+
         menu_bar.Append(display_menu, "&Display")
 
         self.SetMenuBar(menu_bar)
@@ -131,18 +229,21 @@ class ContentFrame(wx.Frame):
         self.hostname_choice.SetItems(self.hostnames)
 
     def listen_message_event(self, data):
-        wx.CallAfter(self.message_text.AppendText, data)
+        self.messages.append(data)
 
     def listen_log_event(self, data):
-        wx.CallAfter(self.log_text.AppendText, data)
+        self.logs.append(data)
+
+    def _render_handler(self, _):
+        self.messages.flush()
+        self.logs.flush()
 
     def _save_message_handler(self, _):
         dlg = wx.FileDialog(self, "Create a file", os.getcwd(), "message.txt", style=wx.FD_SAVE)
 
         if dlg.ShowModal() == wx.ID_OK:
             try:
-                file = open(dlg.GetPath(), 'a')
-                file.write(self.message_text.GetValue())
+                self.messages.save(dlg.GetPath())
                 wx.MessageBox("Save message file succeed!", "Succeed", wx.OK | wx.ICON_INFORMATION)
             except Exception as err:
                 wx.MessageBox(err, "Error", wx.OK | wx.ICON_ERROR)
@@ -153,8 +254,7 @@ class ContentFrame(wx.Frame):
 
         if dlg.ShowModal() == wx.ID_OK:
             try:
-                file = open(dlg.GetPath(), 'a')
-                file.write(self.log_text.GetValue())
+                self.logs.save(dlg.GetPath())
                 wx.MessageBox("Save message file succeed!", "Succeed", wx.OK | wx.ICON_INFORMATION)
             except Exception as err:
                 wx.MessageBox(err, "Error", wx.OK | wx.ICON_ERROR)
@@ -192,10 +292,16 @@ class ContentFrame(wx.Frame):
     def _show_routing_table_handler(self, _):
         dlg = DisplayRoutingTableDialog(self)
         dlg.ShowModal()
+        dlg.Destroy()
 
     def _show_neigbor_table_handler(self, _):
         dlg = DisplayNeighborTableDialog(self)
         dlg.ShowModal()
+        dlg.Destroy()
+
+    def _show_topology_handler(self, _):
+        frame = TopologyFrame(self)
+        frame.Show()
 
     def _update_neighbor(self):
         self.neighbor = []
@@ -257,75 +363,209 @@ class MyDialog(wx.Dialog):
         self.EndModal(wx.ID_CANCEL)
 
 
-class DisplayRoutingTableDialog(wx.Dialog):
-    def __init__(self, parent):
-        wx.Dialog.__init__(self, parent, -1, "Routing Table", size=(400, 300))
-        self.init_UI()
+class TableView(wx.ListCtrl):
+    """
+    virtual list of a table, only the rows on screen are ever drawn
+
+    rows are kept by key and `apply` takes only the rows that changed, the
+    visible order is computed again only when a row shows up, goes away or
+    moves, otherwise just the changed rows are refreshed
+    """
+
+    def __init__(self, parent, columns):
+        wx.ListCtrl.__init__(self, parent, -1,
+                             style=wx.LC_REPORT | wx.LC_VIRTUAL |
+                             wx.LC_SINGLE_SEL)
+        for i, column in enumerate(columns):
+            self.InsertColumn(i, column, width=120)
+        # self._rows = {key: (value of each column)}
+        self._rows = {}
+        # keys of the rows shown, filtered and sorted
+        self._order = []
+        # self._index = {key: position in self._order}
+        self._index = {}
+        self._sort_column = 0
+        self._ascending = True
+        self._filter = ''
+        self.Bind(wx.EVT_LIST_COL_CLICK, self._sort_handler)
+
+    def OnGetItemText(self, item, column):
+        return str(self._rows[self._order[item]][column])
+
+    def counts(self):
+        """
+        Returns:
+            (int, int): rows shown and rows in the table
+        """
+        return len(self._order), len(self._rows)
 
-    def init_UI(self):
+    def set_filter(self, text):
+        self._filter = text.lower()
+        self._reorder()
+
+    def apply(self, changes):
+        """
+        Args:
+            changes: {key: row, a tuple of column values, None if removed}
+        """
+        reorder = False
+        for key, row in changes.items():
+            old = self._rows.pop(key, None)
+            if row is not None:
+                self._rows[key] = row
+            shown = row is not None and self._matches(row)
+            if shown != (key in self._index) or (shown and (
+                    old[self._sort_column] != row[self._sort_column])):
+                reorder = True
+        if reorder:
+            self._reorder()
+            return
+        for key in changes:
+            index = self._index.get(key)
+            if index is not None:
+                self.RefreshItem(index)
+
+    def _matches(self, row):
+        return self._filter == '' or \
+            any(self._filter in str(value).lower() for value in row)
+
+    def _reorder(self):
+        column = self._sort_column
+        self._order = sorted(
+            (key for key, row in self._rows.items() if self._matches(row)),
+            key=lambda key: (self._rows[key][column], key),
+            reverse=not self._ascending)
+        self._index = {key: i for i, key in enumerate(self._order)}
+        self.SetItemCount(len(self._order))
+        self.Refresh()
+
+    def _sort_handler(self, event):
+        if event.GetColumn() == self._sort_column:
+            self._ascending = not self._ascending
+        else:
+            self._sort_column, self._ascending = event.GetColumn(), True
+        self._reorder()
+
+
+class TableDialog(wx.Dialog):
+    """
+    live view of a table of the router
+
+    observers of the table run on the router's threads, the changes they
+    get are merged until the gui thread applies them in one go
+    """
+
+    def __init__(self, parent, title, columns, table, row):
+        """
+        Args:
+            table: the table shown, with on_update, remove_observer and
+                   get_all, as RoutingTable and NeighborTable have
+            row: callable(key, value), the column values of an entry
+        """
+        wx.Dialog.__init__(self, parent, -1, title, size=(400, 300))
+        self.filter_text = None
+        self.view = None
+        self.count_label = None
+        self._table = table
+        self._row = row
+        self._changes = {}
+        self._scheduled = False
+        self._changes_lock = threading.Lock()
+        self.init_UI(columns)
+        self.subscribe()
+
+    def init_UI(self, columns):
         panel = wx.Panel(self)
-        self.figure = Figure()
-        self.axes = self.figure.add_subplot(111)
-
-        collabel = ("Destination", "Next Hop", "Cost")
-        self.axes.axis('off')
-
-        the_table = self.axes.table(cellText=self._get_routint_table(),
-                                    colLabels=collabel,
-                                    cellLoc='center',
-                                    loc='center',
-                                    alpha=1)
-        the_table.set_fontsize(15)
-        the_table.scale(1, 3)
-
-        self.canvas = FigureCanvas(panel, -1, self.figure)
-        self.sizer = wx.BoxSizer(wx.VERTICAL)
-        self.sizer.Add(self.canvas, 1, wx.LEFT | wx.TOP | wx.GROW)
-        self.SetSizer(self.sizer)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+
+        self.filter_text = wx.SearchCtrl(panel)
+        self.filter_text.ShowCancelButton(True)
+        self.Bind(wx.EVT_TEXT, self._filter_handler, self.filter_text)
+        self.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self._cancel_filter_handler,
+                  self.filter_text)
+
+        self.view = TableView(panel, columns)
+        self.count_label = wx.StaticText(panel, label="")
+
+        vbox.Add(self.filter_text, 0, wx.ALL | wx.EXPAND, 5)
+        vbox.Add(self.view, 1, wx.ALL | wx.EXPAND, 5)
+        vbox.Add(self.count_label, 0, wx.ALL | wx.EXPAND, 5)
+        panel.SetSizer(vbox)
         self.Center()
-        panel.Fit()
 
-    def _get_routint_table(self):
-        routing_table = manager.router.get_routing_table()
-        matrix = []
-        for each in routing_table:
-            matrix.append([each, routing_table[each]['next'], routing_table[each]['cost']])
-        return matrix
+    def subscribe(self):
+        self._table.on_update(self._table_handler)
+        self._table_handler(self._table.get_all())
 
+    def unsubscribe(self):
+        self._table.remove_observer(self._table_handler)
 
-class DisplayNeighborTableDialog(wx.Dialog):
+    def Destroy(self):
+        self.unsubscribe()
+        return wx.Dialog.Destroy(self)
+
+    def changes_of(self, update):
+        """
+        Args:
+            update: what the table passes its observers
+        Returns:
+            dict: {key: value, None if removed}, as the routing table
+                  notifies
+        """
+        return update
+
+    def _table_handler(self, update):
+        changes = {key: self._row(key, value) if value is not None else None
+                   for key, value in self.changes_of(update).items()}
+        with self._changes_lock:
+            self._changes.update(changes)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        wx.CallAfter(self._apply_changes)
+
+    def _apply_changes(self):
+        with self._changes_lock:
+            changes, self._changes = self._changes, {}
+            self._scheduled = False
+        # the dialog may be gone by the time this runs
+        if not self:
+            return
+        self.view.apply(changes)
+        self.count_label.SetLabel("{} of {} entries".format(
+            *self.view.counts()))
+
+    def _filter_handler(self, _):
+        self.view.set_filter(self.filter_text.GetValue())
+        self.count_label.SetLabel("{} of {} entries".format(
+            *self.view.counts()))
+
+    def _cancel_filter_handler(self, _):
+        self.filter_text.SetValue("")
+
+
+class DisplayRoutingTableDialog(TableDialog):
     def __init__(self, parent):
-        wx.Dialog.__init__(self, parent, -1, "Neighbor Table", size=(400, 300))
-        self.init_UI()
+        TableDialog.__init__(
+            self, parent, "Routing Table", ("Destination", "Next Hop", "Cost"),
+            manager.router.routing_table,
+            lambda destination, entry: (destination, entry['next'],
+                                        entry['cost']))
 
-    def init_UI(self):
-        panel = wx.Panel(self)
-        self.figure = Figure()
-        self.axes = self.figure.add_subplot(111)
-
-        collabel = ("Destination", "Cost")
-        self.axes.axis('off')
-
-        the_table = self.axes.table(cellText=self._get_neighbor_table(),
-                                    colLabels=collabel,
-                                    cellLoc='center',
-                                    loc='center',
-                                    alpha=1)
-        the_table.set_fontsize(15)
-        the_table.scale(1, 3)
-
-        self.canvas = FigureCanvas(panel, -1, self.figure)
-        self.sizer = wx.BoxSizer(wx.VERTICAL)
-        self.sizer.Add(self.canvas, 1, wx.LEFT | wx.TOP | wx.GROW)
-        self.SetSizer(self.sizer)
-        self.Center()
-        panel.Fit()
 
-    def _get_neighbor_table(self):
-        routing_table = manager.router.get_neighbor_table()
-        matrix = []
-        for key in routing_table:
-            matrix.append([key, routing_table[key]])
-        if len(matrix) == 0:
-            matrix.append(["----", "----"])
-        return matrix
+class DisplayNeighborTableDialog(TableDialog):
+    def __init__(self, parent):
+        # costs last seen, the neighbor table notifies the whole table
+        self._neighbors = {}
+        TableDialog.__init__(
+            self, parent, "Neighbor Table", ("Destination", "Cost"),
+            manager.router.neighbor_table,
+            lambda hostname, cost: (hostname, cost))
+
+    def changes_of(self, table):
+        changes = {hostname: cost for hostname, cost in table.items()
+                   if self._neighbors.get(hostname) != cost}
+        changes.update({hostname: None for hostname in self._neighbors
+                        if hostname not in table})
+        self._neighbors = table
+        return changes
@@ -1,21 +1,256 @@
+import threading
+from collections import deque
+from .io import print_log
+
+# priorities of the receivers, each one is served by its own worker so a
+# routing recomputation never holds back a handshake, nor a burst of
+# messages a routing update
+HANDSHAKE = 0
+ROUTING = 1
+DATA = 2
+
+# what happens to an item arriving at a full queue: the listener waits for
+# room, up to BLOCK_TIMEOUT, which in turn fills the socket buffer and pushes
+# back on the senders, or the oldest item queued, or the new one, is dropped;
+# COALESCE drops the oldest item of the same source, which the new one
+# supersedes, and waits as BLOCK does when there is none
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+COALESCE = 'coalesce'
+
+QUEUE_CAPACITY = 1024
+BLOCK_TIMEOUT = 1.0
+
+
+def log(message):
+    print_log("[Dispatcher] {0}".format(message))
+
+
+def error(message):
+    log("[ERROR] {0}".format(message))
+
+
+class _Queue:
+    def __init__(self, t, receiver, priority, capacity, policy):
+        self.type = t
+        self.receiver = receiver
+        self.priority = priority
+        self.capacity = capacity
+        self.policy = policy
+        self.items = deque()
+        self.dispatched = 0
+        self.batches = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.max_depth = 0
+
+
 class DataDispatcher:
-    def __init__(self):
+    """
+    hands the data received to the receiver registered for its type
+
+    once running, and unless `threaded` is False, receivers aren't called
+    on the thread dispatching, which is the listener of the transport, but
+    from a bounded queue per type; one worker per priority takes turns
+    between the queues of its priority, so the data of one type is
+    received in order and on one thread
+
+    a receiver with a `receive_batch(items)` method gets everything queued
+    for its type at once, as a list of (source, data), so it can fold a
+    burst into one update
+    """
+
+    def __init__(self, threaded=True):
+        """
+        Args:
+            threaded: False calls receivers inline, as the virtual clock
+                      needs every delivery to happen on its own thread
+        """
         self.dispatcher = {}
+        self.threaded = threaded
+        self._running = False
+        self._lock = threading.Lock()
+        # a worker waits for items of its priority, a blocked listener for
+        # room in a queue
+        self._ready = {}
+        self._room = threading.Condition(self._lock)
+        self._waiting = 0
+        # self._queues = {type: _Queue}
+        self._queues = {}
+        # self._lanes = {priority: [_Queue]}, the queues a worker serves
+        self._lanes = {}
+        self._turns = {}
+        # workers of an earlier run exit instead of serving a later one
+        self._generation = 0
 
-    def register(self, t, receiver):
+    def register(self, t, receiver, priority=DATA, capacity=QUEUE_CAPACITY,
+                 policy=DROP_NEWEST):
         """
         Registers receiver for each type of data
+        Args:
+            priority: HANDSHAKE, ROUTING or DATA, the worker serving it
+            capacity: items queued at most
+            policy: BLOCK, DROP_OLDEST, DROP_NEWEST or COALESCE, see above
         """
         self.dispatcher[t] = receiver
+        with self._lock:
+            queue = self._queues.get(t)
+            if queue is not None:
+                self._lanes[queue.priority].remove(queue)
+            new = _Queue(t, receiver, priority, capacity, policy)
+            if queue is not None:
+                new.items = queue.items
+            self._queues[t] = new
+            self._lanes.setdefault(priority, []).append(new)
+            start = self._running and priority not in self._turns
+            self._turns.setdefault(priority, 0)
+            ready = self._ready.setdefault(
+                priority, threading.Condition(self._lock))
+            ready.notify()
+        if start:
+            self._start_worker(priority)
+
+    def run(self):
+        """
+        start the workers, receivers are called inline until then
+        """
+        if not self.threaded:
+            return
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            priorities = list(self._lanes)
+        for priority in priorities:
+            self._start_worker(priority)
+
+    def stop(self):
+        """
+        stop the workers once they are done with what they receive, what
+        is queued is dropped
+        """
+        with self._lock:
+            self._running = False
+            self._generation += 1
+            for queue in self._queues.values():
+                queue.items.clear()
+            for ready in self._ready.values():
+                ready.notify_all()
+            self._room.notify_all()
 
     def dispatch(self, t, source, data):
         """
         Dispatch certain type data to proper receiver
         Returns:
             bool: True if type specified by `t` has a receiver, False if not
+                  or if the data is dropped for a full queue
         """
         receiver = self.dispatcher.get(t)
         if receiver is None:
             return False
-        receiver.receive(source, data)
+        if not self._running:
+            receiver.receive(source, data)
+            return True
+
+        with self._lock:
+            queue = self._queues[t]
+            if len(queue.items) >= queue.capacity:
+                if queue.policy == COALESCE and \
+                        self._supersede(queue, source):
+                    queue.dropped += 1
+                elif queue.policy in (BLOCK, COALESCE):
+                    queue.blocked += 1
+                    self._waiting += 1
+                    self._room.wait_for(
+                        lambda: len(queue.items) < queue.capacity or
+                        not self._running, BLOCK_TIMEOUT)
+                    self._waiting -= 1
+                elif queue.policy == DROP_OLDEST:
+                    queue.items.popleft()
+                    queue.dropped += 1
+            if len(queue.items) >= queue.capacity or not self._running:
+                queue.dropped += 1
+                return False
+            queue.items.append((source, data))
+            queue.max_depth = max(queue.max_depth, len(queue.items))
+            self._ready[queue.priority].notify()
         return True
+
+    def stats(self):
+        """
+        Returns:
+            dict: {type: {'queued', 'max_depth', 'dispatched', 'batches',
+                          'dropped', 'blocked'}}, batches counts the calls
+                  of receive_batch, blocked the items that found their
+                  queue full and waited
+        """
+        with self._lock:
+            return {t: {
+                'queued': len(queue.items),
+                'max_depth': queue.max_depth,
+                'dispatched': queue.dispatched,
+                'batches': queue.batches,
+                'dropped': queue.dropped,
+                'blocked': queue.blocked
+            } for t, queue in self._queues.items()}
+
+    def _supersede(self, queue, source):
+        """
+        drop the oldest item of `source` from `queue`, called with the lock
+        held
+        Returns:
+            bool: False if `source` has nothing queued
+        """
+        for i, (src, _) in enumerate(queue.items):
+            if src == source:
+                del queue.items[i]
+                return True
+        return False
+
+    def _start_worker(self, priority):
+        threading.Thread(target=self._work,
+                         args=(priority, self._generation),
+                         name='dispatcher-{}'.format(priority),
+                         daemon=True).start()
+
+    def _next(self, priority):
+        # called with the lock held
+        lane = self._lanes.get(priority, [])
+        for i in range(len(lane)):
+            queue = lane[(self._turns[priority] + i) % len(lane)]
+            if len(queue.items) != 0:
+                self._turns[priority] = (self._turns[priority] + i + 1) % \
+                    len(lane)
+                if not hasattr(queue.receiver, 'receive_batch'):
+                    queue.dispatched += 1
+                    return queue, queue.items.popleft()
+                items = list(queue.items)
+                queue.items.clear()
+                queue.dispatched += len(items)
+                queue.batches += 1
+                return queue, items
+        return None
+
+    def _work(self, priority, generation):
+        ready = self._ready[priority]
+        while True:
+            with self._lock:
+                item = None
+                while self._running and generation == self._generation:
+                    item = self._next(priority)
+                    if item is not None:
+                        break
+                    ready.wait()
+                if item is None:
+                    return
+                if self._waiting != 0:
+                    self._room.notify_all()
+            queue, items = item
+            try:
+                if isinstance(items, list):
+                    queue.receiver.receive_batch(items)
+                else:
+                    queue.receiver.receive(*items)
+            except Exception as err:
+                error('{} receiver failed: {!r}'.format(queue.type, err))
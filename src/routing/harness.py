@@ -0,0 +1,158 @@
+import time
+from .router import Router
+from .backend import MemoryNetwork
+from .clock import RealClock
+from .impairment import Impairment
+
+
+def converged(expected, table):
+    """
+    Args:
+        expected: shortest path routes, see Topology.expected_routes, None
+                  for a router computing no routes
+        table: routing table of the router
+    Returns:
+        bool: whether `table` matches the costs, goes through a next hop
+              starting a shortest path, and routes to no host that is gone
+    """
+    if expected is None:
+        return True
+    if any(destination not in expected and entry['cost'] != -1
+           for destination, entry in table.items()):
+        return False
+    return all(destination in table and
+               table[destination]['cost'] == route['cost'] and
+               table[destination]['next'] in route['next']
+               for destination, route in expected.items())
+
+
+class Harness:
+    """
+    headless network of routers living in one process
+
+    routers talk through a `MemoryNetwork` instead of udp sockets and know
+    each other's address from the topology, so no hns is needed
+
+    with a `VirtualClock` every timer and delivery is an event on the clock,
+    nothing runs on its own thread, and waiting advances virtual time
+    """
+
+    def __init__(self, topology, network=None, clock=None):
+        """
+        Args:
+            topology(routing.topology.Topology): the network to build
+            network(MemoryNetwork): shared by all routers, a new one if None
+            clock: shared by all routers, see routing.clock, wall clock
+                   if None
+        """
+        self.topology = topology
+        self.clock = clock if clock is not None else RealClock()
+        if network is None:
+            network = MemoryNetwork(clock) if self.clock.virtual \
+                else MemoryNetwork()
+        self.network = network
+        self.routers = {}
+        # (topology version, {hostname: expected routes})
+        self._expected = (None, {})
+
+    def build(self):
+        """
+        create every router of the topology, without running them
+        """
+        mapping = dict(self.topology.routers)
+        mapping['hns'] = self.topology.hns
+        for hostname in self.topology.routers:
+            router = self.make_router(hostname)
+            router.transport.update_mapping(mapping)
+            self.routers[hostname] = router
+        for (a, b), impairment in self.topology.impairments.items():
+            self.impair(a, b, Impairment.from_dict(impairment))
+
+    def make_router(self, hostname):
+        return Router(self.topology.config(hostname),
+                      self.network.backend(), self.clock)
+
+    def start(self):
+        """
+        run every router and provision the links of the topology
+
+        each link is provisioned once, from its end with the smaller
+        hostname, the other end learns it through the handshake
+        """
+        for router in self.routers.values():
+            router.run()
+        for hostname, router in self.routers.items():
+            router.update_neighbors({
+                neighbor: cost
+                for neighbor, cost in self.topology.neighbors(hostname).items()
+                if hostname < neighbor})
+
+    def stop(self):
+        for router in self.routers.values():
+            router.stop()
+
+    def fail_link(self, a, b):
+        """
+        take down the link between `a` and `b`, both ends drop each other
+        """
+        self.topology.remove_link(a, b)
+        self.routers[a].remove_neighbor(b)
+
+    def set_cost(self, a, b, cost):
+        self.topology.set_link(a, b, cost)
+        self.routers[a].update_neighbor(b, cost)
+
+    def impair(self, a, b, impairment):
+        """
+        emulate a bad link between `a` and `b`, in both directions
+        Args:
+            impairment(routing.impairment.Impairment): None restores the link
+        """
+        self.routers[a].impair(b, impairment)
+        self.routers[b].impair(a, impairment)
+
+    def crash(self, hostname):
+        """
+        stop `hostname` without notice, the others only learn it through
+        their dead timeout
+        """
+        self.topology.remove_router(hostname)
+        self.routers.pop(hostname).stop()
+
+    def unconverged(self):
+        """
+        Returns:
+            list<str>: routers whose routing table doesn't match the shortest
+                       paths of the topology yet, or still routes to a host
+                       that is gone
+        """
+        if self._expected[0] != self.topology.version:
+            self._expected = (self.topology.version, {
+                hostname: self.topology.expected_routes(hostname)
+                for hostname in self.routers})
+        return [hostname for hostname, router in self.routers.items()
+                if not converged(self._expected[1][hostname],
+                                 router.get_routing_table())]
+
+    def wait_converged(self, timeout, poll=0.1):
+        """
+        Returns:
+            float: seconds until every router converged, None on timeout,
+                   virtual seconds with a virtual clock
+        """
+        start = self.clock.time()
+        while self.clock.time() - start < timeout:
+            if len(self.unconverged()) == 0:
+                return self.clock.time() - start
+            self.wait(poll)
+        return None
+
+    def wait(self, seconds):
+        """
+        let the network run for `seconds`, of virtual time if the clock is
+        virtual
+        """
+        if self.clock.virtual:
+            self.clock.run_for(seconds)
+        else:
+            time.sleep(seconds)
@@ -0,0 +1,49 @@
+import bisect
+import hashlib
+
+# virtual nodes per member, smooths the shard sizes
+VIRTUAL_NODES = 64
+
+
+def _hash(key):
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    consistent hashing of hostnames onto hns cluster members
+
+    both hns instances and hosts build the ring from the same member list,
+    so they agree on the owner of every hostname without asking each other
+    """
+
+    def __init__(self, members, virtual_nodes=VIRTUAL_NODES):
+        """
+        Args:
+            members: iterable of member names
+        """
+        self.members = sorted(set(members))
+        self._ring = sorted(
+            (_hash('{0}#{1}'.format(member, i)), member)
+            for member in self.members
+            for i in range(virtual_nodes))
+        self._keys = [key for key, _ in self._ring]
+
+    def owners(self, name, n=2):
+        """
+        Returns:
+            list<str>: the first `n` distinct members clockwise from `name`,
+                       the first is the owner, the rest hold replicas
+        """
+        n = min(n, len(self.members))
+        result = []
+        i = bisect.bisect(self._keys, _hash(name))
+        while len(result) < n:
+            member = self._ring[i % len(self._ring)][1]
+            if member not in result:
+                result.append(member)
+            i += 1
+        return result
+
+    def owner(self, name):
+        return self.owners(name, 1)[0]
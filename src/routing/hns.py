@@ -1,12 +1,30 @@
 import threading
-import copy
 import json
 import socket
+import select
+import selectors
+import time
 from routing import transport
+from routing import io
+from routing.hns_store import MappingStore
+from routing.hash_ring import HashRing
+
+# seconds a queried address may be cached by hosts
+ANSWER_TTL = 60
+# max number of entries carried by one update datagram
+MAX_PUSH_ENTRIES = 100
+# seconds registrations are collected before one consolidated update
+BATCH_WINDOW = 0.05
+# socket receive buffer size in bytes of the event loop server
+RECEIVE_BUFFER = 1 << 20
+# seconds the event loop waits for room in a full send buffer before
+# dropping the datagram, hosts get it again on their next resync
+SEND_TIMEOUT = 0.5
 
 
 def log(message):
-    print("[HNS] {0}".format(message))
+    if not io.quiet:
+        print("[HNS] {0}".format(message))
 
 
 def info(message):
@@ -22,12 +40,17 @@ class HNS:
     A Hostname Server, which can transfer a hostname to an address(ip, port)
     """
 
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, store_dir=None, cluster=None, member='hns'):
         """Initialize this hns
 
         Args:
           ip: str, specify the server's ip
           port: int, specify the port to be listened by server
+          store_dir: str, directory persisting the mapping table, the table
+                     is kept in memory only if None
+          cluster: dict, {member name: (ip, port)} of every instance if
+                   the hostname space is sharded between several instances
+          member: str, name of this instance in `cluster`
         """
         #
         # mapping_table: {
@@ -37,7 +60,42 @@ class HNS:
         self._address = (ip, port)
         self._mapping_table = {'hns': self._address}
         self._mapping_lock = threading.Lock()
-        self._transport_module = transport.Transport('hns', ip, port, ip, port, None, None, None)
+
+        #
+        # every change bumps `_version`, `_changed` records the version at
+        # which each name last changed and `_acked` the latest version each
+        # host has acknowledged, so pushes only carry the delta
+        #
+        self._version = 1
+        self._changed = {'hns': 1}
+        self._acked = {}
+
+        #
+        # in a cluster every hostname is owned by the member the hash ring
+        # maps it to, and replicated to the next member on the ring
+        #
+        self._member = member
+        self._cluster = None
+        self._ring = None
+        self._to_replicate = {}
+        # addresses of hosts registered at other members that asked here
+        self._clients = {}
+        if cluster is not None:
+            self._cluster = {name: tuple(cluster[name]) for name in cluster}
+            self._ring = HashRing(self._cluster.keys())
+            self._mapping_table.update(self._cluster)
+        self._reserved = {'hns'} | set(self._cluster or [])
+
+        self._transport_module = transport.Transport(
+            member, ip, port, ip, port, None, None, None, resolve=False)
+
+        self._store = None
+        if store_dir is not None:
+            self._restore(store_dir)
+
+        # datagrams received and sent, for benchmarking
+        self.stats = {'received': 0, 'sent': 0}
+        self._stats_lock = threading.Lock()
 
     def run(self):
         """ Run the server
@@ -45,6 +103,25 @@ class HNS:
         # create a new thread and listen to specified address
         self.thread_listen = threading.Thread(target=self._listen, args=())
         self.thread_listen.start()
+        self._send_update()
+
+    def _restore(self, store_dir):
+        """ Load the persisted mapping table
+
+        Every restored host is treated as knowing nothing, so the first
+        push after `run` sends the full table to all of them in one pass.
+        """
+        self._store = MappingStore(store_dir)
+        table, version, changed = self._store.load()
+        if version == 0:
+            return
+        self._mapping_table.update(table)
+        self._changed.update(changed)
+        self._version = version
+        self._acked = {name: 0 for name in table if name not in self._reserved}
+        self._merge({'hns': self._address})
+        info('{} entries restored at version {}'.format(
+            len(self._mapping_table), self._version))
 
     def _listen(self):
         """ Start server
@@ -59,6 +136,7 @@ class HNS:
         while True:
             data, addr = s.recvfrom(10240)
             info('Receive data')
+            self._count('received', 1)
             t = threading.Thread(target=self._response, args=(data.decode(),))
             t.start()
 
@@ -66,32 +144,381 @@ class HNS:
         """Response to others' request
 
         Args:
-          data: {..., 'src_name': src, ...}
+          data: {..., 'datagram': {'src': src, 'data': {'data': request}}}
+          request: {
+            'op': 'register', 'entries': {name: (ip, port)}, 'version': int
+          } or {
+            'op': 'ack', 'version': int
+          } or {
+            'op': 'resync'
+          } or {
+            'op': 'query', 'name': str, 'address': (ip, port) of the querier
+          } or {
+            'op': 'replicate', 'entries': {name: (ip, port)}
+          }
+          a register forwarded by another member carries 'host': hostname
         """
         try:
             data = json.loads(data)
-            data = data['datagram']['data']['data']
-            self._mapping_lock.acquire()
-            self._mapping_table.update(data)
-            self._mapping_lock.release()
-
-            self._send_update()
-        except:
+            src = data['datagram']['src']
+            request = data['datagram']['data']['data']
+            op = request['op']
+        except Exception:
             error('Receive wrong data...')
             return
 
-    def _send_update(self):
-        """ When the table is updated, send it to all hosts
+        try:
+            self._handle(src, op, request)
+        except (KeyError, TypeError, ValueError) as err:
+            # a request missing fields, or with fields of the wrong type
+            error('Drop malformed {} request from {}: {!r}'.format(op, src,
+                                                                  err))
+
+    def _handle(self, src, op, request):
+        """ Carry out one request, see `_response`
+        """
+        if op == 'register':
+            host = request.get('host', src)
+            if not self._accepts(host, request.get('failover', False)):
+                self._forward(host, request)
+                return
+            self._register(host, self._public(request['entries']),
+                           request['version'])
+        elif op == 'replicate':
+            with self._mapping_lock:
+                changed = self._merge(self._public(request['entries']))
+            if changed:
+                self._send_update()
+        elif op == 'ack':
+            with self._mapping_lock:
+                if request['version'] > self._acked.get(src, 0):
+                    self._acked[src] = request['version']
+        elif op == 'query':
+            if src not in self._mapping_table and 'address' in request:
+                with self._mapping_lock:
+                    self._clients[src] = tuple(request['address'])
+                    self._sync_mapping()
+            self._answer(src, request['name'])
+        elif op == 'resync':
+            info('full resync requested by {}'.format(src))
+            with self._mapping_lock:
+                self._acked[src] = 0
+            self._send_update([src])
+        else:
+            error('Unknown operation {}'.format(op))
+
+    def _answer(self, src, name):
+        """ Answer the address of `name` to the querying host
         """
-        self._mapping_lock.acquire()
-        mt = copy.deepcopy(self._mapping_table)
-        self._mapping_lock.release()
-        data = {
+        with self._mapping_lock:
+            address = self._mapping_table.get(name)
+        if not self._accepts(name):
+            # the querier has a wrong idea about the owner of `name`
+            self._send_shards([src])
+        self._send([(src, {
             'type': transport.Transport.TYPE,
-            'data': mt
-        }
-        self._transport_module.receive('noname', mt)
+            'data': {
+                'op': 'answer',
+                'name': name,
+                'address': address,
+                'ttl': ANSWER_TTL
+            }
+        })])
+
+    def _register(self, src, entries, version):
+        """ Merge registered entries, bumping the table version on change
+        """
+        with self._mapping_lock:
+            changed = self._merge(entries)
+            # the host tells which version it already holds, anything
+            # newer than that is pushed to it
+            self._acked[src] = min(version, self._version)
+
+        self._send_shards([src])
+        self._send_update(None if changed else [src])
+
+    def _public(self, entries):
+        """ Drop the names hosts may not register
+        """
+        return {name: entries[name] for name in entries
+                if name not in self._reserved}
 
-        for key in mt:
-            if key != 'hns':
-                self._transport_module.send(key, data, True)
+    def _accepts(self, host, failover=True):
+        """ Whether this member owns `host`, or replicates it and the owner
+        is considered down
+        """
+        if self._ring is None:
+            return True
+        owners = self._ring.owners(host)
+        return owners[0] == self._member or \
+            (failover and self._member in owners)
+
+    def _sync_mapping(self):
+        """ Let the transport module reach every known host, must be wrapped
+        with the mapping lock
+        """
+        table = dict(self._clients)
+        table.update(self._mapping_table)
+        self._transport_module.update_mapping(table)
+
+    def _forward(self, host, request):
+        """ Hand a registration over to the owner of `host`
+        """
+        owner = self._ring.owner(host)
+        info('forwarding registration of {} to {}'.format(host, owner))
+        request = dict(request)
+        request['host'] = host
+        self._send([(owner, {
+            'type': transport.Transport.TYPE,
+            'data': request
+        })])
+
+    def _send_shards(self, hosts):
+        """ Tell newly registered hosts the cluster members
+        """
+        if self._cluster is None:
+            return
+        with self._mapping_lock:
+            self._sync_mapping()
+        self._send([(host, {
+            'type': transport.Transport.TYPE,
+            'data': {
+                'op': 'shards',
+                'members': self._cluster
+            }
+        }) for host in hosts])
+
+    def _merge(self, entries):
+        """ Merge entries into the table, must be wrapped with the mapping lock
+
+        Returns:
+          bool: whether the table has changed
+        """
+        changed = False
+        for name in entries:
+            address = tuple(entries[name])
+            if self._mapping_table.get(name) == address:
+                continue
+            self._version += 1
+            self._mapping_table[name] = address
+            self._changed[name] = self._version
+            if self._store is not None:
+                self._store.append(self._version, name, address)
+            if self._ring is not None and name not in self._reserved:
+                owners = self._ring.owners(name)
+                if owners[0] == self._member and len(owners) > 1:
+                    self._to_replicate.setdefault(owners[1], {})[name] = address
+            changed = True
+
+        if self._store is not None and self._store.need_compact():
+            self._store.compact(self._mapping_table, self._version,
+                                self._changed)
+        return changed
+
+    def _make_update(self, host):
+        """ Make the push for `host`, must be wrapped with the mapping lock
+
+        Large pushes are split into several numbered chunks of the same
+        version, so that each of them fits into one datagram; the host
+        applies and acknowledges the version once it has all of them.
+
+        Returns:
+          list: [{
+            'op': 'update',
+            'base': version the delta is based on, 0 for the full table,
+            'version': current version,
+            'chunk': index of this chunk,
+            'chunks': number of chunks of the push,
+            'entries': {name: (ip, port)}
+          }, ...], empty if the host is up to date
+        """
+        base = self._acked.get(host, 0)
+        if base >= self._version:
+            return []
+        if base == 0:
+            names = list(self._mapping_table.keys())
+        else:
+            names = [name for name in self._changed
+                     if self._changed[name] > base]
+        chunks = (len(names) + MAX_PUSH_ENTRIES - 1) // MAX_PUSH_ENTRIES
+        return [{
+            'op': 'update',
+            'base': base,
+            'version': self._version,
+            'chunk': i,
+            'chunks': chunks,
+            'entries': {name: self._mapping_table[name]
+                        for name in names[i * MAX_PUSH_ENTRIES:
+                                          (i + 1) * MAX_PUSH_ENTRIES]}
+        } for i in range(chunks)]
+
+    def _send_update(self, hosts=None):
+        """ Push changed entries to hosts
+
+        Every host only receives the entries changed since the version it
+        has acknowledged.
+
+        Args:
+          hosts: list of hostnames to push to, all registered hosts if None
+        """
+        with self._mapping_lock:
+            self._sync_mapping()
+            if hosts is None:
+                hosts = [name for name in self._acked
+                         if name not in self._reserved]
+            updates = {host: self._make_update(host) for host in hosts}
+            replicas, self._to_replicate = self._to_replicate, {}
+
+        self._send([(host, {
+            'type': transport.Transport.TYPE,
+            'data': update
+        }) for host in updates for update in updates[host]] + [(replica, {
+            'type': transport.Transport.TYPE,
+            'data': {
+                'op': 'replicate',
+                'entries': replicas[replica]
+            }
+        }) for replica in replicas])
+
+    def _send(self, items):
+        """ Send data to hosts
+
+        Args:
+          items: list of (hostname, data) pairs
+        """
+        self._count('sent', len(items))
+        self._transport_module.send_many(items, True)
+
+    def _count(self, key, n):
+        with self._stats_lock:
+            self.stats[key] += n
+
+
+class BatchingHNS(HNS):
+    """Hostname Server running on a single event loop
+
+    Registrations arriving within one batch window are merged together and
+    followed by one consolidated update per host, instead of a full push
+    per registration.
+    """
+
+    def __init__(self, ip, port, window=BATCH_WINDOW, store_dir=None,
+                 cluster=None, member='hns'):
+        """Initialize this hns
+
+        Args:
+          ip: str, specify the server's ip
+          port: int, specify the port to be listened by server
+          window: float, seconds registrations are collected before merging
+          store_dir, cluster, member: see `HNS`
+        """
+        super(BatchingHNS, self).__init__(ip, port, store_dir, cluster, member)
+        self._window = window
+        self._socket = None
+        # self._batch = [(src, entries, version), ...]
+        self._batch = []
+        self._batch_deadline = None
+
+    def run(self):
+        """ Run the server
+        """
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # a startup storm arrives faster than a single loop drains it
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        self._socket.bind(self._address)
+        self._socket.setblocking(False)
+        self.thread_listen = threading.Thread(target=self._loop, args=())
+        self.thread_listen.start()
+        self._send_update()
+
+    def _loop(self):
+        """ Event loop
+
+        Wait for datagrams until the current batch window closes, then
+        apply the batch.
+        """
+        info("Server listenning at {} : {}, batch window {}s".format(
+            self._address[0], self._address[1], self._window))
+        selector = selectors.DefaultSelector()
+        selector.register(self._socket, selectors.EVENT_READ)
+        while True:
+            timeout = None
+            if self._batch_deadline is not None:
+                timeout = max(0, self._batch_deadline - time.time())
+
+            if selector.select(timeout):
+                self._drain()
+
+            if self._batch_deadline is not None and \
+                    time.time() >= self._batch_deadline:
+                try:
+                    self._flush()
+                except Exception as err:
+                    # the loop serves every host, it must outlive a batch
+                    error('Fail to apply a batch: {!r}'.format(err))
+
+    def _drain(self):
+        """ Read all pending datagrams without blocking
+        """
+        while True:
+            try:
+                data, addr = self._socket.recvfrom(10240)
+            except BlockingIOError:
+                return
+            self._count('received', 1)
+            try:
+                self._response(data.decode())
+            except Exception as err:
+                error('Fail to handle datagram from {}: {!r}'.format(addr,
+                                                                     err))
+
+    def _register(self, src, entries, version):
+        """ Queue a registration until the batch window closes
+        """
+        self._batch.append((src, entries, version))
+        if self._batch_deadline is None:
+            self._batch_deadline = time.time() + self._window
+
+    def _flush(self):
+        """ Merge the queued registrations and push one update per host
+        """
+        batch, self._batch = self._batch, []
+        self._batch_deadline = None
+
+        with self._mapping_lock:
+            changed = False
+            for src, entries, version in batch:
+                changed = self._merge(entries) or changed
+            for src, entries, version in batch:
+                self._acked[src] = min(version, self._version)
+        info('{} registrations merged'.format(len(batch)))
+
+        self._send_shards([src for src, _, _ in batch])
+        self._send_update(None if changed else [src for src, _, _ in batch])
+
+    def _send(self, items):
+        self._count('sent', len(items))
+        self._transport_module.send_many(items, True, _Sender(self._socket))
+
+
+class _Sender:
+    """ The non-blocking socket of the event loop, sending as a blocking one
+    would for up to SEND_TIMEOUT when the send buffer is full
+    """
+
+    def __init__(self, sock, timeout=SEND_TIMEOUT):
+        self._socket = sock
+        self._timeout = timeout
+
+    def sendto(self, payload, address):
+        deadline = time.time() + self._timeout
+        while True:
+            try:
+                return self._socket.sendto(payload, address)
+            except BlockingIOError:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    error('Send buffer full, drop datagram to {}'.format(
+                        address))
+                    return 0
+                select.select([], [self._socket], [], remaining)
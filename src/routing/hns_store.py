@@ -0,0 +1,137 @@
+import json
+import mmap
+import os
+
+SNAPSHOT_FILE = 'snapshot.json'
+LOG_FILE = 'changes.log'
+# number of logged changes after which a compacted snapshot is written
+COMPACT_EVERY = 1000
+
+
+class MappingStore:
+    """
+    on-disk store of the hns mapping table
+
+    every change is appended to a log, once the log grows long enough the
+    whole table is written to a snapshot and the log is truncated
+
+    snapshot.json: {
+      'version': int,
+      'entries': {name: [ip, port, version changed]}
+    }
+    changes.log, one json array per line: [version, name, ip, port]
+    """
+
+    def __init__(self, directory, compact_every=COMPACT_EVERY):
+        self._directory = directory
+        self._compact_every = compact_every
+        self._snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self._log_path = os.path.join(directory, LOG_FILE)
+        self._log = None
+        self._logged = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self):
+        """
+        restore the table from the snapshot and the changes logged after it
+        Returns:
+            (table, version, changed): table maps name to (ip, port), changed
+                                       maps name to the version it changed at
+        """
+        table, changed, version = {}, {}, 0
+
+        snapshot = _read(self._snapshot_path)
+        if snapshot:
+            snapshot = json.loads(snapshot.decode())
+            version = snapshot['version']
+            for name, (ip, port, at) in snapshot['entries'].items():
+                table[name] = (ip, port)
+                changed[name] = at
+
+        self._logged = 0
+        # bytes of the log up to the end of the last whole record
+        good = 0
+        lines = _lines(self._log_path)
+        for line in lines:
+            try:
+                if not line.endswith(b'\n'):
+                    raise ValueError('record without end of line')
+                at, name, ip, port = json.loads(line.decode())
+            except ValueError:
+                # torn write at the end of the log
+                break
+            good += len(line)
+            self._logged += 1
+            if at <= version:
+                continue
+            table[name] = (ip, port)
+            changed[name] = at
+            version = at
+        # unmaps the log before it is cut
+        lines.close()
+
+        if os.path.exists(self._log_path) and \
+                os.path.getsize(self._log_path) > good:
+            # cut the torn record, the next ones are appended after the
+            # last whole one instead of joining it
+            with open(self._log_path, 'r+b') as f:
+                f.truncate(good)
+        return table, version, changed
+
+    def append(self, version, name, address):
+        """
+        log one change, the record is flushed before returning
+        """
+        if self._log is None:
+            self._log = open(self._log_path, 'a')
+        self._log.write(json.dumps([version, name, address[0], address[1]]) + '\n')
+        self._log.flush()
+        self._logged += 1
+
+    def need_compact(self):
+        return self._logged >= self._compact_every
+
+    def compact(self, table, version, changed):
+        """
+        write the whole table to a new snapshot and truncate the log
+        """
+        tmp_path = self._snapshot_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': version,
+                'entries': {name: [table[name][0], table[name][1], changed.get(name, version)]
+                            for name in table}
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._snapshot_path)
+
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self._log_path, 'w')
+        self._logged = 0
+
+
+def _read(path):
+    """
+    map the whole file into memory
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:]
+
+
+def _lines(path):
+    """
+    iterate lines of the file through a memory map
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            line = mm.readline()
+            while line:
+                yield line
+                line = mm.readline()
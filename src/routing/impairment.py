@@ -0,0 +1,197 @@
+import heapq
+import random
+import threading
+
+
+class Impairment:
+    """
+    how a link to one neighbor misbehaves, applied to what is sent on it
+    """
+
+    def __init__(self, loss=0.0, delay=0.0, jitter=0.0, reorder=0.0,
+                 duplicate=0.0, bandwidth=None, limit=None):
+        """
+        Args:
+            loss: probability a datagram is lost
+            delay: seconds added to every datagram
+            jitter: the delay varies uniformly by up to this many seconds
+            reorder: probability a datagram skips the delay, overtaking the
+                     ones before it, otherwise the link keeps the order
+            duplicate: probability a datagram is sent twice
+            bandwidth: bytes per second the link carries, unlimited if None
+            limit: bytes waiting for the bandwidth above which datagrams
+                   are dropped, unlimited if None
+        """
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.bandwidth = bandwidth
+        self.limit = limit
+
+    @staticmethod
+    def from_dict(description):
+        return Impairment(**description)
+
+    def to_dict(self):
+        return {
+            'loss': self.loss,
+            'delay': self.delay,
+            'jitter': self.jitter,
+            'reorder': self.reorder,
+            'duplicate': self.duplicate,
+            'bandwidth': self.bandwidth,
+            'limit': self.limit
+        }
+
+
+class _Link:
+    def __init__(self, impairment):
+        self.impairment = impairment
+        # time the bandwidth is taken until
+        self.busy_until = 0.0
+        # due time of the last datagram kept in order
+        self.last_due = 0.0
+        self.stats = {'sent': 0, 'lost': 0, 'overflowed': 0,
+                      'duplicated': 0, 'reordered': 0}
+
+
+class LinkShaper:
+    """
+    delay queue of the datagrams sent on impaired links
+
+    datagrams wait in one heap ordered by due time, a single timer on the
+    clock is armed for the earliest one and sends every datagram due when
+    it fires, so an impaired link costs no thread per datagram and runs as
+    events of a virtual clock
+    """
+
+    def __init__(self, clock, socket, seed=None):
+        """
+        Args:
+            clock: see routing.clock
+            socket: callable returning an endpoint with `sendto` and `close`
+            seed: of the random losses, delays and duplicates
+        """
+        self._clock = clock
+        self._socket = socket
+        self._endpoint = None
+        self._rand = random.Random(seed)
+        # self._links = {neighbor: _Link}
+        self._links = {}
+        # heap of (due, seq, payload, address)
+        self._queue = []
+        self._seq = 0
+        self._timer = None
+        self._timer_due = None
+        self._lock = threading.Lock()
+
+    def set(self, neighbor, impairment):
+        """
+        impair the link to `neighbor`, or restore it if `impairment` is None
+        """
+        with self._lock:
+            if impairment is None:
+                self._links.pop(neighbor, None)
+            else:
+                self._links[neighbor] = _Link(impairment)
+
+    def impaired(self, neighbor):
+        return neighbor in self._links
+
+    def stats(self):
+        """
+        Returns:
+            dict: {neighbor: counters of the link}
+        """
+        with self._lock:
+            return {neighbor: dict(link.stats)
+                    for neighbor, link in self._links.items()}
+
+    def send(self, neighbor, payload, address):
+        """
+        queue `payload` on the impaired link to `neighbor`
+        Returns:
+            bool: False if the datagram is lost, or dropped by a full link
+        """
+        with self._lock:
+            link = self._links.get(neighbor)
+            if link is None:
+                return False
+            impairment = link.impairment
+            if self._rand.random() < impairment.loss:
+                link.stats['lost'] += 1
+                return False
+            copies = 1
+            if self._rand.random() < impairment.duplicate:
+                link.stats['duplicated'] += 1
+                copies = 2
+
+            now = self._clock.time()
+            queued = False
+            for _ in range(copies):
+                start = now
+                if impairment.bandwidth is not None:
+                    backlog = (link.busy_until - now) * impairment.bandwidth
+                    if impairment.limit is not None and \
+                            backlog + len(payload) > impairment.limit:
+                        link.stats['overflowed'] += 1
+                        continue
+                    start = max(now, link.busy_until) + \
+                        len(payload) / impairment.bandwidth
+                    link.busy_until = start
+                if self._rand.random() < impairment.reorder:
+                    link.stats['reordered'] += 1
+                    due = start
+                else:
+                    due = max(start + impairment.delay +
+                              self._rand.uniform(-impairment.jitter,
+                                                 impairment.jitter),
+                              start, link.last_due)
+                    link.last_due = due
+                link.stats['sent'] += 1
+                heapq.heappush(self._queue, (due, self._seq, payload, address))
+                self._seq += 1
+                queued = True
+            if queued:
+                self._arm(now)
+        return queued
+
+    def _arm(self, now):
+        # called with the lock held
+        due = self._queue[0][0]
+        if self._timer_due is not None and self._timer_due <= due:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_due = due
+        self._timer = self._clock.call_later(due - now, self._flush)
+
+    def _flush(self):
+        with self._lock:
+            self._timer = self._timer_due = None
+            now = self._clock.time()
+            due = []
+            while len(self._queue) != 0 and self._queue[0][0] <= now:
+                due.append(heapq.heappop(self._queue))
+            if len(self._queue) != 0:
+                self._arm(now)
+            if self._endpoint is None and len(due) != 0:
+                self._endpoint = self._socket()
+            endpoint = self._endpoint
+        for _, _, payload, address in due:
+            endpoint.sendto(payload, address)
+
+    def close(self):
+        """
+        drop what is still queued
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = self._timer_due = None
+            self._queue = []
+            if self._endpoint is not None:
+                self._endpoint.close()
+                self._endpoint = None
@@ -4,6 +4,8 @@ import threading
 
 view = None
 mutex = threading.Lock()
+# when set, items are no longer printed to stdout
+quiet = False
 
 
 def init(_view):
@@ -11,6 +13,11 @@ def init(_view):
     view = _view
 
 
+def set_quiet(_quiet):
+    global quiet
+    quiet = _quiet
+
+
 def now():
     return datetime.datetime.now().strftime('%H:%M:%S')
 
@@ -27,13 +34,17 @@ def print_message(message):
         mutex.acquire()
         view.listen_message_event(item + '\n')
         mutex.release()
-    print(item)
+    if not quiet:
+        print(item)
 
 
 def print_log(log):
+    if quiet and not view:
+        return
     item = make_message(log)
     if view:
         mutex.acquire()
         view.listen_log_event(item + '\n')
         mutex.release()
-    print(item)
+    if not quiet:
+        print(item)
@@ -0,0 +1,195 @@
+import math
+import random
+from .topology import shortest_path_prev
+
+# iterations of the force-directed layout for the first graph, and for the
+# routers added to it later
+ITERATIONS = 40
+ADD_ITERATIONS = 15
+# largest move of a router in one iteration, at the start
+TEMPERATURE = 0.1
+
+
+def edges_of(link_state):
+    """
+    Args:
+        link_state: {hostname: {neighbor: cost}}, see Algorithm._link_state
+    Returns:
+        dict: {(hostname, hostname): cost}, each link once, smaller name
+              first, the lower cost of its two directions
+    """
+    edges = {}
+    for a, neighbors in link_state.items():
+        for b, cost in neighbors.items():
+            if a == b:
+                continue
+            key = (a, b) if a < b else (b, a)
+            if key not in edges or cost < edges[key]:
+                edges[key] = cost
+    return edges
+
+
+def shortest_path_tree(link_state, source):
+    """
+    Returns:
+        set: links (hostname, hostname), smaller name first, of the shortest
+             path tree rooted at `source`
+    """
+    if source not in link_state:
+        return set()
+    return {(a, b) if a < b else (b, a)
+            for b, a in shortest_path_prev(link_state, source).items()}
+
+
+class GraphLayout:
+    """
+    positions of the routers of a link-state database in the unit square
+
+    the whole graph is laid out once with a force-directed layout, later
+    updates keep every known router in place and only lay out the routers
+    that are new, starting from the middle of their known neighbors, so
+    updates stay cheap with thousands of routers and the picture doesn't
+    jump around
+
+    `update` only places the new routers, the layout then settles one
+    `step` at a time so a caller can spread the work over its frames;
+    repulsion is only computed between routers in neighboring cells of a
+    grid, which keeps an iteration linear in the number of routers
+    """
+
+    def __init__(self, seed=0):
+        # self.positions = {hostname: (x, y)}
+        self.positions = {}
+        # self.edges = {(hostname, hostname): cost}, see edges_of
+        self.edges = {}
+        self._rand = random.Random(seed)
+        # routers still being laid out, and the iterations left for them
+        self._settling = set()
+        self._iterations = 0
+        self._temperature = TEMPERATURE
+
+    @property
+    def settling(self):
+        return len(self._settling) != 0
+
+    def update(self, link_state):
+        """
+        Returns:
+            (set, set): routers added, moved or removed, and links added,
+                        removed, moved or whose cost changed
+        """
+        edges = edges_of(link_state)
+        nodes = set(link_state)
+        for a, b in edges:
+            nodes.add(a)
+            nodes.add(b)
+
+        removed = set(self.positions) - nodes
+        added = nodes - set(self.positions)
+        changed_edges = {edge for edge in set(edges) | set(self.edges)
+                         if edges.get(edge) != self.edges.get(edge)}
+        for hostname in removed:
+            del self.positions[hostname]
+        self.edges = edges
+
+        self._settling -= removed
+        if len(added) != 0:
+            if len(self.positions) == 0:
+                self._settling = set(added)
+                self._iterations = ITERATIONS
+                self._temperature = TEMPERATURE
+            else:
+                self._settling |= added
+                self._iterations = max(self._iterations, ADD_ITERATIONS)
+                self._temperature = max(self._temperature, TEMPERATURE / 2)
+            self._place(added, edges)
+            changed_edges |= {edge for edge in edges
+                              if edge[0] in added or edge[1] in added}
+        return added | removed, changed_edges
+
+    def step(self, iterations=1):
+        """
+        Returns:
+            set: routers moved
+        """
+        moved = set(self._settling)
+        for _ in range(min(iterations, self._iterations)):
+            self._relax(self._settling, self._temperature)
+            self._temperature *= 0.9
+            self._iterations -= 1
+        if self._iterations == 0:
+            self._settling = set()
+        return moved
+
+    def settle(self):
+        """
+        run every iteration left
+        """
+        self.step(self._iterations)
+
+    def _place(self, added, edges):
+        neighbors = {}
+        for a, b in edges:
+            neighbors.setdefault(a, []).append(b)
+            neighbors.setdefault(b, []).append(a)
+        for hostname in sorted(added):
+            known = [self.positions[n] for n in neighbors.get(hostname, [])
+                     if n in self.positions]
+            if len(known) == 0:
+                self.positions[hostname] = (self._rand.random(),
+                                            self._rand.random())
+                continue
+            x = sum(p[0] for p in known) / len(known)
+            y = sum(p[1] for p in known) / len(known)
+            spread = 0.5 / math.sqrt(len(self.positions) + 1)
+            self.positions[hostname] = (
+                min(1.0, max(0.0, x + self._rand.uniform(-spread, spread))),
+                min(1.0, max(0.0, y + self._rand.uniform(-spread, spread))))
+
+    def _relax(self, movable, temperature):
+        """
+        one Fruchterman-Reingold iteration moving only `movable`
+        """
+        positions = self.positions
+        k = 1 / math.sqrt(len(positions))
+        size = 2 * k
+        neighbors = {}
+        for a, b in self.edges:
+            neighbors.setdefault(a, []).append(b)
+            neighbors.setdefault(b, []).append(a)
+
+        grid = {}
+        for hostname, (x, y) in positions.items():
+            grid.setdefault((int(x / size), int(y / size)), []).append(
+                hostname)
+        moved = {}
+        for hostname in movable:
+            x, y = positions[hostname]
+            dx = dy = 0.0
+            cx, cy = int(x / size), int(y / size)
+            for i in (cx - 1, cx, cx + 1):
+                for j in (cy - 1, cy, cy + 1):
+                    for other in grid.get((i, j), ()):
+                        if other == hostname:
+                            continue
+                        ox, oy = positions[other]
+                        d2 = (x - ox) ** 2 + (y - oy) ** 2
+                        if d2 == 0:
+                            dx += self._rand.uniform(-k, k)
+                            dy += self._rand.uniform(-k, k)
+                            continue
+                        # repulsion k^2 / d along the unit vector
+                        dx += (x - ox) * k * k / d2
+                        dy += (y - oy) * k * k / d2
+            for other in neighbors.get(hostname, ()):
+                ox, oy = positions[other]
+                d = math.hypot(x - ox, y - oy)
+                # attraction d^2 / k along the unit vector
+                dx -= (x - ox) * d / k
+                dy -= (y - oy) * d / k
+            length = math.hypot(dx, dy)
+            if length != 0:
+                step = min(length, temperature) / length
+                x, y = x + dx * step, y + dy * step
+            moved[hostname] = (min(1.0, max(0.0, x)), min(1.0, max(0.0, y)))
+        positions.update(moved)
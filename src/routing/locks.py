@@ -0,0 +1,68 @@
+import threading
+import time
+
+
+class TimedLock:
+    """
+    a threading.Lock measuring how long it is waited for and held
+
+    usable wherever a Lock is, with `with` or acquire/release
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        # set by the thread holding the lock, read back when it releases
+        self._acquired = None
+        self._stats_lock = threading.Lock()
+        self._count = 0
+        self._wait = 0.0
+        self._max_wait = 0.0
+        self._hold = 0.0
+        self._max_hold = 0.0
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        if not self._lock.acquire(blocking, timeout):
+            return False
+        self._acquired = time.perf_counter()
+        wait = self._acquired - start
+        with self._stats_lock:
+            self._count += 1
+            self._wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        return True
+
+    def release(self):
+        hold = time.perf_counter() - self._acquired
+        self._lock.release()
+        with self._stats_lock:
+            self._hold += hold
+            self._max_hold = max(self._max_hold, hold)
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *_):
+        self.release()
+
+    def stats(self):
+        """
+        Returns:
+            dict: acquisitions, and total, mean and max seconds waited for
+                  and held
+        """
+        with self._stats_lock:
+            return {
+                'count': self._count,
+                'wait': self._wait,
+                'mean_wait': self._wait / self._count if self._count else 0.0,
+                'max_wait': self._max_wait,
+                'hold': self._hold,
+                'mean_hold': self._hold / self._count if self._count else 0.0,
+                'max_hold': self._max_hold
+            }
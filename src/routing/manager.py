@@ -1,6 +1,5 @@
-from routing import content_frame
-from routing import config_frame
-
+# the frames are imported on first use, so importing the manager doesn't
+# pull in wx
 router = None
 
 
@@ -25,6 +24,7 @@ class GUIManager:
         return frame
 
     def create_frame(self, _type):
+        from routing import config_frame, content_frame
         if _type == 0:
             return config_frame.ConfigFrame(parent=None, id=_type,
                                             UpdateUI=self.UpdateUI)
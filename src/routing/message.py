@@ -1,4 +1,6 @@
 from .io import print_message
+from .bulk import Bulk
+from .multicast import Multicast
 
 
 def pm(src, message):
@@ -9,10 +11,18 @@ class Message:
     """A module used for sending and receiving message"""
     TYPE = 'Message'
 
-    def __init__(self, transport, dispather):
+    def __init__(self, transport, dispather, hostname=None, clock=None,
+                 algorithm=None, update_interval=30):
         self._transport = transport
         self._dispather = dispather
         self._dispather.register(Message.TYPE, self)
+        # large payloads, chunked and delivered reliably, see routing.bulk
+        self.bulk = Bulk(hostname, transport, dispather, clock)
+        self.bulk.on_receive(self._receive_bulk)
+        # groups, sent along shortest path trees, see routing.multicast
+        self.multicast = Multicast(hostname, transport, dispather, algorithm,
+                                   update_interval, clock)
+        self.multicast.on_receive(self._receive_multicast)
 
     def send(self, destination, message):
         """ Send message to destination
@@ -26,6 +36,43 @@ class Message:
         }
         self._transport.send(destination, data)
 
+    def send_bulk(self, destination, data=None, path=None, on_done=None):
+        """ Send bytes, or a file, of any size to destination
+        Args:
+            destination: str, destination hostname
+            data: bytes to send
+            path: file to send instead of `data`
+            on_done: callable(transfer id, ok, stats), see Bulk.send
+        Returns:
+            str: id of the transfer
+        """
+        return self.bulk.send(destination, data, path, on_done)
+
+    def join(self, group):
+        """ Receive the messages sent to group from now on
+        """
+        self.multicast.join(group)
+
+    def leave(self, group):
+        self.multicast.leave(group)
+
+    def send_multicast(self, group, message):
+        """ Send message to every member of group
+        Args:
+            group: str, name of the group, joining it isn't needed
+            message: str, text message only
+        """
+        self.multicast.send(group, message)
+
+    def _receive_multicast(self, src, group, message):
+        pm(src, '[{}] {}'.format(group, message))
+
+    def _receive_bulk(self, src, transfer_id, payload):
+        if isinstance(payload, str):
+            pm(src, 'file received: {}'.format(payload))
+        else:
+            pm(src, '{} bytes received'.format(len(payload)))
+
     def receive(self, src, data):
         """ Receive hns data
           Args:
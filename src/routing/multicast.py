@@ -0,0 +1,201 @@
+import threading
+from .io import print_log
+from .clock import RealClock
+from .topology import shortest_path_prev
+
+
+def log(message):
+    print_log("[Multicast] {0}".format(message))
+
+
+def info(message):
+    log("[INFO] {0}".format(message))
+
+
+def distribution_tree(link_state, source, members):
+    """
+    Args:
+        link_state: {hostname: {neighbor: cost}}
+        members: hostnames to reach
+    Returns:
+        dict: the union of the shortest paths from `source` to every
+              reachable member, as nested {hop: {next hop: {...}}} below
+              `source`
+    """
+    prev = shortest_path_prev(link_state, source)
+    tree = {}
+    for member in sorted(members):
+        if member not in prev:
+            continue
+        path = [member]
+        while prev[path[-1]] != source:
+            path.append(prev[path[-1]])
+        node = tree
+        for hostname in reversed(path):
+            node = node.setdefault(hostname, {})
+    return tree
+
+
+class Multicast:
+    """
+    group messaging over source-rooted shortest path trees
+
+    every router floods the groups it joined, so each one knows the members
+    of every group; the source of a message computes the shortest path
+    tree to the members from its link-state database and sends one copy to
+    each of its children in the tree, along with the subtree below that
+    child, each router then delivers the message if it is a member and
+    copies it only to its own children, so a link carries a message once
+
+    without a link-state database, with distance vector, a message is sent
+    to each member on its own
+    """
+    TYPE = 'Multicast'
+
+    def __init__(self, hostname, transport, dispatcher, algorithm,
+                 update_interval=30, clock=None):
+        """
+        Args:
+            algorithm: routing algorithm, its `get_link_state` gives the
+                       graph trees are computed on
+            update_interval: seconds between two floods of the groups this
+                             router joined
+        """
+        self._hostname = hostname
+        self._transport = transport
+        self._algorithm = algorithm
+        self._interval = update_interval
+        self._clock = clock if clock is not None else RealClock()
+        self._groups = set()
+        # a router restarting keeps ordering after its old floods
+        self._version = int(self._clock.time() * 1000)
+        # self._members = {hostname: (version, set of groups)}
+        self._members = {}
+        # self._trees = {group: (link state, members, tree)}
+        self._trees = {}
+        self._lock = threading.Lock()
+        self._timer_thread = None
+        self.observers = list()
+        dispatcher.register(Multicast.TYPE, self)
+
+    def run(self):
+        self._advertise()
+
+    def stop(self):
+        if self._timer_thread is not None:
+            self._timer_thread.cancel()
+            self._timer_thread = None
+
+    def on_receive(self, observer):
+        """
+        Args:
+            observer: callable(source, group, message)
+        """
+        self.observers.append(observer)
+
+    def join(self, group):
+        with self._lock:
+            if group in self._groups:
+                return
+            self._groups.add(group)
+        self._flood()
+
+    def leave(self, group):
+        with self._lock:
+            if group not in self._groups:
+                return
+            self._groups.discard(group)
+        self._flood()
+
+    def members(self, group):
+        """
+        Returns:
+            set: hostnames in `group`, as far as this router knows
+        """
+        with self._lock:
+            members = {hostname for hostname, (_, groups)
+                       in self._members.items() if group in groups}
+            if group in self._groups:
+                members.add(self._hostname)
+        return members
+
+    def send(self, group, message):
+        """ Send `message` to every member of `group` but this router
+        """
+        members = self.members(group) - {self._hostname}
+        link_state = self._algorithm.get_link_state()
+        if len(link_state) == 0:
+            for member in sorted(members):
+                self._transport.send(member, self._frame(group, message, None))
+            return
+        tree = self._tree(group, link_state, members)
+        self._forward(group, self._hostname, message, tree)
+
+    def receive(self, src, data):
+        if data['op'] == 'members':
+            with self._lock:
+                known = self._members.get(src)
+                if known is None or known[0] < data['version']:
+                    self._members[src] = (data['version'], set(data['groups']))
+            return
+
+        if data['tree'] is not None:
+            self._forward(data['group'], data['source'], data['message'],
+                          data['tree'])
+        if data['group'] in self._groups:
+            for observer in list(self.observers):
+                observer(data['source'], data['group'], data['message'])
+
+    def _tree(self, group, link_state, members):
+        cached = self._trees.get(group)
+        if cached is not None and cached[0] == link_state and \
+                cached[1] == members:
+            return cached[2]
+        tree = distribution_tree(link_state, self._hostname, members)
+        self._trees[group] = (link_state, members, tree)
+        return tree
+
+    def _forward(self, group, source, message, tree):
+        """
+        send one copy to each child in `tree`, with the subtree below it
+        """
+        for child, subtree in tree.items():
+            frame = self._frame(group, message, subtree)
+            frame['data']['source'] = source
+            # children are neighbors, no routing needed
+            self._transport.send(child, frame, True)
+
+    def _frame(self, group, message, tree):
+        return {
+            'type': Multicast.TYPE,
+            'data': {
+                'op': 'data',
+                'group': group,
+                'source': self._hostname,
+                'tree': tree,
+                'message': message
+            }
+        }
+
+    def _flood(self):
+        with self._lock:
+            self._version += 1
+            data = {
+                'op': 'members',
+                'version': self._version,
+                'groups': sorted(self._groups)
+            }
+        info('groups: {}'.format(data['groups']))
+        self._transport.broadcasting({
+            'type': Multicast.TYPE,
+            'data': data
+        })
+
+    def _advertise(self):
+        """
+        flood the groups again now and then, for routers that came later
+        """
+        if len(self._groups) != 0:
+            self._flood()
+        self._timer_thread = self._clock.call_later(self._interval,
+                                                    self._advertise)
@@ -22,9 +22,16 @@ class NeighborTable:
     def on_update(self, observer):
         self.observers.append(observer)
 
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
+
     def get(self):
         return self.table.copy()
 
+    def get_all(self):
+        return self.get()
+
     def get_cost(self, hostname):
         return self.table.get(hostname)
 
@@ -32,6 +39,20 @@ class NeighborTable:
         self.__update(hostname, cost)
         self.__notify_all()
 
+    def update_many(self, costs):
+        """
+        apply several cost changes at once, observers are notified only once
+        Args:
+            costs (dict[str, int]): a cost of -1 removes the neighbor
+        """
+        with self.table_lock:
+            for hostname, cost in costs.items():
+                if cost == -1:
+                    self.__remove(hostname)
+                else:
+                    self.__update(hostname, cost)
+        self.__notify_all()
+
     def timeout(self, hostname):
         self.remove(hostname)
 
@@ -53,5 +74,5 @@ class NeighborTable:
 
 
     def __notify_all(self):
-        for observer in self.observers:
+        for observer in list(self.observers):
             observer(self.get())
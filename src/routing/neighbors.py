@@ -1,12 +1,14 @@
 import threading
 from .io import print_log
+from .clock import RealClock
+from .dispatcher import HANDSHAKE, BLOCK
 
 NEIGHBOR_TYPE = "neighbor"
 NEIGHBOR_TIMEOUT = 10
 MAX_RETRY = 3
 
 
-def noop():
+def noop(*_):
     pass
 
 
@@ -36,11 +38,13 @@ def error(message):
 
 class Neighbors:
 
-    def __init__(self, transport, dispatcher, table):
-        dispatcher.register(NEIGHBOR_TYPE, self)
+    def __init__(self, transport, dispatcher, table, clock=None):
+        dispatcher.register(NEIGHBOR_TYPE, self, HANDSHAKE, policy=BLOCK)
+        self.clock = clock if clock is not None else RealClock()
         self.neighbors = table
         self.transport = transport
         self.pending = dict()
+        self.batch_pending = dict()
         self.pending_lock = threading.Lock()
 
     def receive(self, source, cost):
@@ -57,6 +61,13 @@ class Neighbors:
 
         cost = int(cost)
 
+        with self.pending_lock:
+            batch = self.batch_pending.pop(source, None)
+        if batch is not None:
+            info("reply from host '{0}' received".format(source))
+            batch.confirm(source, cost)
+            return
+
         if self.pending.get(source) is None:
             self.__send(source, cost)  # ack
         else:
@@ -84,7 +95,7 @@ class Neighbors:
             self.__update_with_retry(
                 hostname, cost, retry_left, success, fail)
 
-        timer = threading.Timer(NEIGHBOR_TIMEOUT, timeout_handler)
+        timer = self.clock.call_later(NEIGHBOR_TIMEOUT, timeout_handler)
 
         def success_callback():
             timer.cancel()
@@ -92,7 +103,27 @@ class Neighbors:
 
         self.pending[hostname] = success_callback
         self.__send(hostname, cost)
-        timer.start()
+
+    def update_many(self, costs, success=noop, fail=noop):
+        """
+        asynchronizely update the cost of several neighbors at once
+
+        all handshakes are sent in one batch and share a single retry timer,
+        confirmed costs are applied to the neighbor table in one update
+        Args:
+            costs (dict[str, int]): maps hostname of neighbor to its new cost
+            success: called with no arguments when every host replied
+            fail: called with the list of hosts that never replied
+        """
+        costs = {hostname: int(cost) for hostname, cost in costs.items()}
+        if len(costs) == 0:
+            return
+        info("updating {0} neighbors in batch: {1}".format(len(costs), costs))
+        batch = _Batch(self, costs, success, fail)
+        with self.pending_lock:
+            for hostname in costs:
+                self.batch_pending[hostname] = batch
+        batch.start()
 
     def delete(self, hostname: str, success=noop, fail=noop):
         """
@@ -141,3 +172,78 @@ class Neighbors:
             "type": NEIGHBOR_TYPE,
             "data": data
         }, new)
+
+    def _send_batch(self, costs):
+        info("sending handshakes to hosts {0}".format(list(costs.keys())))
+        self.transport.send_many([
+            (hostname, {"type": NEIGHBOR_TYPE, "data": cost})
+            for hostname, cost in costs.items()], True)
+
+    def _pop_batch(self, batch, hostnames):
+        with self.pending_lock:
+            for hostname in hostnames:
+                if self.batch_pending.get(hostname) is batch:
+                    del self.batch_pending[hostname]
+
+
+class _Batch:
+    """
+    a group of neighbor updates sharing one pending set and one retry timer
+    """
+
+    def __init__(self, neighbors, costs, success, fail):
+        self.neighbors = neighbors
+        self.costs = costs
+        self.waiting = set(costs.keys())
+        self.confirmed = dict()
+        self.retry = MAX_RETRY
+        self.success = success
+        self.fail = fail
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            self.__send_waiting()
+
+    def confirm(self, hostname, cost):
+        with self.lock:
+            if hostname not in self.waiting:
+                return
+            self.waiting.discard(hostname)
+            self.confirmed[hostname] = cost
+            if len(self.waiting) != 0:
+                return
+            self.timer.cancel()
+            self.__flush()
+        self.success()
+
+    def __timeout(self):
+        with self.lock:
+            if len(self.waiting) == 0:
+                return
+            self.retry -= 1
+            info("{0} neighbors timeout, retry left: {1}".format(
+                len(self.waiting), self.retry))
+            # costs confirmed so far should not wait for the slow hosts
+            self.__flush()
+            if self.retry != 0:
+                self.__send_waiting()
+                return
+            failed = list(self.waiting)
+            self.waiting.clear()
+            self.neighbors._pop_batch(self, failed)
+        info("timeout for hosts {0}, aborting action".format(failed))
+        self.fail(failed)
+
+    def __send_waiting(self):
+        self.neighbors._send_batch(
+            {hostname: self.costs[hostname] for hostname in sorted(self.waiting)})
+        self.timer = self.neighbors.clock.call_later(
+            NEIGHBOR_TIMEOUT, self.__timeout)
+
+    def __flush(self):
+        if len(self.confirmed) == 0:
+            return
+        self.neighbors.neighbors.update_many(self.confirmed)
+        self.confirmed = dict()
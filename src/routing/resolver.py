@@ -0,0 +1,152 @@
+import threading
+from collections import deque
+from .io import print_log
+from .clock import RealClock
+
+DEFAULT_TTL = 60
+NEGATIVE_TTL = 5
+QUERY_TIMEOUT = 2
+QUEUE_LIMIT = 16
+
+
+def log(message):
+    print_log("[Resolver] {0}".format(message))
+
+
+def info(message):
+    log("[INFO] {0}".format(message))
+
+
+class Resolver:
+    """
+    client side hostname cache, resolving unknown names by querying the hns
+
+    answers are cached with a ttl, unknown names are cached negatively,
+    concurrent lookups of the same name share one in-flight query, and the
+    items waiting for a name are held in a short per-name queue
+    """
+
+    def __init__(self, query, deliver, ttl=DEFAULT_TTL,
+                 negative_ttl=NEGATIVE_TTL, query_timeout=QUERY_TIMEOUT,
+                 queue_limit=QUEUE_LIMIT, on_timeout=None, clock=None):
+        """
+        Args:
+            query: callable(name), sends a query for `name` to the hns
+            deliver: callable(item), called for each held item once its
+                     name is resolved
+            ttl: seconds a positive answer is cached if hns gives no ttl
+            negative_ttl: seconds an unknown name is cached
+            query_timeout: seconds to wait for an answer
+            queue_limit: max number of items held per name, the oldest
+                         is dropped when exceeded
+            on_timeout: callable(name), called when a query goes unanswered
+            clock: source of time and timers, see routing.clock
+        """
+        self._query = query
+        self._deliver = deliver
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._query_timeout = query_timeout
+        self._queue_limit = queue_limit
+        self._on_timeout = on_timeout
+        self._clock = clock if clock is not None else RealClock()
+
+        # self._cache = {
+        #   name: (address or None, expire time)
+        # }
+        self._cache = {}
+        # self._pending = {
+        #   name: (deque of held items, timeout timer)
+        # }
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """
+        Returns:
+            (ip, port) if `name` is cached and not expired, else None
+        """
+        with self._lock:
+            entry = self._cache.get(name)
+            if entry is None:
+                return None
+            if entry[1] < self._clock.time():
+                del self._cache[name]
+                return None
+            return entry[0]
+
+    def hold(self, name, item):
+        """
+        hold `item` until `name` is resolved, querying the hns if no query
+        for it is in flight
+        Returns:
+            bool: False if `name` is known to be unresolvable and the item
+                  is dropped
+        """
+        with self._lock:
+            entry = self._cache.get(name)
+            if entry is not None and entry[0] is None \
+                    and entry[1] >= self._clock.time():
+                return False
+
+            pending = self._pending.get(name)
+            if pending is not None:
+                pending[0].append(item)
+                return True
+
+            timer = self._clock.call_later(
+                self._query_timeout, self._timeout, name)
+            self._pending[name] = (deque([item], self._queue_limit), timer)
+
+        info("querying address of '{0}'".format(name))
+        self._query(name)
+        return True
+
+    def answer(self, name, address, ttl=None):
+        """
+        record an answer from the hns and release the items held for it
+        Args:
+            address: (ip, port), None if hns doesn't know the name
+            ttl: seconds the answer stays valid
+        """
+        if address is not None:
+            address = (address[0], address[1])
+            expire = self._clock.time() + (ttl if ttl is not None else self._ttl)
+        else:
+            expire = self._clock.time() + self._negative_ttl
+
+        with self._lock:
+            self._cache[name] = (address, expire)
+            pending = self._pending.pop(name, None)
+
+        if pending is None:
+            return
+        pending[1].cancel()
+        if address is None:
+            info("'{0}' unknown to hns, dropping {1} items".format(
+                name, len(pending[0])))
+            return
+        for item in pending[0]:
+            self._deliver(item)
+
+    def answer_pending(self, table):
+        """
+        release the items held for any name present in `table`
+        Args:
+            table: dict, {name: (ip, port)} pushed by hns
+        """
+        with self._lock:
+            names = [name for name in self._pending if name in table]
+        for name in names:
+            self.answer(name, table[name])
+
+    def _timeout(self, name):
+        with self._lock:
+            pending = self._pending.pop(name, None)
+            if pending is None:
+                return
+            self._cache[name] = (None, self._clock.time() + self._negative_ttl)
+        info("query for '{0}' timeout, dropping {1} items".format(
+            name, len(pending[0])))
+        if self._on_timeout is not None:
+            self._on_timeout(name)
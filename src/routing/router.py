@@ -6,28 +6,45 @@ from .neighbors import Neighbors
 from .config import Algorithm
 from .message import Message
 from .neighbor_table import NeighborTable
+from .clock import RealClock
 
 
 class Router:
-    def __init__(self, config):
+    def __init__(self, config, backend=None, clock=None, forward_workers=0):
+        """
+        Args:
+            config(Config): configuration of this router
+            backend: datagram backend of the transport, see routing.backend,
+                     real udp sockets if None
+            clock: source of time and timers of every module, see
+                   routing.clock, wall clock if None
+            forward_workers: threads forwarding the frames received, see
+                             Transport
+        """
+        self.clock = clock if clock is not None else RealClock()
 
         self._running = False
         self.hostname = config.hostname
 
         self.routing_table = RoutingTable(config.hostname)
-        self.dispatcher = DataDispatcher()
+        # receivers run on the transport's listener with a virtual clock
+        self.dispatcher = DataDispatcher(threaded=not self.clock.virtual)
 
         self.neighbor_table = NeighborTable()
         self.transport = Transport(
             config.hostname, config.self_addr.ip, config.self_addr.port,
             config.hns_addr.ip, config.hns_addr.port,
-            self.routing_table, self.dispatcher, self.neighbor_table)
+            self.routing_table, self.dispatcher, self.neighbor_table,
+            backend=backend, clock=self.clock,
+            forward_workers=forward_workers)
         self.neighbors = Neighbors(
-            self.transport, self.dispatcher, self.neighbor_table)
+            self.transport, self.dispatcher, self.neighbor_table, self.clock)
 
         self.algorithm = self.__get_algorithm(config)
 
-        self.message = Message(self.transport, self.dispatcher)
+        self.message = Message(self.transport, self.dispatcher,
+                               config.hostname, self.clock, self.algorithm,
+                               config.update_interval)
 
     def __get_algorithm(self, config):
         if config.algorithm == Algorithm.LS_CENTRALIZE:
@@ -39,7 +56,8 @@ class Router:
                 self.neighbor_table,
                 self.dispatcher,
                 config.update_interval,
-                config.dead_timeout)
+                config.dead_timeout,
+                self.clock)
         else:
             return {
                 Algorithm.DV: DV,
@@ -52,7 +70,8 @@ class Router:
                 self.neighbor_table,
                 self.dispatcher,
                 config.update_interval,
-                config.dead_timeout)
+                config.dead_timeout,
+                self.clock)
 
     def run(self):
         """
@@ -60,8 +79,10 @@ class Router:
         """
         if not self._running:
             self._running = True
+            self.dispatcher.run()
             self.transport.run()
             self.algorithm.run()
+            self.message.multicast.run()
 
     def stop(self):
         """
@@ -72,6 +93,8 @@ class Router:
             self._running = False
             self.transport.stop()
             self.algorithm.stop()
+            self.message.multicast.stop()
+            self.dispatcher.stop()
 
     def send(self, destination, message):
         """
@@ -82,6 +105,42 @@ class Router:
         """
         self.message.send(destination, message)
 
+    def send_bulk(self, destination, data=None, path=None, on_done=None):
+        """
+        send a payload of any size, chunked and acknowledged
+        Args:
+            destination(str): hostname for the receiver
+            data(bytes): payload to send
+            path(str): file to send instead of `data`
+            on_done: callable(transfer id, ok, stats), called when the
+                     transfer completed or failed
+        Returns:
+            str: id of the transfer
+        """
+        return self.message.send_bulk(destination, data, path, on_done)
+
+    def join(self, group):
+        """
+        join a multicast group, its messages are received from now on
+        """
+        self.message.join(group)
+
+    def leave(self, group):
+        """
+        leave a multicast group
+        """
+        self.message.leave(group)
+
+    def send_multicast(self, group, message):
+        """
+        send message to every member of a group, routers copy it only where
+        the paths to the members split
+        Args:
+            group(str): name of the group
+            message(str): message to send
+        """
+        self.message.send_multicast(group, message)
+
     def get_alive(self):
         """
         get living hosts on this router's perspective
@@ -96,6 +155,14 @@ class Router:
         """
         self.neighbors.update(name, cost)
 
+    def update_neighbors(self, neighbors):
+        """
+        add or update many neighbors at once with a single handshake round
+        Args:
+            neighbors(dict[str, int]): maps hostname of neighbor to its cost
+        """
+        self.neighbors.update_many(neighbors)
+
     def remove_neighbor(self, name):
         """
         remove a neighbor with specified hostname
@@ -115,6 +182,46 @@ class Router:
         """
         return self.routing_table.get_all()
 
+    def impair(self, name, impairment):
+        """
+        emulate a bad link to neighbor `name`, on what this router sends
+        Args:
+            impairment(routing.impairment.Impairment): None restores the link
+        """
+        self.transport.impair(name, impairment)
+
+    def compression_stats(self):
+        """
+        get how much compressing the payloads sent saved and cost
+        Returns:
+            dict: see routing.compression.Codec.stats
+        """
+        return self.transport.compression_stats()
+
+    def lock_stats(self):
+        """
+        get how long the routing algorithm's locks were waited for and held
+        Returns:
+            dict: {lock name: stats}, see routing.locks.TimedLock.stats
+        """
+        return self.algorithm.lock_stats()
+
+    def dump_trace(self, path):
+        """
+        write the last frames sent, received, forwarded and dropped by this
+        router to `path`, see routing.trace
+        """
+        self.transport.trace.dump(path)
+
+    def get_link_state(self):
+        """
+        get the network as the link-state algorithm or the controller sees
+        it, empty with distance vector
+        Returns:
+            dict: {hostname: {neighbor: cost}}
+        """
+        return self.algorithm.get_link_state()
+
     def get_neighbor_table(self):
         """
         get neighbor of this router
@@ -22,34 +22,80 @@ class RoutingTable(object):
             }
         }
         self._routing_table_lock = threading.Lock()
+        # next hop of every destination, replaced as a whole on every
+        # update and never changed once published, so lookups on the
+        # forwarding path read it without taking the lock
+        self._next_hops = {self._hostname: self._hostname}
+        self.observers = list()
+
+    def on_update(self, observer):
+        """
+        Args:
+            observer: callable(changes), called after every update that
+                      changes something, `changes` maps each changed
+                      destination to its new entry, None if it was removed
+        """
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        if observer in self.observers:
+            self.observers.remove(observer)
 
     def update(self, table):
         self._routing_table_lock.acquire()
         try:
-            self._routing_table = table
+            old, self._routing_table = self._routing_table, table
+            self._next_hops = {destination: entry['next']
+                               for destination, entry in table.items()}
         finally:
             self._routing_table_lock.release()
 
+        if len(self.observers) != 0:
+            changes = {destination: copy.deepcopy(entry)
+                       for destination, entry in table.items()
+                       if old.get(destination) != entry}
+            changes.update({destination: None for destination in old
+                            if destination not in table})
+            self.__notify_all(changes)
+
     def update_one(self, destination, next, cost):
+        entry = {
+            'next': next,
+            'cost': cost
+        }
         self._routing_table_lock.acquire()
         try:
-            self._routing_table[destination] = {
-                'next': next,
-                'cost': cost
-            }
+            changed = self._routing_table.get(destination) != entry
+            self._routing_table[destination] = entry
+            if changed:
+                next_hops = dict(self._next_hops)
+                next_hops[destination] = next
+                self._next_hops = next_hops
         finally:
             self._routing_table_lock.release()
 
+        if changed:
+            self.__notify_all({destination: dict(entry)})
+
+    def __notify_all(self, changes):
+        if len(changes) == 0:
+            return
+        for observer in list(self.observers):
+            observer(changes)
+
     def get(self, destination):
-        self._routing_table_lock.acquire()
-        try:
-            next_hop = self._routing_table[destination]['next']
-        except KeyError:
+        next_hops = self._next_hops
+        if destination not in next_hops:
             raise ValueError('hostname "{}" unreachable'.format(destination))
-        finally:
-            self._routing_table_lock.release()
 
-        return next_hop
+        return next_hops[destination]
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {destination: next hop} as of the last update, read-only
+        """
+        return self._next_hops
 
     def get_alive(self):
         self._routing_table_lock.acquire()
@@ -0,0 +1,394 @@
+import heapq
+import json
+import math
+import random
+from . import config
+
+# first port assigned to routers listed without an address
+BASE_PORT = 9000
+
+ALGORITHMS = config.ALGORITHMS
+
+
+def load(file):
+    with open(file) as json_file:
+        return Topology(json.load(json_file))
+
+
+class Topology:
+    """
+    description of a whole network
+
+    {
+      "algorithm": "DV" | "LS" | "LS_CENTRALIZE",
+      "controller": hostname of the controller, for LS_CENTRALIZE only,
+      "update_interval": int,
+      "dead_timeout": int,
+      "hns": [ip, port],
+      "routers": {hostname: [ip, port]} or [hostname, ...],
+      "links": [[hostname, hostname, cost], ...],
+      "impairments": [[hostname, hostname, {"loss": ..., ...}], ...],
+                     optional, both directions of a link misbehave, see
+                     routing.impairment.Impairment
+    }
+    """
+
+    def __init__(self, description):
+        self.algorithm = description.get('algorithm', 'LS')
+        self.controller = description.get('controller') or None
+        self.update_interval = description.get('update_interval', 30)
+        self.dead_timeout = description.get('dead_timeout', 180)
+        self.hns = tuple(description.get('hns', ('127.0.0.1', 8888)))
+
+        routers = description['routers']
+        if isinstance(routers, dict):
+            self.routers = {name: tuple(routers[name]) for name in routers}
+        else:
+            self.routers = {name: ('127.0.0.1', BASE_PORT + i)
+                            for i, name in enumerate(routers)}
+
+        # bumped on every change, lets callers cache what they derive
+        self.version = 0
+        # self._links = {hostname: {neighbor: cost}}
+        self._links = {name: {} for name in self.routers}
+        for a, b, cost in description.get('links', []):
+            self._links[a][b] = cost
+            self._links[b][a] = cost
+        # self.impairments = {(hostname, hostname): {...}}, smaller name first
+        self.impairments = {
+            tuple(sorted((a, b))): impairment
+            for a, b, impairment in description.get('impairments', [])}
+
+    def to_dict(self):
+        return {
+            'algorithm': self.algorithm,
+            'controller': self.controller,
+            'update_interval': self.update_interval,
+            'dead_timeout': self.dead_timeout,
+            'hns': list(self.hns),
+            'routers': {name: list(self.routers[name]) for name in self.routers},
+            'links': self.links(),
+            'impairments': [[a, b, impairment] for (a, b), impairment
+                            in self.impairments.items()]
+        }
+
+    def links(self):
+        """
+        Returns:
+            list: [[hostname, hostname, cost], ...], every link once
+        """
+        return [[a, b, self._links[a][b]]
+                for a in self._links for b in self._links[a] if a < b]
+
+    def set_link(self, a, b, cost):
+        """
+        add the link between `a` and `b` or change its cost
+        """
+        self._links[a][b] = cost
+        self._links[b][a] = cost
+        self.version += 1
+
+    def remove_link(self, a, b):
+        self._links[a].pop(b, None)
+        self._links[b].pop(a, None)
+        self.version += 1
+
+    def remove_router(self, hostname):
+        """
+        remove `hostname` and every link to it
+        """
+        for neighbor in self._links.pop(hostname):
+            self._links[neighbor].pop(hostname, None)
+        del self.routers[hostname]
+        self.version += 1
+
+    def is_connected(self, without=None):
+        """
+        Args:
+            without: a link (a, b) to leave out
+        Returns:
+            bool: whether every router can reach every other router, the
+                  controller doesn't count as a path between members
+        """
+        names = [name for name in self._links if name != self.controller]
+        if len(names) == 0:
+            return True
+        reached, stack = {names[0]}, [names[0]]
+        while len(stack) != 0:
+            hostname = stack.pop()
+            for neighbor in self._links[hostname]:
+                if neighbor == self.controller or neighbor in reached or \
+                        without in ((hostname, neighbor), (neighbor, hostname)):
+                    continue
+                reached.add(neighbor)
+                stack.append(neighbor)
+        return len(reached) == len(names)
+
+    def neighbors(self, hostname):
+        """
+        Returns:
+            dict[str, int]: maps hostname of neighbor to the cost to it
+        """
+        return dict(self._links[hostname])
+
+    def algorithm_of(self, hostname):
+        if self.algorithm == 'LS_CENTRALIZE' and hostname == self.controller:
+            return ALGORITHMS['LS_CONTROL']
+        return ALGORITHMS[self.algorithm]
+
+    def config(self, hostname):
+        """
+        Returns:
+            config.Config: configuration of router `hostname`
+        """
+        ip, port = self.routers[hostname]
+        return config.Config(
+            algorithm=self.algorithm_of(hostname),
+            hostname=hostname,
+            self_addr=config.Address(ip, port),
+            hns_addr=config.Address(self.hns[0], self.hns[1]),
+            dead_timeout=self.dead_timeout,
+            update_interval=self.update_interval,
+            controller_hostname=self.controller)
+
+    def expected_costs(self, hostname):
+        """
+        Returns:
+            dict[str, int]: shortest path cost from `hostname` to every
+                            reachable host, None for the controller which
+                            computes no routes
+        """
+        routes = self.expected_routes(hostname)
+        if routes is None:
+            return None
+        return {destination: route['cost']
+                for destination, route in routes.items()}
+
+    def expected_routes(self, hostname):
+        """
+        Returns:
+            dict[str, dict]: {destination: {'cost': shortest path cost,
+                             'next': set of the next hops starting a
+                             shortest path}} for every host reachable from
+                             `hostname`, None for the controller which
+                             computes no routes
+        """
+        if self.controller is None:
+            links = self._links
+        elif hostname == self.controller:
+            return None
+        else:
+            # members route around the controller, which is always one hop
+            # away
+            links = {name: {n: c for n, c in self._links[name].items()
+                            if n != self.controller}
+                     for name in self._links if name != self.controller}
+        costs = shortest_paths(links, hostname)
+        hops = first_hops(links, hostname, costs)
+        routes = {destination: {'cost': costs[destination],
+                                'next': hops[destination]}
+                  for destination in costs}
+        if self.controller is not None and \
+                self.controller in self._links[hostname]:
+            routes[self.controller] = {
+                'cost': self._links[hostname][self.controller],
+                'next': {self.controller}}
+        return routes
+
+
+def shortest_paths(links, source):
+    """
+    Args:
+        links: {hostname: {neighbor: cost}}
+    Returns:
+        dict[str, int]: shortest path cost from `source`
+    """
+    costs = {source: 0}
+    heap = [(0, source)]
+    while len(heap) != 0:
+        cost, hostname = heapq.heappop(heap)
+        if cost > costs[hostname]:
+            continue
+        for neighbor, link_cost in links[hostname].items():
+            if neighbor not in costs or cost + link_cost < costs[neighbor]:
+                costs[neighbor] = cost + link_cost
+                heapq.heappush(heap, (cost + link_cost, neighbor))
+    return costs
+
+
+def first_hops(links, source, costs):
+    """
+    Args:
+        links: {hostname: {neighbor: cost}}, links go both ways
+        costs: shortest path costs from `source`, see shortest_paths
+    Returns:
+        dict[str, set]: neighbors of `source` a shortest path to every
+                        reachable host starts with, {source} for itself
+    """
+    hops = {source: {source}}
+    # costs are positive, a host is reached from closer ones only
+    for hostname in sorted(costs, key=costs.get):
+        if hostname == source:
+            continue
+        hops[hostname] = set()
+        for previous, cost in links[hostname].items():
+            if previous in hops and \
+                    costs[previous] + cost == costs[hostname]:
+                hops[hostname] |= {hostname} if previous == source \
+                    else hops[previous]
+    return hops
+
+
+def shortest_path_prev(links, source):
+    """
+    Args:
+        links: {hostname: {neighbor: cost}}, such as a link-state database
+    Returns:
+        dict[str, str]: previous hop on the shortest path from `source` of
+                        every other reachable host
+    """
+    costs = {source: 0}
+    prev = {}
+    heap = [(0, source)]
+    while len(heap) != 0:
+        cost, hostname = heapq.heappop(heap)
+        if cost > costs[hostname]:
+            continue
+        for neighbor, link_cost in links.get(hostname, {}).items():
+            if neighbor not in costs or cost + link_cost < costs[neighbor]:
+                costs[neighbor] = cost + link_cost
+                prev[neighbor] = hostname
+                heapq.heappush(heap, (cost + link_cost, neighbor))
+    return prev
+
+
+def generate(shape, n, algorithm='LS', seed=0, **options):
+    """
+    generate a topology of `n` routers named r0, r1, ...
+
+    link costs are drawn from `seed`, so the same arguments always give the
+    same topology, with LS_CENTRALIZE a controller named `control` is added
+    with a link of cost 1 to every router
+
+    Args:
+        shape: 'ring', 'grid', 'geometric' or 'scale-free'
+        options: update_interval, dead_timeout, and the options of the shape,
+                 `radius` for geometric, `m` for scale-free
+    Returns:
+        Topology
+    """
+    rand = random.Random(seed)
+    names = ['r{}'.format(i) for i in range(n)]
+    generator = SHAPES[shape]
+    shape_options = {k: v for k, v in options.items()
+                     if k not in ('update_interval', 'dead_timeout')}
+    links = generator(names, rand, **shape_options)
+
+    description = {
+        'algorithm': algorithm,
+        'update_interval': options.get('update_interval', 30),
+        'dead_timeout': options.get('dead_timeout', 180),
+        'routers': list(names),
+        'links': links
+    }
+    if algorithm == 'LS_CENTRALIZE':
+        description['controller'] = 'control'
+        description['routers'].append('control')
+        description['links'] += [[name, 'control', 1] for name in names]
+    return Topology(description)
+
+
+def _cost(rand):
+    return rand.randint(1, 10)
+
+
+def ring(names, rand):
+    return [[names[i], names[(i + 1) % len(names)], _cost(rand)]
+            for i in range(len(names) if len(names) > 2 else len(names) - 1)]
+
+
+def grid(names, rand):
+    """
+    routers fill a square grid row by row, the last row may be partial
+    """
+    width = int(math.ceil(math.sqrt(len(names))))
+    links = []
+    for i in range(len(names)):
+        if (i + 1) % width != 0 and i + 1 < len(names):
+            links.append([names[i], names[i + 1], _cost(rand)])
+        if i + width < len(names):
+            links.append([names[i], names[i + width], _cost(rand)])
+    return links
+
+
+def geometric(names, rand, radius=None):
+    """
+    routers are dropped in the unit square and linked when closer than
+    `radius`, the cost grows with the distance, components left apart are
+    joined through their closest pair of routers
+    """
+    n = len(names)
+    if radius is None:
+        # just above the connectivity threshold sqrt(ln n / (pi n))
+        radius = math.sqrt(2 * math.log(max(n, 2)) / (math.pi * max(n, 2)))
+    points = [(rand.random(), rand.random()) for _ in range(n)]
+
+    def distance(i, j):
+        return math.hypot(points[i][0] - points[j][0],
+                          points[i][1] - points[j][1])
+
+    def cost(i, j):
+        return max(1, int(round(distance(i, j) * 10)))
+
+    links = []
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            if distance(i, j) < radius:
+                links.append([names[i], names[j], cost(i, j)])
+                parent[find(i)] = find(j)
+
+    while len({find(i) for i in range(n)}) > 1:
+        i, j = min(((i, j) for i in range(n) for j in range(n)
+                    if find(i) == find(0) and find(j) != find(0)),
+                   key=lambda pair: distance(*pair))
+        links.append([names[i], names[j], cost(i, j)])
+        parent[find(j)] = find(i)
+    return links
+
+
+def scale_free(names, rand, m=2):
+    """
+    barabasi-albert preferential attachment, each new router links to `m`
+    routers picked with a probability proportional to their degree
+    """
+    links = []
+    # every router appears once per link end, plus once to start with
+    ends = []
+    for i, name in enumerate(names):
+        targets = set()
+        if i <= m:
+            targets = set(names[:i])
+        else:
+            while len(targets) < m:
+                targets.add(rand.choice(ends))
+        for target in sorted(targets):
+            links.append([target, name, _cost(rand)])
+            ends += [target, name]
+        ends.append(name)
+    return links
+
+
+SHAPES = {
+    'ring': ring,
+    'grid': grid,
+    'geometric': geometric,
+    'scale-free': scale_free
+}
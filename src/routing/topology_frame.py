@@ -0,0 +1,214 @@
+import wx
+from routing import manager
+from routing.layout import GraphLayout, shortest_path_tree
+
+# milliseconds between two frames, the layout settles one step per frame
+FRAME_INTERVAL = 200
+# frames between two reads of the link-state database
+POLL_FRAMES = 5
+# past this many changed items a frame redraws everything
+MAX_DIRTY = 2000
+# hostnames are only drawn for networks this small
+MAX_LABELS = 100
+MARGIN = 20
+RADIUS = 4
+
+
+class TopologyPanel(wx.Panel):
+    """
+    the graph of the link-state database, drawn into a bitmap kept between
+    frames
+
+    the positions come from a GraphLayout reused across updates, each
+    update only clears and redraws the areas around the routers and links
+    that changed, the links of this router's shortest path tree are drawn
+    thicker
+    """
+
+    def __init__(self, parent, hostname):
+        wx.Panel.__init__(self, parent)
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.hostname = hostname
+        self.layout = GraphLayout()
+        # links of the shortest path tree
+        self.tree = set()
+        self._buffer = None
+        self._background = wx.Brush(wx.Colour(255, 255, 255))
+        self._link_pen = wx.Pen(wx.Colour(200, 200, 200), 1)
+        self._tree_pen = wx.Pen(wx.Colour(30, 110, 220), 3)
+        self._router_brush = wx.Brush(wx.Colour(60, 60, 60))
+        self._self_brush = wx.Brush(wx.Colour(220, 40, 40))
+        self.Bind(wx.EVT_PAINT, self._paint_handler)
+        self.Bind(wx.EVT_SIZE, self._size_handler)
+
+    def update(self, link_state):
+        """
+        Args:
+            link_state: {hostname: {neighbor: cost}}
+        """
+        old = dict(self.layout.positions)
+        nodes, edges = self.layout.update(link_state)
+        tree = shortest_path_tree(link_state, self.hostname)
+        edges |= tree ^ self.tree
+        self.tree = tree
+        self._redraw(old, nodes, edges)
+
+    def step(self):
+        """
+        let the layout settle one more step
+        """
+        if not self.layout.settling:
+            return
+        old = dict(self.layout.positions)
+        nodes = self.layout.step()
+        edges = {edge for edge in self.layout.edges
+                 if edge[0] in nodes or edge[1] in nodes}
+        self._redraw(old, nodes, edges)
+
+    def _redraw(self, old, nodes, edges):
+        """
+        Args:
+            old: positions before the change
+            nodes, edges: what changed
+        """
+        if self._buffer is None or len(nodes) + len(edges) > MAX_DIRTY:
+            self._draw()
+            return
+        region = wx.Region()
+        for positions in (old, self.layout.positions):
+            for hostname in nodes:
+                if hostname in positions:
+                    region.Union(self._node_rect(positions[hostname]))
+            for a, b in edges:
+                if a in positions and b in positions:
+                    region.Union(self._edge_rect(positions[a], positions[b]))
+        if not region.IsEmpty():
+            self._draw(region)
+
+    def _point(self, position):
+        width, height = self.GetClientSize()
+        return (MARGIN + int(position[0] * max(1, width - 2 * MARGIN)),
+                MARGIN + int(position[1] * max(1, height - 2 * MARGIN)))
+
+    def _node_rect(self, position):
+        x, y = self._point(position)
+        # room for the label on the right
+        return wx.Rect(x - RADIUS - 1, y - RADIUS - 1, 2 * RADIUS + 80,
+                       2 * RADIUS + 2)
+
+    def _edge_rect(self, a, b):
+        (x1, y1), (x2, y2) = self._point(a), self._point(b)
+        return wx.Rect(min(x1, x2) - 2, min(y1, y2) - 2,
+                       abs(x2 - x1) + 5, abs(y2 - y1) + 5)
+
+    def _draw(self, region=None):
+        """
+        draw what lies in `region` into the buffer, everything if None
+        """
+        width, height = self.GetClientSize()
+        if width <= 0 or height <= 0:
+            return
+        if self._buffer is None:
+            self._buffer = wx.Bitmap(width, height)
+            region = None
+        if region is None:
+            region = wx.Region(0, 0, width, height)
+
+        positions = self.layout.positions
+        dc = wx.MemoryDC(self._buffer)
+        dc.SetDeviceClippingRegion(region)
+        dc.SetBrush(self._background)
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        dc.DrawRectangle(0, 0, width, height)
+
+        # plain links first, the tree on top of them
+        for tree in (False, True):
+            dc.SetPen(self._tree_pen if tree else self._link_pen)
+            for edge in self.layout.edges:
+                if (edge in self.tree) != tree:
+                    continue
+                a, b = positions[edge[0]], positions[edge[1]]
+                if region.Contains(self._edge_rect(a, b)) != wx.OutRegion:
+                    dc.DrawLine(*(self._point(a) + self._point(b)))
+
+        labels = len(positions) <= MAX_LABELS
+        dc.SetPen(wx.TRANSPARENT_PEN)
+        for hostname, position in positions.items():
+            if region.Contains(self._node_rect(position)) == wx.OutRegion:
+                continue
+            x, y = self._point(position)
+            dc.SetBrush(self._self_brush if hostname == self.hostname
+                        else self._router_brush)
+            dc.DrawCircle(x, y, RADIUS)
+            if labels:
+                dc.DrawText(hostname, x + RADIUS + 2, y - RADIUS - 2)
+
+        dc.SelectObject(wx.NullBitmap)
+        self.RefreshRect(region.GetBox(), False)
+
+    def _paint_handler(self, _):
+        if self._buffer is None:
+            self._draw()
+        if self._buffer is None:
+            wx.PaintDC(self)
+            return
+        dc = wx.BufferedPaintDC(self, self._buffer)
+
+    def _size_handler(self, event):
+        # positions are relative, everything moves with the size
+        self._buffer = None
+        self.Refresh(False)
+        event.Skip()
+
+
+class TopologyFrame(wx.Frame):
+    """
+    live view of the network as this router's link-state database sees it
+    """
+
+    def __init__(self, parent):
+        self.router = manager.router
+        wx.Frame.__init__(self, parent, -1, size=(700, 600),
+                          title="Topology-{}".format(self.router.hostname))
+        self._link_state = None
+        self._frames = 0
+        self.init_UI()
+
+    def init_UI(self):
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        self.panel = TopologyPanel(self, self.router.hostname)
+        self.status_label = wx.StaticText(self, label="")
+        vbox.Add(self.panel, 1, wx.EXPAND)
+        vbox.Add(self.status_label, 0, wx.ALL | wx.EXPAND, 5)
+        self.SetSizer(vbox)
+
+        self.timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self._frame_handler, self.timer)
+        self.Bind(wx.EVT_CLOSE, self._close_handler)
+        self.timer.Start(FRAME_INTERVAL)
+        self._poll()
+        self.Center()
+
+    def _poll(self):
+        link_state = self.router.get_link_state()
+        if link_state == self._link_state:
+            return
+        self._link_state = link_state
+        self.panel.update(link_state)
+        if len(link_state) == 0:
+            self.status_label.SetLabel(
+                "No link-state database, the router runs distance vector")
+        else:
+            self.status_label.SetLabel("{} routers, {} links".format(
+                len(self.panel.layout.positions),
+                len(self.panel.layout.edges)))
+
+    def _frame_handler(self, _):
+        self._frames += 1
+        if self._frames % POLL_FRAMES == 0:
+            self._poll()
+        self.panel.step()
+
+    def _close_handler(self, event):
+        self.timer.Stop()
+        event.Skip()
@@ -0,0 +1,189 @@
+import struct
+import sys
+import threading
+import time
+from collections import namedtuple
+
+TRACE_CAPACITY = 512
+# large enough for the link-state and distance-vector frames of small
+# networks, so they can be replayed
+SNAP_LENGTH = 448
+
+SENT = 0
+RECEIVED = 1
+FORWARDED = 2
+DROPPED = 3
+DIRECTIONS = ('sent', 'received', 'forwarded', 'dropped')
+
+BROADCASTING = 1
+TRUNCATED = 2
+
+# frame types get a one byte code, their index, anything else is OTHER;
+# new types go at the end so traces already dumped keep decoding
+FRAME_TYPES = ('algorithm', 'neighbor', 'Message', 'Transport',
+               'Bulk', 'Multicast', 'Compression')
+OTHER = 255
+
+MAGIC = b'RTTRACE1'
+# magic, record size, snap length, number of records, hostname
+FILE_HEADER = struct.Struct('<8sHHI32s')
+# time, direction, flags, frame type, length of the whole frame,
+# src, dest, last hop, next hop, bytes captured
+RECORD_HEADER = struct.Struct('<dBBBxI16s16s16s16sH')
+
+Record = namedtuple('Record', [
+    'time', 'direction', 'broadcasting', 'truncated', 'type', 'length',
+    'src', 'dest', 'last_name', 'next_name', 'payload'])
+
+
+def _name(name):
+    return (name or '').encode()[:16]
+
+
+class FrameTrace:
+    """
+    fixed-size ring of binary records, one per frame sent, received,
+    forwarded or dropped by a transport
+
+    every record has the same size, the header fields plus the first
+    `snap_length` bytes of the encoded frame, so recording is a single
+    struct.pack_into in a preallocated buffer and the oldest records are
+    overwritten once the ring is full
+    """
+
+    def __init__(self, hostname, capacity=TRACE_CAPACITY,
+                 snap_length=SNAP_LENGTH, now=time.monotonic):
+        """
+        Args:
+            capacity: number of records kept, 0 disables the trace
+            snap_length: bytes of each frame kept, enough to replay it
+                         when the whole frame fits
+            now: callable returning a monotonic time in seconds
+        """
+        self.hostname = hostname
+        self.capacity = capacity
+        self.snap_length = snap_length
+        self.record_size = RECORD_HEADER.size + snap_length
+        self._now = now
+        self._buffer = bytearray(capacity * self.record_size)
+        # number of records written so far, the next goes at count % capacity
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def record(self, direction, frame, payload):
+        """
+        Args:
+            frame: the frame as a dict
+            payload(bytes): the frame as encoded on the wire
+        """
+        if self.capacity == 0:
+            return
+        datagram = frame['datagram']
+        frame_type = datagram['data'].get('type') \
+            if isinstance(datagram['data'], dict) else None
+        code = FRAME_TYPES.index(frame_type) \
+            if frame_type in FRAME_TYPES else OTHER
+        captured = payload[:self.snap_length]
+        flags = (BROADCASTING if frame.get('broadcasting') else 0) | \
+            (TRUNCATED if len(captured) < len(payload) else 0)
+
+        with self._lock:
+            offset = (self._count % self.capacity) * self.record_size
+            self._count += 1
+        RECORD_HEADER.pack_into(
+            self._buffer, offset, self._now(), direction, flags, code,
+            len(payload), _name(datagram.get('src')),
+            _name(datagram.get('dest')), _name(frame.get('last_name')),
+            _name(frame.get('next_name')), len(captured))
+        start = offset + RECORD_HEADER.size
+        self._buffer[start:start + len(captured)] = captured
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def snapshot(self):
+        """
+        Returns:
+            bytes: the records in the ring, oldest first
+        """
+        with self._lock:
+            count = self._count
+            buffer = bytes(self._buffer)
+        if count <= self.capacity:
+            return buffer[:count * self.record_size]
+        split = (count % self.capacity) * self.record_size
+        return buffer[split:] + buffer[:split]
+
+    def dump(self, path):
+        """
+        write the records in the ring to `path`, see `load`
+        """
+        records = self.snapshot()
+        with open(path, 'wb') as f:
+            f.write(FILE_HEADER.pack(
+                MAGIC, self.record_size, self.snap_length,
+                len(records) // self.record_size, self.hostname.encode()[:32]))
+            f.write(records)
+
+
+def load(path):
+    """
+    Returns:
+        (str, list<Record>): hostname of the trace and its records, oldest
+                             first
+    """
+    with open(path, 'rb') as f:
+        magic, record_size, snap_length, count, hostname = \
+            FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('{} is not a frame trace'.format(path))
+        records = []
+        for _ in range(count):
+            raw = f.read(record_size)
+            (t, direction, flags, code, length, src, dest, last_name,
+             next_name, captured) = RECORD_HEADER.unpack_from(raw)
+            start = RECORD_HEADER.size
+            records.append(Record(
+                time=t,
+                direction=DIRECTIONS[direction],
+                broadcasting=bool(flags & BROADCASTING),
+                truncated=bool(flags & TRUNCATED),
+                type=FRAME_TYPES[code] if code != OTHER else None,
+                length=length,
+                src=src.rstrip(b'\0').decode(),
+                dest=dest.rstrip(b'\0').decode(),
+                last_name=last_name.rstrip(b'\0').decode(),
+                next_name=next_name.rstrip(b'\0').decode(),
+                payload=raw[start:start + captured]))
+    return hostname.rstrip(b'\0').decode(), records
+
+
+def dump_on_crash(traces, path_of):
+    """
+    dump every trace when an exception goes unhandled, in the main thread
+    or in any other thread
+
+    Args:
+        traces: callable returning the traces to dump
+        path_of: callable(trace), the file to dump a trace to
+    """
+    def dump_all():
+        for trace in traces():
+            try:
+                trace.dump(path_of(trace))
+            except OSError:
+                pass
+
+    previous_hook = sys.excepthook
+    previous_thread_hook = threading.excepthook
+
+    def hook(*args):
+        dump_all()
+        previous_hook(*args)
+
+    def thread_hook(args):
+        dump_all()
+        previous_thread_hook(args)
+
+    sys.excepthook = hook
+    threading.excepthook = thread_hook
@@ -1,8 +1,31 @@
 from routing import parse
 import json
+import queue
 import threading
-import socket
+import time
 from .io import print_log
+from .backend import UDPBackend
+from .clock import RealClock
+from .resolver import Resolver
+from .hash_ring import HashRing
+from .impairment import LinkShaper
+from .trace import FrameTrace, TRACE_CAPACITY, SENT, RECEIVED, FORWARDED, DROPPED
+from .compression import Codec, COMPRESS_THRESHOLD
+from .dispatcher import ROUTING, BLOCK
+
+# seconds a silent hns cluster member is skipped in favor of its replica
+HNS_DOWN_TIME = 30
+# seconds the chunks of one hns push may take to arrive, a full resync is
+# asked for once they are over
+CHUNK_TIMEOUT = 5
+# broadcasts of a source more than this many sequence numbers behind its
+# latest one are taken for replays, those within are handled once each, in
+# whatever order they arrive
+BROADCAST_WINDOW = 1024
+# frames waiting for each forwarding worker, and seconds the listener waits
+# for room before dropping a frame
+FORWARD_QUEUE = 4096
+FORWARD_TIMEOUT = 1.0
 
 
 def log(message):
@@ -24,7 +47,10 @@ class Transport:
     TYPE = 'Transport'
 
     def __init__(self, name, ip, port, hns_ip, hns_port,
-                 routing_table, dispather, neighbor):
+                 routing_table, dispather, neighbor, resolve=True,
+                 backend=None, clock=None,
+                 trace_capacity=TRACE_CAPACITY,
+                 compress_threshold=COMPRESS_THRESHOLD, forward_workers=0):
         """Initialize
         Set the listen port and create a new thread to listen the port.
         Args:
@@ -34,11 +60,35 @@ class Transport:
           hns_ip, hns_port: hns' address,
                             data should be sent to (hns_ip, hns_port)
           routing_table, dispather, neighbor: dependcy module
+          resolve: whether to query hns for names missing in mapping table
+          backend: how datagrams are carried, see routing.backend,
+                   real udp sockets if None
+          clock: source of time and timers, see routing.clock
+          trace_capacity: frames kept in the trace, see routing.trace
+          compress_threshold: payloads larger than this many bytes are
+                              compressed for peers that agree, see
+                              routing.compression, None never compresses
+          forward_workers: threads routing and sending the frames received,
+                           each frame goes to the worker of its (src, dest)
+                           so a flow stays in order, 0 does it all on the
+                           listening thread, as a scheduled backend always
+                           does
         """
         self._name, self._address = name, (ip, port)
+        self._backend = backend if backend is not None else UDPBackend()
+        self._clock = clock if clock is not None else RealClock()
         self._hns_address = (hns_ip, hns_port)
         self._mapping_table = {'hns': self._hns_address}
         self._mapping_lock = threading.Lock()
+        # version of the mapping table of each hns the local table reflects
+        self._hns_version = {}
+        # chunks of the push being received from each hns, {hns: {'version',
+        # 'chunks': {index: entries}, 'timer'}}
+        self._hns_chunks = {}
+        # hash ring of hns cluster members, None if hns isn't sharded
+        self._hns_ring = None
+        # self._hns_down = {member: time until which it is skipped}
+        self._hns_down = {}
         self._debug = True
         self._run_lock = threading.Lock()
         self._running = False
@@ -46,18 +96,57 @@ class Transport:
         self._dispather = dispather
         self._neighbor = neighbor
         self._timer_thread = None
+        # broadcasts carry a per-source sequence number so each router
+        # handles and forwards one only once, it starts from the clock so a
+        # restarted router isn't taken for a replay
+        self._broadcast_seq = int(self._clock.time() * 1000)
+        # self._broadcast_seen = {src: [latest sequence number, {sequence
+        #                               numbers handled within the window}]}
+        self._broadcast_seen = {}
+        self._broadcast_lock = threading.Lock()
+        # last frames sent, received, forwarded and dropped, for post-mortem
+        self.trace = FrameTrace(
+            name, trace_capacity,
+            now=self._clock.time if self._clock.virtual else time.monotonic)
+        # delay queue of the links to impaired neighbors, see `impair`
+        self._shaper = LinkShaper(self._clock, self._backend.socket, seed=name)
+        # compression of the payloads sent, negotiated with each destination,
+        # None for a bare transport, as the hns uses, sending as it is
+        self.codec = Codec(name, self.send, routing_table.get_alive,
+                           dispather, compress_threshold, self._clock) \
+            if routing_table is not None and dispather is not None else None
+        self._resolver = Resolver(self._query_hns, self._send_by_frame,
+                                  on_timeout=self._hns_timeout,
+                                  clock=self._clock) \
+            if resolve else None
+        self._forward_workers = 0 if self._backend.scheduled \
+            else forward_workers
+        # one queue per forwarding worker, None while they don't run
+        self._shards = None
+        self.forward_drops = 0
 
     def run(self):
         """ Run this module
         """
-        self._dispather.register(Transport.TYPE, self)
+        self._dispather.register(Transport.TYPE, self, ROUTING, policy=BLOCK)
 
         self._run_lock.acquire()
         self._running = True
         self._run_lock.release()
 
-        self._thread_listen = threading.Thread(target=self._listen, args=())
-        self._thread_listen.start()
+        if self._backend.scheduled:
+            # the backend calls back on its own, no listening thread
+            self._endpoint = self._backend.listen(self._address,
+                                                  self._on_datagram)
+        else:
+            if self._forward_workers != 0:
+                self._shards = [queue.Queue(FORWARD_QUEUE)
+                                for _ in range(self._forward_workers)]
+                for shard in self._shards:
+                    threading.Thread(target=self._forward, args=(shard,),
+                                     daemon=True).start()
+            self._thread_listen = threading.Thread(target=self._listen, args=())
+            self._thread_listen.start()
 
         self._send_to_hns()
 
@@ -73,68 +162,296 @@ class Transport:
         }
 
         self.send(self._name, data, True)
+        if self._shards is not None:
+            for shard in self._shards:
+                shard.put(None)
+            self._shards = None
+        self._shaper.close()
         if self._timer_thread is not None:
             self._timer_thread.cancel()
             self._timer_thread = None
+        with self._mapping_lock:
+            for pending in self._hns_chunks.values():
+                pending['timer'].cancel()
+            self._hns_chunks = {}
 
     def _send_to_hns(self):
         """ Send to hns to register itself
         """
+        target = self._hns_for(self._name)
         data = {
             'type': Transport.TYPE,
             'data': {
-                self._name: self._address
+                'op': 'register',
+                'entries': {
+                    self._name: self._address
+                },
+                'version': self._hns_version.get(target, 0),
+                'failover': target != 'hns' and
+                            target != self._hns_ring.owner(self._name)
             }
         }
         if self._name not in self._mapping_table:
-            self.send('hns', data, True)
+            self.send(target, data, True)
 
         self._mapping_lock.acquire()
         if self._name not in self._mapping_table:
-            self._timer_thread = threading.Timer(10, self._send_to_hns)
-            self._timer_thread.start()
+            self._timer_thread = self._clock.call_later(10, self._send_to_hns)
         self._mapping_lock.release()
 
+    def _send_hns_request(self, target, op, **kwargs):
+        request = {'op': op}
+        request.update(kwargs)
+        self.send(target, {
+            'type': Transport.TYPE,
+            'data': request
+        }, True)
+
+    def _hns_for(self, name):
+        """ Get the hns to ask about `name`
+
+        In a cluster that is the member owning `name`, or its replica while
+        the owner doesn't answer.
+        """
+        if self._hns_ring is None:
+            return 'hns'
+        owners = self._hns_ring.owners(name)
+        now = self._clock.time()
+        for member in owners:
+            if self._hns_down.get(member, 0) < now:
+                return member
+        return owners[0]
+
+    def _query_hns(self, name):
+        self._send_hns_request(self._hns_for(name), 'query', name=name,
+                               address=self._address)
+
+    def _hns_timeout(self, name):
+        if self._hns_ring is not None:
+            member = self._hns_for(name)
+            info('hns member {} not answering'.format(member))
+            self._hns_down[member] = self._clock.time() + HNS_DOWN_TIME
 
     def receive(self, src, data):
         """ Receive hns data
           Args:
             data: {
-              'data': dict, a mapping table
+              'op': 'answer',
+              'name': str, the queried hostname
+              'address': (ip, port) or None if hns doesn't know the name
+              'ttl': int, seconds the answer stays valid
+            } or {
+              'op': 'update',
+              'base': int, version the entries are based on, 0 for full table
+              'version': int, version after applying the entries
+              'chunk': int, index of this part of the push
+              'chunks': int, number of parts the push is split into
+              'entries': dict, changed part of the mapping table
+            } or {
+              'op': 'shards',
+              'members': dict, {member: (ip, port)} of the hns cluster
             }
         """
         if data == 'stop':
             return
+        if data['op'] == 'answer':
+            if self._resolver is not None:
+                self._resolver.answer(data['name'], data['address'],
+                                      data['ttl'])
+            return
+        if data['op'] == 'shards':
+            self._mapping_lock.acquire()
+            for member in data['members']:
+                self._mapping_table[member] = tuple(data['members'][member])
+            self._hns_ring = HashRing(data['members'].keys())
+            self._mapping_lock.release()
+            info('hns cluster members: {}'.format(list(data['members'].keys())))
+            return
+
         mt = {}
-        for key in data:
-            mt[key] = (data[key][0], data[key][1])
+        for key in data['entries']:
+            mt[key] = (data['entries'][key][0], data['entries'][key][1])
+
         self._mapping_lock.acquire()
-        self._mapping_table.update(mt)
+        version = self._hns_version.get(src, 0)
+        if data['base'] > version:
+            # some pushes are lost, the delta can't be applied
+            self._drop_chunks(src)
+            self._mapping_lock.release()
+            info('mapping table gap: have version {}, update based on {}'.format(
+                version, data['base']))
+            self._send_hns_request(src, 'resync')
+            return
+        if data['version'] > version:
+            mt = self._assemble(src, data, mt)
+            if mt is None:
+                # the version is applied once every chunk is in
+                self._mapping_lock.release()
+                return
+            self._mapping_table.update(mt)
+            version = self._hns_version[src] = data['version']
         self._mapping_lock.release()
+
         info(str(mt))
+        self._send_hns_request(src, 'ack', version=version)
+        if self._resolver is not None:
+            self._resolver.answer_pending(mt)
+
+    def _assemble(self, src, data, entries):
+        """ Collect the chunks of a push from `src`, must be wrapped with
+        the mapping lock
+
+          Returns:
+            dict: entries of the whole push once its last chunk arrived,
+                  None before
+        """
+        count = data.get('chunks', 1)
+        pending = self._hns_chunks.get(src)
+        if pending is not None and data['version'] < pending['version']:
+            # a chunk of a push already superseded
+            return None
+        if count == 1:
+            self._drop_chunks(src)
+            return entries
+        if pending is None or data['version'] > pending['version']:
+            # hns only moves its base on acks, so a newer push carries every
+            # change of the one still missing chunks
+            self._drop_chunks(src)
+            pending = self._hns_chunks[src] = {
+                'version': data['version'],
+                'chunks': {},
+                'timer': self._clock.call_later(
+                    CHUNK_TIMEOUT, self._chunks_timeout, src, data['version'])
+            }
+        pending['chunks'][data['chunk']] = entries
+        if len(pending['chunks']) < count:
+            return None
+        self._drop_chunks(src)
+        mt = {}
+        for index in sorted(pending['chunks']):
+            mt.update(pending['chunks'][index])
+        return mt
+
+    def _drop_chunks(self, src):
+        """ Forget the chunks received from `src`, must be wrapped with the
+        mapping lock
+        """
+        pending = self._hns_chunks.pop(src, None)
+        if pending is not None:
+            pending['timer'].cancel()
+
+    def _chunks_timeout(self, src, version):
+        """ Ask for the full table when a push misses chunks for too long
+        """
+        with self._mapping_lock:
+            pending = self._hns_chunks.get(src)
+            if pending is None or pending['version'] != version:
+                return
+            self._hns_chunks.pop(src)
+            received = len(pending['chunks'])
+        info('push {} of {} incomplete, {} chunks received'.format(
+            version, src, received))
+        self._send_hns_request(src, 'resync')
+
+    def impair(self, neighbor, impairment):
+        """ Emulate a bad link to `neighbor`
+
+          Args:
+            impairment: routing.impairment.Impairment applied to every frame
+                        sent to `neighbor`, None to restore the link
+        """
+        self._shaper.set(neighbor, impairment)
+
+    def impairment_stats(self):
+        """ Counters of the impaired links, {neighbor: {...}}
+        """
+        return self._shaper.stats()
+
+    def compression_stats(self):
+        """ Payloads compressed and decompressed, see Codec.stats, None
+        without codec
+        """
+        return self.codec.stats() if self.codec is not None else None
+
+    def is_registered(self):
+        """ Whether hns has pushed back the entry of this host
+        """
+        with self._mapping_lock:
+            return self._name in self._mapping_table
+
+    def update_mapping(self, table):
+        """ Replace local mapping table
+
+          Args:
+            table: dict, {name: (ip, port)}
+        """
+        self._mapping_lock.acquire()
+        self._mapping_table = dict(table)
+        self._mapping_lock.release()
 
     def _listen(self):
         """ Start server
         Create a server socket and listen to specified address.
         """
         info('Server listenning at {} : {}'.format(self._address[0], self._address[1]))
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.bind(self._address)
+        s = self._backend.listen(self._address)
         while True:
             data, addr = s.recvfrom(10240)
-
-            self._run_lock.acquire()
-            if not self._running:
-                self._run_lock.release()
-                if self._debug:
-                    info('Stop...')
+            if not self._on_datagram(data, addr):
                 break
+        s.close()
+
+    def _on_datagram(self, data, addr):
+        """ Handle one received datagram
+
+          Returns:
+            bool: False if the module has stopped
+        """
+        self._run_lock.acquire()
+        if not self._running:
             self._run_lock.release()
+            if self._debug:
+                info('Stop...')
+            if self._backend.scheduled:
+                self._endpoint.close()
+            return False
+        self._run_lock.release()
 
-            info('Receive data')
-            data = parse.parse(data)
-            self._process(data)
-        s.close()
+        info('Receive data')
+        try:
+            frame = parse.parse(data)
+        except ValueError as err:
+            error('Drop malformed datagram from {}: {}'.format(addr, err))
+            return True
+        self.trace.record(RECEIVED, frame, data)
+        shards = self._shards
+        if shards is not None:
+            datagram = frame['datagram']
+            shard = shards[hash((datagram['src'], datagram['dest'])) %
+                           len(shards)]
+            try:
+                # waiting here leaves the next datagrams in the socket
+                # buffer, the kernel drops what doesn't fit
+                shard.put(frame, timeout=FORWARD_TIMEOUT)
+            except queue.Full:
+                self.forward_drops += 1
+                self.trace.record(DROPPED, frame, data)
+            return True
+        data = frame
+        self._process(data)
+        return True
+
+    def _forward(self, shard):
+        """ Process the frames of one shard, until a None
+        """
+        while True:
+            frame = shard.get()
+            if frame is None:
+                return
+            try:
+                self._process(frame)
+            except Exception as err:
+                error('Fail to process a frame: {!r}'.format(err))
 
     def _process(self, data):
         """ Process data on transport layer
@@ -157,18 +474,27 @@ class Transport:
         """
         # broadcasting
         if data['broadcasting']:
+            if not self._first_copy(data):
+                return
             self.broadcasting({
                 'visited': data['visited'],
                 'src': data['datagram']['src'],
-                'data': data['datagram']['data']
+                'data': data['datagram']['data'],
+                'seq': data.get('seq')
             })
 
         # dispath to other module
         if data['datagram']['dest'] == self._name:
-
-            self._dispather.dispatch(data['datagram']['data']['type'],
+            # only the destination decompresses, routers on the way don't
+            payload = data['datagram']['data']
+            if self.codec is not None:
+                payload = self.codec.decode(data['datagram']['src'], payload)
+                if payload is None:
+                    return
+
+            self._dispather.dispatch(payload['type'],
                                      data['datagram']['src'],
-                                     data['datagram']['data']['data'])
+                                     payload['data'])
             if self._debug:
                 message = 'Receive data {} from path: '.format(data['datagram']['data'])
                 for host in data['datagram']['passed_by']:
@@ -198,6 +524,8 @@ class Transport:
           privileged_mode: if set True, it can send it to destination directly,
                             ignoring the next hop router
         """
+        if self.codec is not None:
+            data = self.codec.encode(destination, data, privileged_mode)
         # make a frame
         datagram = self._make_datagram(self._name, destination, data)
         frame = self._make_frame(destination, datagram, False, [], privileged_mode)
@@ -209,6 +537,32 @@ class Transport:
 
         self._send_by_frame(frame)
 
+    def send_many(self, items, privileged_mode=False, sock=None):
+        """ Send a batch of data through one socket
+
+        Args:
+          items: list of (destination, data) pairs, see `send`
+          privileged_mode: same as `send`, applied to every item
+          sock: an opened socket to send through, left open afterwards
+        """
+        s = sock if sock is not None else self._backend.socket()
+        try:
+            for destination, data in items:
+                if self.codec is not None:
+                    data = self.codec.encode(destination, data,
+                                             privileged_mode)
+                datagram = self._make_datagram(self._name, destination, data)
+                frame = self._make_frame(destination, datagram, False, [],
+                                         privileged_mode)
+                if frame is None:
+                    if self._debug:
+                        error('Fail to make a frame for {}, sending cancelled'.format(data))
+                    continue
+                self._send_by_frame(frame, s)
+        finally:
+            if sock is None:
+                s.close()
+
     def _route(self, datagram):
         """ Route the data to destination
         Args:
@@ -232,27 +586,47 @@ class Transport:
 
         self._send_by_frame(frame)
 
-    def _send_by_frame(self, frame):
+    def _send_by_frame(self, frame, sock=None):
         """ Send a frame to destination
           Args:
             frame: frame, including destination
+            sock: an opened socket to reuse, a new one is created if None
         """
         # get sending address
         sending_address = self._get_address(frame['next_name'])
 
+        if sending_address is None and self._resolver is not None:
+            # held until hns answers, sent by the resolver afterwards
+            if self._resolver.hold(frame['next_name'], frame):
+                return
+
+        payload = json.dumps(frame).encode()
         if sending_address is None:
+            self.trace.record(DROPPED, frame, payload)
             if self._debug:
                 error('{} not in mapping_table, canceling sending'.format(
                     frame['next_name']))
             return
 
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.sendto(json.dumps(frame).encode(), sending_address)
+        if self._shaper.impaired(frame['next_name']):
+            if not self._shaper.send(frame['next_name'], payload,
+                                     sending_address):
+                # lost on the emulated link
+                self.trace.record(DROPPED, frame, payload)
+                return
+            s = None
+        else:
+            s = sock if sock is not None else self._backend.socket()
+            s.sendto(payload, sending_address)
+        self.trace.record(
+            SENT if frame['datagram']['src'] == self._name else FORWARDED,
+            frame, payload)
         if self._debug:
             info('Sending {1} to {0}'.format(
                 frame['next_name'], frame['datagram']['data']))
 
-        s.close()
+        if sock is None and s is not None:
+            s.close()
 
     def broadcasting(self, data):
         """ Send to all neighbors
@@ -261,24 +635,64 @@ class Transport:
               'type': ...,        or          'visited': list,
                                               'src': str, source hostname
               'data': ...                     'data': data same as left data
-            }                                }
+            }                                 'seq': sequence number of src
+                                             }
         """
-        src = data['src'] if 'src' in data.keys() else self._name
-        visited = data['visited'] if 'visited' in data.keys() else []
-        data = data['data'] if 'src' in data.keys() else data
+        if 'src' in data.keys():
+            src, visited, seq = data['src'], data['visited'], data['seq']
+            data = data['data']
+        else:
+            src, visited = self._name, []
+            with self._broadcast_lock:
+                self._broadcast_seq += 1
+                seq = self._broadcast_seq
+                self._seen(self._name, seq)
 
         neighbors = list(self._neighbor.get().keys())
         for n in neighbors:
             if n not in visited:
                 frame = self._make_frame(n, self._make_datagram(src, n, data),
-                                         True, visited, False)
+                                         True, list(visited), False)
                 if frame is None:
                     if self._debug:
                         error('Fail to make a frame, canceling sending')
                     continue
+                if seq is not None:
+                    frame['seq'] = seq
 
                 self._send_by_frame(frame)
 
+    def _first_copy(self, frame):
+        """ Whether a broadcast frame wasn't handled before
+          Frames from routers that don't number their broadcasts always are
+        """
+        seq = frame.get('seq')
+        if seq is None:
+            return True
+        with self._broadcast_lock:
+            return self._seen(frame['datagram']['src'], seq)
+
+    def _seen(self, src, seq):
+        """ Record broadcast `seq` of `src`, must be wrapped with the
+        broadcast lock
+
+          Returns:
+            bool: False if it was handled before or is older than the window
+        """
+        seen = self._broadcast_seen.get(src)
+        if seen is None:
+            self._broadcast_seen[src] = [seq, {seq}]
+            return True
+        latest, window = seen
+        if seq <= latest - BROADCAST_WINDOW or seq in window:
+            return False
+        window.add(seq)
+        if seq > latest:
+            seen[0] = seq
+            if len(window) > 2 * BROADCAST_WINDOW:
+                seen[1] = {n for n in window if n > seq - BROADCAST_WINDOW}
+        return True
+
     def _make_datagram(self, src, dest, data):
         """ Make a datagram, which just like an ip datagram
           Args:
@@ -349,11 +763,10 @@ class Transport:
             address: (ip, port) or None
         """
         self._mapping_lock.acquire()
-        try:
-            address = self._mapping_table[dest]
-        except Exception as err:
-            address = None
-            log(err)
+        address = self._mapping_table.get(dest)
         self._mapping_lock.release()
 
+        if address is None and self._resolver is not None:
+            address = self._resolver.get(dest)
+
         return address
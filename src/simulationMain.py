@@ -0,0 +1,49 @@
+import argparse
+import json
+import os
+import time
+from routing import io, topology
+from routing.harness import Harness
+from routing.clock import VirtualClock
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run a whole topology headless in one process')
+    parser.add_argument('topology', type=str,
+                        help='json file describing routers and links')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='seconds to wait for convergence')
+    parser.add_argument('--verbose', action='store_true',
+                        help='print the logs of every router')
+    parser.add_argument('--virtual', action='store_true',
+                        help='run on a virtual clock, timeout and '
+                             'convergence time are then virtual seconds')
+    args = parser.parse_args()
+
+    io.set_quiet(not args.verbose)
+    harness = Harness(topology.load(args.topology),
+                      clock=VirtualClock() if args.virtual else None)
+
+    start = time.time()
+    harness.build()
+    harness.start()
+    started = time.time() - start
+    converged = harness.wait_converged(args.timeout)
+
+    print(json.dumps({
+        'routers': len(harness.routers),
+        'algorithm': harness.topology.algorithm,
+        'startup_time': started,
+        'convergence_time': converged,
+        'unconverged': len(harness.unconverged()),
+        'datagrams': harness.network.stats['datagrams'],
+        'bytes': harness.network.stats['bytes'],
+        'virtual': args.virtual
+    }, indent=2))
+    # timers of the algorithms keep rescheduling themselves
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
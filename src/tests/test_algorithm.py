@@ -0,0 +1,55 @@
+import copy
+import unittest
+from routing import io
+from routing.algorithm import LS, CentralizedController
+from routing.clock import VirtualClock
+from routing.dispatcher import DataDispatcher
+from routing.neighbor_table import NeighborTable
+from routing.routing_table import RoutingTable
+
+
+def make(cls, neighbor=None):
+    neighbor = neighbor if neighbor is not None else NeighborTable()
+    return cls('A', None, RoutingTable('A'), neighbor,
+               DataDispatcher(threaded=False), clock=VirtualClock())
+
+
+class ControllerTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+
+    def test_published_database_is_never_changed(self):
+        controller = make(CentralizedController)
+        controller.receive('B', {'neighbor': {'C': 1}})
+        published = controller._link_state
+        before = copy.deepcopy(published)
+        controller.receive_batch([('C', {'neighbor': {'B': 1, 'D': 2}}),
+                                  ('D', {'neighbor': {'C': 2}})])
+        self.assertEqual(published, before)
+        self.assertEqual(controller.get_link_state(), {
+            'B': {'C': 1}, 'C': {'B': 1, 'D': 2}, 'D': {'C': 2}})
+
+
+class PublishTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+
+    def test_neighbor_cost_changed_during_spf(self):
+        neighbor = NeighborTable()
+        neighbor.update('B', 1)
+        ls = make(LS, neighbor)
+        dijkstra = ls._dijkstra
+
+        def slow_dijkstra(link_state):
+            prev_table = dijkstra(link_state)
+            # the link to B gets worse while the tree is computed
+            neighbor.update('B', 5)
+            return prev_table
+        ls._dijkstra = slow_dijkstra
+        ls.receive('B', {'source': 'B', 'neighbor': {'A': 1},
+                         'alive': {'B': 0}})
+        self.assertEqual(ls._routing_table['B'], {'next': 'B', 'cost': 5})
+
+
+if __name__ == '__main__':
+    unittest.main()
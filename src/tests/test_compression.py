@@ -0,0 +1,45 @@
+import json
+import unittest
+from routing import io
+from routing.clock import VirtualClock
+from routing.compression import Codec
+from routing.dispatcher import DataDispatcher
+
+
+class DictionaryTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+        self.hostnames = ['router-{:05d}'.format(i) for i in range(5000)]
+        self.sent = {'A': [], 'B': []}
+        self.codecs = {
+            name: Codec(name, self.sender(name), lambda: self.hostnames,
+                        DataDispatcher(threaded=False), clock=VirtualClock())
+            for name in ('A', 'B')}
+
+    def sender(self, name):
+        return lambda destination, data, privileged_mode: \
+            self.sent[name].append((destination, data))
+
+    def test_large_host_list_fits_a_datagram(self):
+        a, b = self.codecs['A'], self.codecs['B']
+        a.receive('B', {'op': 'hello', 'reply': False})
+        payload = {'type': 'algorithm', 'data': {
+            'neighbor': {hostname: 1 for hostname in self.hostnames}}}
+        a.encode('B', payload)
+        shipped = [data for _, data in self.sent['A']
+                   if data['data']['op'] == 'dict']
+        self.assertEqual(len(shipped), 1)
+        # the frame around it takes a few hundred bytes
+        self.assertLess(len(json.dumps(shipped[0]).encode()), 9216)
+
+        b.receive('A', shipped[0]['data'])
+        self.assertEqual(self.sent['B'][-1][1]['data'],
+                         {'op': 'dict_ack', 'id': shipped[0]['data']['id']})
+        a.receive('B', self.sent['B'][-1][1]['data'])
+        encoded = a.encode('B', payload)
+        self.assertEqual(encoded['dict'], shipped[0]['data']['id'])
+        self.assertEqual(b.decode('A', encoded), payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import threading
+import unittest
+from routing import io
+from routing.dispatcher import DataDispatcher, COALESCE, ROUTING
+
+
+class Receiver:
+    def __init__(self):
+        self.received = []
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def receive(self, src, data):
+        self.started.set()
+        self.release.wait(1)
+        self.received.append((src, data))
+
+
+class CoalesceTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+
+    def test_full_queue_drops_older_item_of_same_source(self):
+        receiver = Receiver()
+        d = DataDispatcher()
+        d.register('t', receiver, ROUTING, capacity=3, policy=COALESCE)
+        d.run()
+        # the worker holds the first item, the three next ones fill the queue
+        d.dispatch('t', 'A', 0)
+        receiver.started.wait(1)
+        for src, data in [('A', 1), ('B', 1), ('C', 1), ('A', 2)]:
+            self.assertTrue(d.dispatch('t', src, data))
+        with d._lock:
+            queued = list(d._queues['t'].items)
+        receiver.release.set()
+        d.stop()
+        self.assertEqual(queued, [('B', 1), ('C', 1), ('A', 2)])
+        self.assertEqual(d.stats()['t']['dropped'], 1)
+
+    def test_supersede_keeps_other_sources(self):
+        d = DataDispatcher()
+        d.register('t', Receiver(), ROUTING, capacity=3, policy=COALESCE)
+        queue = d._queues['t']
+        queue.items.extend([('A', 1), ('B', 1), ('C', 1)])
+        with d._lock:
+            self.assertTrue(d._supersede(queue, 'A'))
+            self.assertFalse(d._supersede(queue, 'D'))
+        self.assertEqual(list(queue.items), [('B', 1), ('C', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from routing import topology
+from routing.harness import converged
+
+
+def square():
+    # r0 reaches r2 through r1 or r3 at the same cost
+    return topology.Topology({
+        'algorithm': 'LS',
+        'routers': ['r0', 'r1', 'r2', 'r3'],
+        'links': [['r0', 'r1', 1], ['r1', 'r2', 1], ['r2', 'r3', 1],
+                  ['r3', 'r0', 1]]
+    })
+
+
+def table(routes):
+    return {destination: {'next': next_hop, 'cost': cost}
+            for destination, (next_hop, cost) in routes.items()}
+
+
+class ExpectedRoutesTest(unittest.TestCase):
+    def test_equal_cost_next_hops(self):
+        routes = square().expected_routes('r0')
+        self.assertEqual(routes['r2'], {'cost': 2, 'next': {'r1', 'r3'}})
+        self.assertEqual(routes['r1'], {'cost': 1, 'next': {'r1'}})
+        self.assertEqual(routes['r0'], {'cost': 0, 'next': {'r0'}})
+
+    def test_next_hop_is_checked(self):
+        topo = square()
+        topo.set_link('r0', 'r1', 2)
+        expected = topo.expected_routes('r0')
+        # the old next hop to r1 at the cost of the new shortest path
+        stale = table({'r0': ('r0', 0), 'r1': ('r1', 2), 'r2': ('r1', 2),
+                       'r3': ('r3', 1)})
+        self.assertFalse(converged(expected, stale))
+        right = table({'r0': ('r0', 0), 'r1': ('r1', 2), 'r2': ('r3', 2),
+                       'r3': ('r3', 1)})
+        self.assertTrue(converged(expected, right))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import socket
+import time
+import unittest
+from routing import hns, io
+
+
+class BatchingHNSTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+        self.server = hns.BatchingHNS('127.0.0.1', 18888)
+        self.server._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server._socket.bind(('127.0.0.1', 0))
+        self.server._socket.setblocking(False)
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.server._socket.close()
+        self.client.close()
+
+    def request(self, request):
+        self.client.sendto(json.dumps({'datagram': {
+            'src': 'host0', 'data': {'data': request}}}).encode(),
+            self.server._socket.getsockname())
+
+    def test_incomplete_register_is_dropped(self):
+        self.request({'op': 'register', 'entries': {}})
+        self.request({'op': 'register', 'version': 0,
+                      'entries': {'host0': ['127.0.0.1', 20000]}})
+        time.sleep(0.05)
+        self.server._drain()
+        self.assertEqual(self.server.stats['received'], 2)
+        self.assertEqual(len(self.server._batch), 1)
+
+    def test_full_send_buffer_drops_datagram(self):
+        server = self.server
+
+        class Full:
+            def fileno(self):
+                return server._socket.fileno()
+
+            def sendto(self, payload, address):
+                raise BlockingIOError()
+
+        sender = hns._Sender(Full(), timeout=0.01)
+        self.assertEqual(sender.sendto(b'x', ('127.0.0.1', 1)), 0)
+
+
+class HNSTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+        self.server = hns.HNS('127.0.0.1', 18888)
+
+    def response(self, request):
+        self.server._response(json.dumps({'datagram': {
+            'src': 'host0', 'data': {'data': request}}}))
+
+    def test_malformed_requests_are_dropped(self):
+        for request in [{'op': 'register', 'entries': {}},
+                        {'op': 'register', 'version': 0},
+                        {'version': 1},
+                        {'op': 'ack'},
+                        {'op': 'ack', 'version': 'latest'},
+                        {'op': 'query'},
+                        {'op': 'replicate'},
+                        'register']:
+            with self.subTest(request=request):
+                self.response(request)
+        self.assertEqual(self.server._mapping_table,
+                         {'hns': ('127.0.0.1', 18888)})
+        self.assertEqual(self.server._acked, {})
+
+    def test_request_after_malformed_one(self):
+        self.response({'op': 'ack'})
+        self.response({'op': 'ack', 'version': 3})
+        self.assertEqual(self.server._acked, {'host0': 3})
+
+
+if __name__ == '__main__':
+    unittest.main()
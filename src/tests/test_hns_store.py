@@ -0,0 +1,64 @@
+import tempfile
+import unittest
+from routing.hns_store import MappingStore
+
+
+class MappingStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def store(self):
+        return MappingStore(self.directory.name)
+
+    def test_torn_tail_then_appends(self):
+        store = self.store()
+        store.load()
+        store.append(1, 'a', ('127.0.0.1', 1))
+        store.append(2, 'b', ('127.0.0.1', 2))
+        # a crash in the middle of writing c
+        store._log.write('[3, "c", "127.0.')
+        store._log.flush()
+        store._log.close()
+
+        store = self.store()
+        table, version, _ = store.load()
+        self.assertEqual(sorted(table), ['a', 'b'])
+        self.assertEqual(version, 2)
+        store.append(3, 'd', ('127.0.0.1', 4))
+        store.append(4, 'e', ('127.0.0.1', 5))
+        store._log.close()
+
+        table, version, changed = self.store().load()
+        self.assertEqual(sorted(table), ['a', 'b', 'd', 'e'])
+        self.assertEqual(table['e'], ('127.0.0.1', 5))
+        self.assertEqual(version, 4)
+        self.assertEqual(changed['d'], 3)
+
+    def test_record_torn_before_end_of_line(self):
+        store = self.store()
+        store.load()
+        store.append(1, 'a', ('127.0.0.1', 1))
+        store._log.write('[2, "b", "127.0.0.1", 2]')
+        store._log.close()
+
+        store = self.store()
+        self.assertEqual(sorted(store.load()[0]), ['a'])
+        store.append(2, 'c', ('127.0.0.1', 3))
+        store._log.close()
+        self.assertEqual(sorted(self.store().load()[0]), ['a', 'c'])
+
+    def test_compact_then_reload(self):
+        store = self.store()
+        store.load()
+        store.append(1, 'a', ('127.0.0.1', 1))
+        store.compact({'a': ('127.0.0.1', 1)}, 1, {'a': 1})
+        store.append(2, 'b', ('127.0.0.1', 2))
+        store._log.close()
+        table, version, _ = self.store().load()
+        self.assertEqual(sorted(table), ['a', 'b'])
+        self.assertEqual(version, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import json
+import os
+import tempfile
+import unittest
+from routing import trace
+from routing.bulk import Bulk
+from routing.compression import Codec
+from routing.multicast import Multicast
+from routing.trace import FrameTrace, SENT
+
+
+def frame_of(frame_type):
+    return {
+        'next_name': 'B',
+        'last_name': 'A',
+        'broadcasting': False,
+        'visited': [],
+        'datagram': {
+            'src': 'A',
+            'dest': 'C',
+            'passed_by': ['A'],
+            'data': {'type': frame_type, 'data': {'op': 'test'}}
+        }
+    }
+
+
+class FrameTypesTest(unittest.TestCase):
+    def test_existing_codes_are_kept(self):
+        self.assertEqual(trace.FRAME_TYPES[:4],
+                         ('algorithm', 'neighbor', 'Message', 'Transport'))
+
+    def test_new_types_round_trip(self):
+        for frame_type in (Bulk.TYPE, Multicast.TYPE, Codec.TYPE):
+            with self.subTest(frame_type=frame_type):
+                frame = frame_of(frame_type)
+                payload = json.dumps(frame).encode()
+                frames = FrameTrace('A', capacity=4)
+                frames.record(SENT, frame, payload)
+                with tempfile.TemporaryDirectory() as directory:
+                    path = os.path.join(directory, 'A.trace')
+                    frames.dump(path)
+                    hostname, records = trace.load(path)
+                self.assertEqual(hostname, 'A')
+                self.assertEqual(len(records), 1)
+                self.assertEqual(records[0].type, frame_type)
+                self.assertEqual(records[0].payload, payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import unittest
+from routing import hns, io, transport
+from routing.backend import MemoryNetwork
+from routing.clock import VirtualClock
+from routing.dispatcher import DataDispatcher
+from routing.transport import Transport
+
+
+class HNSTransportTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+
+    def test_hns_transport_has_no_codec(self):
+        server = hns.HNS('127.0.0.1', 18888)
+        self.assertIsNone(server._transport_module.codec)
+        self.assertIsNone(server._transport_module.compression_stats())
+
+    def test_bare_transport_sends_uncompressed(self):
+        network = MemoryNetwork()
+        host = Transport('host0', '127.0.0.1', 20000, '127.0.0.1', 18888,
+                         None, DataDispatcher(), None, resolve=False,
+                         backend=network.backend())
+        sink = network.bind(('127.0.0.1', 18888))
+        host.update_mapping({'hns': ('127.0.0.1', 18888)})
+        data = {'type': Transport.TYPE,
+                'data': {'op': 'register', 'entries': {
+                    'host{}'.format(i): ['127.0.0.1', i]
+                    for i in range(100)}}}
+        host.send_many([('hns', data)], True)
+        payload, _ = sink.get(timeout=1)
+        frame = json.loads(payload.decode())
+        self.assertEqual(frame['datagram']['data'], data)
+
+
+class ChunkedUpdateTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+        self.clock = VirtualClock()
+        self.host = Transport('host0', '127.0.0.1', 20000, '127.0.0.1', 18888,
+                              None, DataDispatcher(), None, resolve=False,
+                              backend=MemoryNetwork().backend(),
+                              clock=self.clock)
+        self.requests = []
+        self.host._send_hns_request = \
+            lambda target, op, **kwargs: self.requests.append((op, kwargs))
+
+    def push(self, count):
+        server = hns.HNS('127.0.0.1', 18888)
+        with server._mapping_lock:
+            server._merge({'host{}'.format(i): ('127.0.0.1', 30000 + i)
+                           for i in range(count)})
+            server._acked['host0'] = 0
+            return server._make_update('host0')
+
+    def test_chunks_are_numbered(self):
+        updates = self.push(2 * hns.MAX_PUSH_ENTRIES + 1)
+        self.assertEqual([(u['chunk'], u['chunks']) for u in updates],
+                         [(0, 3), (1, 3), (2, 3)])
+
+    def test_version_acked_after_every_chunk(self):
+        updates = self.push(2 * hns.MAX_PUSH_ENTRIES + 1)
+        for update in updates[:-1]:
+            self.host.receive('hns', update)
+        self.assertEqual(self.requests, [])
+        self.assertNotIn('host0', self.host._mapping_table)
+        self.host.receive('hns', updates[-1])
+        self.assertEqual(self.requests,
+                         [('ack', {'version': updates[0]['version']})])
+        self.assertIn('host200', self.host._mapping_table)
+
+    def test_lost_chunk_asks_for_resync(self):
+        updates = self.push(2 * hns.MAX_PUSH_ENTRIES + 1)
+        self.host.receive('hns', updates[0])
+        self.host.receive('hns', updates[2])
+        self.clock.run_until(transport.CHUNK_TIMEOUT + 1)
+        self.assertEqual(self.requests, [('resync', {})])
+        self.assertNotIn('host0', self.host._mapping_table)
+
+
+class BroadcastDedupTest(unittest.TestCase):
+    def setUp(self):
+        io.set_quiet(True)
+        self.host = Transport('host0', '127.0.0.1', 20000, '127.0.0.1', 18888,
+                              None, DataDispatcher(), None, resolve=False,
+                              backend=MemoryNetwork().backend())
+
+    def first(self, src, seq):
+        return self.host._first_copy({'seq': seq, 'datagram': {'src': src}})
+
+    def test_older_broadcast_after_newer_one(self):
+        self.assertTrue(self.first('A', 10))
+        # a multicast membership flood overtaken by a link-state advert
+        self.assertTrue(self.first('A', 9))
+        self.assertFalse(self.first('A', 9))
+        self.assertFalse(self.first('A', 10))
+        self.assertTrue(self.first('B', 9))
+
+    def test_broadcast_older_than_window(self):
+        self.assertTrue(self.first('A', transport.BROADCAST_WINDOW + 10))
+        self.assertFalse(self.first('A', 10))
+        self.assertTrue(self.first('A', 11))
+
+    def test_window_is_pruned(self):
+        for seq in range(5 * transport.BROADCAST_WINDOW):
+            self.assertTrue(self.first('A', seq))
+        self.assertLessEqual(len(self.host._broadcast_seen['A'][1]),
+                             2 * transport.BROADCAST_WINDOW)
+
+
+if __name__ == '__main__':
+    unittest.main()